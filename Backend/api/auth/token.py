@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from api.dependency.basic_auth import BasicAuthRoute, Principal, get_current_user
+from database.model import User
+from database.util import DBUtil
+from schema.response import ResponseStatus, StatusResponse, Token
+
+
+def CreateTokenEndpoint(
+    app: FastAPI,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    db_util: DBUtil,
+):
+    router = APIRouter(
+        route_class=BasicAuthRoute(sessionmaker, db_util)
+    )
+    @router.post(
+        path="/auth/token",
+        summary="exchange basic credentials for a bearer token",
+        description="exchange basic credentials for a short-lived bearer token",
+        tags=["auth"],
+    )
+    async def token(
+        user: Principal = Depends(get_current_user),
+    ) -> Token:
+        # a token must not be able to extend itself
+        if user.scheme != "basic":
+            raise HTTPException(status_code=403, detail="tokens are only issued for basic credentials")
+
+        epoch = db_util.tokens.known_epoch(user.id)
+        if epoch is None:
+            async with sessionmaker() as session:
+                epoch = (await session.execute(
+                    select(User.token_epoch).where(User.id == user.id)
+                )).scalar_one()
+            db_util.tokens.remember_epoch(user.id, epoch)
+
+        access_token, expires_at = db_util.tokens.issue(user.id, user.name, epoch)
+
+        return Token(
+            access_token=access_token,
+            token_type="bearer",
+            expires_at=expires_at,
+        )
+
+    @router.post(
+        path="/auth/revoke",
+        summary="revoke all bearer tokens",
+        description="revoke all bearer tokens of the user",
+        tags=["auth"],
+    )
+    async def revoke(
+        user: Principal = Depends(get_current_user),
+    ) -> StatusResponse:
+        async with sessionmaker() as session:
+            epoch = (await session.execute(
+                update(User).where(
+                    User.id == user.id
+                ).values(
+                    token_epoch=User.token_epoch + 1
+                ).returning(User.token_epoch)
+            )).scalar_one()
+            await session.commit()
+
+        db_util.tokens.remember_epoch(user.id, epoch)
+
+        return StatusResponse(
+            status=ResponseStatus.OK,
+            details="tokens revoked"
+        )
+
+    app.include_router(router)
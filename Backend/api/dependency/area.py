@@ -0,0 +1,46 @@
+from typing import Optional, Union
+
+from fastapi import HTTPException, Query
+
+from database.geo import BoundingBox, Circle
+
+Area = Union[BoundingBox, Circle]
+
+
+def get_area(
+    # bounding box
+    min_latitude: Optional[float] = Query(default=None, ge=-90.0, le=90.0),
+    min_longitude: Optional[float] = Query(default=None, ge=-180.0, le=180.0),
+    max_latitude: Optional[float] = Query(default=None, ge=-90.0, le=90.0),
+    max_longitude: Optional[float] = Query(default=None, ge=-180.0, le=180.0),
+
+    # radius in meters around a point
+    latitude: Optional[float] = Query(default=None, ge=-90.0, le=90.0),
+    longitude: Optional[float] = Query(default=None, ge=-180.0, le=180.0),
+    radius: Optional[float] = Query(default=None, gt=0.0),
+) -> Optional[Area]:
+    box = (min_latitude, min_longitude, max_latitude, max_longitude)
+    circle = (latitude, longitude, radius)
+
+    has_box = any(value is not None for value in box)
+    has_circle = any(value is not None for value in circle)
+
+    if has_box and has_circle:
+        raise HTTPException(status_code=400, detail="bounding box and radius can not be combined")
+
+    if has_box:
+        if any(value is None for value in box):
+            raise HTTPException(
+                status_code=400,
+                detail="bounding box needs min_latitude, min_longitude, max_latitude and max_longitude",
+            )
+        if min_latitude > max_latitude or min_longitude > max_longitude:
+            raise HTTPException(status_code=400, detail="bounding box minimum exceeds its maximum")
+        return BoundingBox(min_latitude, min_longitude, max_latitude, max_longitude)
+
+    if has_circle:
+        if any(value is None for value in circle):
+            raise HTTPException(status_code=400, detail="radius needs latitude, longitude and radius")
+        return Circle(latitude, longitude, radius)
+
+    return None
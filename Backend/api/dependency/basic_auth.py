@@ -1,11 +1,17 @@
 import base64
 import secrets
-from typing import Callable, Type
+from dataclasses import dataclass
+from typing import Callable, Optional, Type
 
 from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.params import Depends
 from fastapi.routing import APIRoute
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.security import (
+    HTTPAuthorizationCredentials,
+    HTTPBasic,
+    HTTPBasicCredentials,
+    HTTPBearer,
+)
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
@@ -15,17 +21,103 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.orm.exc import NoResultFound
 
+from database.loading import LoadProfile, load_options
 from database.model import User
+from database.token import InvalidTokenError
 from database.util import DBUtil
 
-security = HTTPBasic()
+security = HTTPBasic(auto_error=False)
+bearer_security = HTTPBearer(auto_error=False)
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    name: str
+    scheme: str = "basic"
+
+def get_current_user(
+    request: Request,
+    # declared for the openapi docs, checked by BasicAuthRoute
+    _basic: Optional[HTTPBasicCredentials] = Depends(security),
+    _bearer: Optional[HTTPAuthorizationCredentials] = Depends(bearer_security),
+) -> Principal:
+    # set by BasicAuthRoute
+    principal = getattr(request.state, "principal", None)
+    if principal is None:
+        raise HTTPException(status_code=401, detail="UNAUTORIZED")
+    return principal
 
 def get_current_username(
-    credentials: HTTPBasicCredentials = Depends(security),
+    user: Principal = Depends(get_current_user),
 ) -> str:
-    return credentials.username
+    return user.name
 
 def BasicAuthRoute(sessionmaker: async_sessionmaker[AsyncSession], db_util:DBUtil) -> Type[APIRoute]:
+
+    async def authenticate_basic(credentials: str) -> Principal:
+        #read credentials
+        try:
+            username, _, password = base64.b64decode(credentials).decode("utf-8").partition(":")
+        except Exception as e:
+            raise HTTPException(status_code=401, detail="UNAUTORIZED") from e
+
+        #verified recently
+        cached = db_util.credential_cache.get(username, password)
+        if cached is not None:
+            return Principal(id=cached.user_id, name=cached.username)
+
+        password_hash = await db_util.hash(password)
+
+        async with sessionmaker() as session:
+
+            #read db
+            try:
+                user = (await session.execute(
+                    select(User).where(
+                        User.name == username
+                    ).options(*load_options(LoadProfile.AUTH))
+                )).scalar_one()
+                user_id = user.id
+                correct_username = user.name
+                correct_password = user.password_hash
+            
+            except NoResultFound as e:
+                user_id = None
+                correct_username = ""
+                correct_password = ""
+            
+            #compare
+            is_correct_username = secrets.compare_digest(username, correct_username)
+            is_correct_password = secrets.compare_digest(password_hash, correct_password)
+            
+            if not (is_correct_username and is_correct_password):
+                raise HTTPException(status_code=401, detail="UNAUTORIZED")
+
+        db_util.credential_cache.put(username, password, user_id)
+        return Principal(id=user_id, name=username)
+
+    async def authenticate_bearer(token: str) -> Principal:
+        try:
+            claims = db_util.tokens.verify(token)
+        except InvalidTokenError as e:
+            raise HTTPException(status_code=401, detail="UNAUTORIZED") from e
+
+        #revocation
+        epoch = db_util.tokens.known_epoch(claims.user_id)
+        if epoch is None:
+            async with sessionmaker() as session:
+                try:
+                    epoch = (await session.execute(
+                        select(User.token_epoch).where(User.id == claims.user_id)
+                    )).scalar_one()
+                except NoResultFound as e:
+                    raise HTTPException(status_code=401, detail="UNAUTORIZED") from e
+            db_util.tokens.remember_epoch(claims.user_id, epoch)
+
+        if claims.epoch != epoch:
+            raise HTTPException(status_code=401, detail="UNAUTORIZED")
+
+        return Principal(id=claims.user_id, name=claims.username, scheme="bearer")
     
     class _BasicAuthRoute(APIRoute):
         def get_route_handler(self) -> Callable:
@@ -33,42 +125,23 @@ def BasicAuthRoute(sessionmaker: async_sessionmaker[AsyncSession], db_util:DBUti
             original_route_handler = super().get_route_handler()
 
             async def custom_route_handler(request: Request) -> Response:
-                async with sessionmaker() as session:
-                    
-                    #get credentials
-                    header = request.headers.get("Authorization", "")
-
-                    try:
-                        scheme, credentials = header.strip().split(" ")
-                    except Exception as e:
-                        raise HTTPException(status_code=401, detail="UNAUTORIZED") from e
-
-                    if scheme.lower() != "basic":
-                        raise HTTPException(status_code=401, detail="UNAUTORIZED")
-
-                    #read credentials
-                    username, _, password = base64.b64decode(credentials).decode("utf-8").partition(":")
-                    password = db_util.hash_func(password)
-
-                    #read db
-                    try:
-                        user = (await session.execute(select(User).where(User.name == username))).scalar_one()
-                        correct_username = user.name
-                        correct_password = user.password_hash
-                    
-                    except NoResultFound as e:
-                        correct_username = ""
-                        correct_password = ""
-                    
-                    #compare
-                    is_correct_username = secrets.compare_digest(username, correct_username)
-                    is_correct_password = secrets.compare_digest(password, correct_password)
-                    
-                    if not (is_correct_username and is_correct_password):
-                        raise HTTPException(status_code=401, detail="UNAUTORIZED")
+                #get credentials
+                header = request.headers.get("Authorization", "")
+
+                try:
+                    scheme, credentials = header.strip().split(" ")
+                except Exception as e:
+                    raise HTTPException(status_code=401, detail="UNAUTORIZED") from e
+
+                if scheme.lower() == "basic":
+                    request.state.principal = await authenticate_basic(credentials)
+                elif scheme.lower() == "bearer":
+                    request.state.principal = await authenticate_bearer(credentials)
+                else:
+                    raise HTTPException(status_code=401, detail="UNAUTORIZED")
                 
                 return await original_route_handler(request)
 
             return custom_route_handler
     
-    return _BasicAuthRoute
\ No newline at end of file
+    return _BasicAuthRoute
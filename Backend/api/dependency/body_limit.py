@@ -0,0 +1,49 @@
+from typing import Callable, Type
+
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from starlette.types import Message
+
+# multipart boundaries, part headers and small form fields next to the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def BodyLimitRoute(route_class: Type[APIRoute], max_body_size: int) -> Type[APIRoute]:
+    """
+    rejects request bodies larger than max_body_size with 413 before they are parsed
+
+    starlette spools a multipart body to disk before the endpoint runs, a limit
+    checked while saving the parsed file comes too late to protect the disk
+    """
+
+    def too_large() -> HTTPException:
+        return HTTPException(status_code=413, detail=f"request body larger than {max_body_size} bytes")
+
+    class _BodyLimitRoute(route_class):
+        def get_route_handler(self) -> Callable:
+
+            original_route_handler = super().get_route_handler()
+
+            async def custom_route_handler(request: Request) -> Response:
+                content_length = request.headers.get("content-length")
+                if content_length is not None and content_length.isdigit() and int(content_length) > max_body_size:
+                    raise too_large()
+
+                # chunked bodies or a wrong content-length, counted while they arrive
+                received = 0
+                receive = request.receive
+
+                async def limited_receive() -> Message:
+                    nonlocal received
+                    message = await receive()
+                    if message["type"] == "http.request":
+                        received += len(message.get("body", b""))
+                        if received > max_body_size:
+                            raise too_large()
+                    return message
+
+                return await original_route_handler(Request(request.scope, limited_receive))
+
+            return custom_route_handler
+
+    return _BodyLimitRoute
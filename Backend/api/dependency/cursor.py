@@ -0,0 +1,40 @@
+import base64
+import datetime
+import enum
+import json
+from dataclasses import dataclass
+
+
+class InvalidCursorError(Exception):
+    pass
+
+
+class CursorDirection(str, enum.Enum):
+    NEXT = "n"
+    PREV = "p"
+
+
+@dataclass(frozen=True)
+class Cursor:
+    snap_time: datetime.datetime
+    id: int
+    direction: CursorDirection
+
+    def encode(self) -> str:
+        data = json.dumps(
+            {"t": self.snap_time.isoformat(), "i": self.id, "d": self.direction.value},
+            separators=(",", ":"),
+        ).encode("utf-8")
+        return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+    @classmethod
+    def decode(cls, token: str) -> "Cursor":
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            return cls(
+                snap_time=datetime.datetime.fromisoformat(data["t"]),
+                id=int(data["i"]),
+                direction=CursorDirection(data["d"]),
+            )
+        except Exception as e:
+            raise InvalidCursorError() from e
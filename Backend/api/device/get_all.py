@@ -0,0 +1,79 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from sqlalchemy import null, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import joinedload
+
+from api.dependency.area import Area, get_area
+from api.dependency.basic_auth import BasicAuthRoute, Principal, get_current_user
+from config.config import Config
+from database.geo import Circle
+from database.model import Device
+from database.query import device_area_filters, distance_to
+from database.util import DBUtil
+from schema import response
+
+
+def CreateGetAllDevicesEndpoint(
+    app: FastAPI,
+    config: Config,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    db_util: DBUtil,
+):
+    router = APIRouter(
+        route_class=BasicAuthRoute(sessionmaker, db_util)
+    )
+    @router.get(
+        path="/device/get-all",
+        summary="returns the devices in an area",
+        description="returns the devices with public locations inside a bounding box or radius, "
+                    "radius results are ordered by distance",
+        tags=["device"],
+    )
+    async def get_all_devices(
+        user: Principal = Depends(get_current_user),
+        area: Optional[Area] = Depends(get_area),
+        limit: Optional[int] = None,
+    ) -> List[response.Device]:
+        if area is None:
+            raise HTTPException(status_code=400, detail="bounding box or radius required")
+
+        if limit is None:
+            limit = config.pagination.default_page_size
+        if limit < 1:
+            raise HTTPException(status_code=400, detail="limit must be positive")
+        limit = min(limit, config.pagination.max_page_size)
+
+        if isinstance(area, Circle):
+            distance = distance_to(area.latitude, area.longitude)
+            query = select(Device, distance).order_by(distance, Device.id)
+        else:
+            query = select(Device, null()).order_by(Device.geohash, Device.id)
+
+        async with sessionmaker() as session:
+            rows = (await session.execute(
+                query.where(
+                    *device_area_filters(area)
+                ).options(
+                    joinedload(Device.owner)
+                ).limit(limit)
+            )).all()
+
+            return [
+                response.Device(
+                    device_info=response.DeviceInfo(
+                        id=device.id,
+                        name=device.name,
+                        longitude=device.longitude,
+                        latitude=device.latitude,
+                    ),
+                    user_info=response.UserInfo(
+                        id=device.owner.id,
+                        name=device.owner.name,
+                    ),
+                    distance=distance,
+                ) for device, distance in rows
+            ]
+
+    app.include_router(router)
@@ -15,8 +15,9 @@ from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
                                     async_sessionmaker, create_async_engine)
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 
-from api.dependency.basic_auth import BasicAuthRoute, get_current_username
+from api.dependency.basic_auth import BasicAuthRoute, Principal, get_current_user
 from config.config import Config
+from database.geo import geohash_or_none
 from database.model import (BirdSnap, BirdSnapImage, BirdSnapStatus, Device,
                             DeviceType, User)
 from database.util import DBUtil
@@ -50,14 +51,9 @@ def CreateRegisterDeviceEndpoint(
     )
     async def register(
         body: RegisterDeviceRequestBody,
-        username: str = Depends(get_current_username),
+        user: Principal = Depends(get_current_user),
         ) -> StatusResponse:
         async with sessionmaker() as session:
-            try:
-                user = (await session.execute(select(User).where(User.name == username))).scalar_one()
-            except Exception as e:
-                raise HTTPException(status_code=400, detail="unknown user") from e
-
             try:
                 device = Device(
                     id = body.id,
@@ -68,6 +64,7 @@ def CreateRegisterDeviceEndpoint(
                     is_info_public = body.is_info_public,
                     longitude = body.longitude,
                     latitude = body.latitude,
+                    geohash = geohash_or_none(body.latitude, body.longitude),
                 )
 
                 session.add(device)
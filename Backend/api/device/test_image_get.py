@@ -14,9 +14,10 @@ from fastapi import (
     File,
     Header,
     HTTPException,
+    Request,
+    Response,
     UploadFile,
 )
-from fastapi.responses import FileResponse
 from sqlalchemy import desc, select
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
@@ -26,7 +27,9 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.orm.exc import NoResultFound
 
-from api.dependency.basic_auth import BasicAuthRoute, get_current_username
+from api.dependency.basic_auth import BasicAuthRoute, Principal, get_current_user
+from api.response.conditional import is_not_modified
+from api.response.image import image_etag, image_headers, not_modified, stored_image_response
 from bird_classifier.classifier import Classifier
 from database.model import (
     BirdSnap,
@@ -49,28 +52,25 @@ def CreateGetTestImageEndpoint(
     router = APIRouter(
         route_class=BasicAuthRoute(sessionmaker, db_util)
     )
-    @router.get(
+    @router.api_route(
         path="/device/get-test-image",
+        methods=["GET", "HEAD"],
         summary="get a test-image",
         description="get a test-image",
         tags=["device"],
     )
     async def get_test_image(
+        request: Request,
         device_id: UUID = Header(),
-        username: str = Depends(get_current_username),
-    ) -> FileResponse:
+        user: Principal = Depends(get_current_user),
+    ) -> Response:
         async with sessionmaker() as session:
-            try:
-                user = (await session.execute(select(User).where(User.name == username))).scalar_one()
-            except Exception as e:
-                raise HTTPException(status_code=400, detail="unknown user") from e
-
             try:
                 device = (await session.execute(select(Device).where(Device.id == device_id))).scalar_one()
             except Exception as e:
                 raise HTTPException(status_code=400, detail="unknown device") from e
             
-            if device.owner.id != user.id:
+            if device.owner_id != user.id:
                 raise HTTPException(status_code=403, detail="user must be the owner of the device")
             
             try:
@@ -84,17 +84,19 @@ def CreateGetTestImageEndpoint(
             except Exception as e:
                 raise HTTPException(status_code=400, detail="no test image")
             
-            try:
-                path = storage.get_birdsnapimage(testimage.path)
+            # same url for every new test image, clients have to revalidate
+            headers = image_headers(
+                etag=image_etag("testimage", testimage.id, testimage.path),
+                last_modified=testimage.creation_time,
+                cache_control="private, no-cache",
+            )
+
+            # before touching the file
+            if is_not_modified(request, headers["ETag"], testimage.creation_time):
+                return not_modified(headers)
 
-                if path.suffix.lower() in ["jpg", "jpeg"]:
-                    media_type = "image/jpeg"
-                elif path.suffix.lower() in ["png"]:
-                    media_type = "image/png"
-                else:
-                    media_type = None
-                
-                return FileResponse(path=path, media_type=media_type)
+            try:
+                return stored_image_response(storage, testimage.path, headers)
             
             except Exception as e:
                 raise HTTPException(
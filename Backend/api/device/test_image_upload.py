@@ -26,6 +26,7 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.orm.exc import NoResultFound
 
 from api.dependency.basic_auth import BasicAuthRoute, get_current_username
+from api.dependency.body_limit import MULTIPART_OVERHEAD, BodyLimitRoute
 from bird_classifier.classifier import Classifier
 from database.model import (
     BirdSnap,
@@ -37,7 +38,8 @@ from database.model import (
 )
 from database.util import DBUtil
 from schema.response import ResponseStatus, StatusResponse
-from storage.storage import BadFileTypeError, Storage
+from storage.storage import BadFileTypeError, FileTooLargeError, Storage
+from storage.upload import store_upload
 
 
 def CreateUploadTestImageEndpoint(
@@ -47,7 +49,10 @@ def CreateUploadTestImageEndpoint(
     storage: Storage,
 ):
     router = APIRouter(
-        route_class=BasicAuthRoute(sessionmaker, db_util)
+        route_class=BodyLimitRoute(
+            BasicAuthRoute(sessionmaker, db_util),
+            storage.max_file_size + MULTIPART_OVERHEAD,
+        )
     )
     @router.post(
         path="/device/upload-test-image",
@@ -65,48 +70,36 @@ def CreateUploadTestImageEndpoint(
             include_in_schema=False,
         ),
     ) -> StatusResponse:
-        async with sessionmaker() as session:
-
-            # Set snap time
-            if curr_time is None:
-                curr_time = datetime.datetime.now()
+        # Set snap time
+        if curr_time is None:
+            curr_time = datetime.datetime.now()
 
+        # before saving, files of requests failing here would never be collected
+        async with sessionmaker() as session:
             try:
-                device = (await session.execute(select(Device).where(Device.id == device_id))).scalar_one()
+                device_id = (await session.execute(select(Device.id).where(Device.id == device_id))).scalar_one()
             except Exception as e:
                 raise HTTPException(status_code=400, detail="unknown device") from e
 
-            # save file
-            try:
-                storage_path = storage.save_birdsnapimage(
-                    device_id,
-                    image.file,
-                    curr_time,
-                )
-            except BadFileTypeError as e:
-                raise HTTPException(
-                    status_code=415, detail="only supports jpeg and png"
-                ) from e
-
-            try:
-                device = (
-                    await session.execute(select(Device).where(Device.id == device_id))
-                ).scalar_one()
-            except NoResultFound as e:
-                raise HTTPException(status_code=415, detail="unknown device") from e
-
-            # create db entry
-            testimage = TestImage(
-                creation_time=curr_time,
-                device_id=device.id,
-                path=storage_path
-            )
-            session.add(testimage)
-            await session.commit()
-            await session.refresh(testimage)
+        try:
+            async with store_upload(sessionmaker, storage, image) as (session, blob_path):
+                # create db entry
+                session.add(TestImage(
+                    creation_time=curr_time,
+                    device_id=device_id,
+                    path=blob_path,
+                ))
+        except BadFileTypeError as e:
+            raise HTTPException(
+                status_code=415, detail="only supports jpeg and png"
+            ) from e
+        except FileTooLargeError as e:
+            raise HTTPException(
+                status_code=413, detail=f"image larger than {storage.max_file_size} bytes"
+            ) from e
 
-            return StatusResponse(
-                status=ResponseStatus.OK,
-                details="test-image uploaded",
-            )
-    app.include_router(router)
\ No newline at end of file
+        return StatusResponse(
+            status=ResponseStatus.OK,
+            details="test-image uploaded",
+        )
+    app.include_router(router)
@@ -0,0 +1,120 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import delete, literal, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from api.dependency.basic_auth import BasicAuthRoute, Principal, get_current_user
+from config.config import Config
+from database.model import BirdSnap, BirdSnapLike, Device
+from database.util import DBUtil
+from schema.response import LikeBatchResult, LikeResult, LikeStatus
+
+
+class LikeBatchRequestBody(BaseModel):
+    like: List[int] = []
+    unlike: List[int] = []
+
+
+def CreateLikeBatchEndpoint(
+    app: FastAPI,
+    config: Config,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    db_util: DBUtil,
+):
+    router = APIRouter(
+        route_class=BasicAuthRoute(sessionmaker, db_util)
+    )
+    @router.post(
+        path="/like/batch",
+        summary="like and unlike many birdsnaps",
+        description="like and unlike many birdsnaps in one transaction, returns one result per birdsnap",
+        tags=["like"],
+    )
+    async def batch(
+        body: LikeBatchRequestBody,
+        user: Principal = Depends(get_current_user),
+        ) -> LikeBatchResult:
+        # the counters rely on unique ids
+        like_ids = sorted(set(body.like))
+        unlike_ids = sorted(set(body.unlike))
+
+        if len(like_ids) + len(unlike_ids) > config.like.max_batch_size:
+            raise HTTPException(
+                status_code=400,
+                detail=f"at most {config.like.max_batch_size} birdsnaps per batch",
+            )
+        if set(like_ids) & set(unlike_ids):
+            raise HTTPException(status_code=400, detail="birdsnap can not be liked and unliked in one batch")
+
+        results: List[LikeResult] = []
+        async with sessionmaker() as session:
+            if like_ids:
+                # visibility check, insert and counter update in one statement,
+                # snaps are locked in id order so concurrent batches can not deadlock
+                visible = select(BirdSnap.id).join(BirdSnap.device).where(
+                    BirdSnap.id.in_(like_ids)
+                ).where(
+                    or_(BirdSnap.is_public == True, Device.owner_id == user.id)
+                ).order_by(BirdSnap.id).with_for_update(of=BirdSnap).cte("visible")
+
+                inserted = insert(BirdSnapLike).from_select(
+                    ["birdsnap_id", "user_id"],
+                    select(visible.c.id, literal(user.id)),
+                ).on_conflict_do_nothing().returning(BirdSnapLike.birdsnap_id).cte("inserted")
+
+                counted = update(BirdSnap).where(
+                    BirdSnap.id == inserted.c.birdsnap_id
+                ).values(like_count=BirdSnap.like_count + 1).cte("counted")
+
+                rows = (await session.execute(
+                    select(
+                        visible.c.id,
+                        inserted.c.birdsnap_id.is_not(None),
+                    ).outerjoin(
+                        inserted, inserted.c.birdsnap_id == visible.c.id
+                    ).add_cte(counted)
+                )).all()
+
+                liked = {birdsnap_id: is_new for birdsnap_id, is_new in rows}
+                for birdsnap_id in like_ids:
+                    if birdsnap_id not in liked:
+                        status = LikeStatus.UNAVAILABLE
+                    elif liked[birdsnap_id]:
+                        status = LikeStatus.LIKED
+                    else:
+                        status = LikeStatus.ALREADY_LIKED
+                    results.append(LikeResult(birdsnap_id=birdsnap_id, status=status))
+
+            if unlike_ids:
+                locked = select(BirdSnap.id).where(
+                    BirdSnap.id.in_(unlike_ids)
+                ).order_by(BirdSnap.id).with_for_update().cte("locked")
+
+                removed = delete(BirdSnapLike).where(
+                    BirdSnapLike.birdsnap_id.in_(select(locked.c.id))
+                ).where(
+                    BirdSnapLike.user_id == user.id
+                ).returning(BirdSnapLike.birdsnap_id).cte("removed")
+
+                counted = update(BirdSnap).where(
+                    BirdSnap.id == removed.c.birdsnap_id
+                ).values(like_count=BirdSnap.like_count - 1).cte("counted")
+
+                unliked = set((await session.execute(
+                    select(removed.c.birdsnap_id).add_cte(counted)
+                )).scalars().all())
+
+                for birdsnap_id in unlike_ids:
+                    results.append(LikeResult(
+                        birdsnap_id=birdsnap_id,
+                        status=LikeStatus.UNLIKED if birdsnap_id in unliked else LikeStatus.NOT_LIKED,
+                    ))
+
+            await session.commit()
+
+        return LikeBatchResult(results=results)
+
+    app.include_router(router)
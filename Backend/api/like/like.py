@@ -9,14 +9,16 @@ import magic
 from fastapi import (APIRouter, BackgroundTasks, Depends, FastAPI, File,
                      Header, HTTPException, Query, UploadFile)
 from pydantic import BaseModel, field_validator
-from sqlalchemy import select
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
                                     async_sessionmaker, create_async_engine)
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 
-from api.dependency.basic_auth import BasicAuthRoute, get_current_username
+from api.dependency.basic_auth import BasicAuthRoute, Principal, get_current_user
 from config.config import Config
+from database.loading import LoadProfile, load_options
 from database.model import (BirdSnap, BirdSnapImage, BirdSnapLike,
                             BirdSnapStatus, Device, DeviceType, User)
 from database.util import DBUtil
@@ -40,38 +42,29 @@ def CreateLikeEndpoint(
     )
     async def like(
         birdsnap_id: int = Query(),
-        username: str = Depends(get_current_username),
+        user: Principal = Depends(get_current_user),
         ) -> StatusResponse:
         async with sessionmaker() as session:
             try:
-                user = (await session.execute(select(User).where(User.name == username))).scalar_one()
-            except Exception as e:
-                raise HTTPException(status_code=400, detail="unknown user") from e
-
-            try:
-                birdsnap = (await session.execute(select(BirdSnap).where(BirdSnap.id == birdsnap_id))).scalar_one()
+                birdsnap = (await session.execute(
+                    select(BirdSnap).where(
+                        BirdSnap.id == birdsnap_id
+                    ).options(*load_options(LoadProfile.SNAP_ACCESS))
+                )).scalar_one()
             except Exception as e:
                 raise HTTPException(status_code=400, detail="unknown birdsnap") from e
 
-            if (not birdsnap.pubic) and (birdsnap.device.owner.name != username):
+            if (not birdsnap.is_public) and (birdsnap.device.owner_id != user.id):
                 raise HTTPException(status_code=400, detail="birdsnap is not public")
             
-            try:
-                like = BirdSnapLike(
+            like_id = (await session.execute(
+                insert(BirdSnapLike).values(
                     birdsnap_id = birdsnap.id,
                     user_id = user.id
-                )
+                ).on_conflict_do_nothing().returning(BirdSnapLike.id)
+            )).scalar_one_or_none()
 
-                session.add(like)
-                await session.commit()
-            
-                return StatusResponse(
-                    status=ResponseStatus.OK,
-                    details=f"birdsnap {birdsnap_id} liked"
-                )
-            
-            except IntegrityError:
-                
+            if like_id is None:
                 await session.rollback()
 
                 return StatusResponse(
@@ -79,6 +72,19 @@ def CreateLikeEndpoint(
                     details=f"birdsnap {birdsnap_id} already liked"
                 )
 
+            # same transaction as the like itself
+            await session.execute(
+                update(BirdSnap).where(
+                    BirdSnap.id == birdsnap.id
+                ).values(like_count=BirdSnap.like_count + 1)
+            )
+            await session.commit()
+        
+            return StatusResponse(
+                status=ResponseStatus.OK,
+                details=f"birdsnap {birdsnap_id} liked"
+            )
+
     app.include_router(router)
 
     
\ No newline at end of file
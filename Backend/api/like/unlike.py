@@ -9,13 +9,13 @@ import magic
 from fastapi import (APIRouter, BackgroundTasks, Depends, FastAPI, File,
                      Header, HTTPException, Query, UploadFile)
 from pydantic import BaseModel, field_validator
-from sqlalchemy import select
+from sqlalchemy import delete, select, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
                                     async_sessionmaker, create_async_engine)
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 
-from api.dependency.basic_auth import BasicAuthRoute, get_current_username
+from api.dependency.basic_auth import BasicAuthRoute, Principal, get_current_user
 from config.config import Config
 from database.model import (BirdSnap, BirdSnapImage, BirdSnapLike,
                             BirdSnapStatus, Device, DeviceType, User)
@@ -40,37 +40,38 @@ def CreateUnlikeEndpoint(
     )
     async def unlike(
         birdsnap_id: int = Query(),
-        username: str = Depends(get_current_username),
+        user: Principal = Depends(get_current_user),
         ) -> StatusResponse:
         async with sessionmaker() as session:
-            try:
-                user = (await session.execute(select(User).where(User.name == username))).scalar_one()
-            except Exception as e:
-                raise HTTPException(status_code=400, detail="unknown user") from e
+            removed = (await session.execute(
+                delete(BirdSnapLike).where(
+                    BirdSnapLike.birdsnap_id == birdsnap_id
+                ).where(
+                    BirdSnapLike.user_id == user.id
+                ).returning(BirdSnapLike.id)
+            )).scalars().all()
 
-            try:
-                like = (await session.execute(
-                    select(BirdSnapLike).where(
-                        BirdSnapLike.birdsnap_id == birdsnap_id
-                    ).where(
-                        BirdSnapLike.user_id == user.id
-                    )
-                )).scalar_one()
-
-                await session.delete(like)
-                await session.commit()
+            if not removed:
+                await session.rollback()
 
-                return StatusResponse(
-                    status=ResponseStatus.OK,
-                    details=f"birdsnap {birdsnap_id} unliked"
-                )
-
-            except Exception as e:
                 return StatusResponse(
                     status=ResponseStatus.OK,
                     details=f"birdsnap {birdsnap_id} is already not liked"
                 )
 
+            # same transaction as the unlike itself
+            await session.execute(
+                update(BirdSnap).where(
+                    BirdSnap.id == birdsnap_id
+                ).values(like_count=BirdSnap.like_count - len(removed))
+            )
+            await session.commit()
+
+            return StatusResponse(
+                status=ResponseStatus.OK,
+                details=f"birdsnap {birdsnap_id} unliked"
+            )
+
     app.include_router(router)
 
     
\ No newline at end of file
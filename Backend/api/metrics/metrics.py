@@ -0,0 +1,69 @@
+from typing import Dict, List
+
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database.pool import TimedAsyncAdaptedQueuePool
+from database.util import DBUtil
+
+
+def _pool_metrics(lines: List[str], name: str, engine: AsyncEngine) -> None:
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, TimedAsyncAdaptedQueuePool):
+        return
+
+    label = f'pool="{name}"'
+    capacity = pool.capacity()
+    lines.append(f"birdsnap_db_pool_size{{{label}}} {pool.size()}")
+    lines.append(f"birdsnap_db_pool_capacity{{{label}}} {capacity}")
+    lines.append(f"birdsnap_db_pool_checked_out{{{label}}} {pool.checkedout()}")
+    lines.append(f"birdsnap_db_pool_saturation{{{label}}} {pool.checkedout() / capacity if capacity > 0 else 0.0}")
+
+    metrics = pool.metrics
+    cumulative = 0
+    for bucket, count in zip(metrics.buckets, metrics.bucket_counts):
+        cumulative += count
+        lines.append(f'birdsnap_db_pool_checkout_seconds_bucket{{{label},le="{bucket}"}} {cumulative}')
+    lines.append(f'birdsnap_db_pool_checkout_seconds_bucket{{{label},le="+Inf"}} {metrics.checkout_count}')
+    lines.append(f"birdsnap_db_pool_checkout_seconds_sum{{{label}}} {metrics.checkout_seconds}")
+    lines.append(f"birdsnap_db_pool_checkout_seconds_count{{{label}}} {metrics.checkout_count}")
+    lines.append(f"birdsnap_db_pool_checkout_timeouts_total{{{label}}} {metrics.timeouts}")
+
+
+def CreateMetricsEndpoint(
+    app: FastAPI,
+    engines: Dict[str, AsyncEngine],
+    db_util: DBUtil,
+):
+    router = APIRouter()
+    @router.get(
+        path="/metrics",
+        summary="runtime metrics",
+        description="connection pool, cache and password hashing metrics in prometheus text format",
+        tags=["metrics"],
+        response_class=PlainTextResponse,
+    )
+    async def metrics() -> PlainTextResponse:
+        lines: List[str] = []
+
+        for name, engine in engines.items():
+            _pool_metrics(lines, name, engine)
+
+        cache = db_util.credential_cache
+        lines.append(f"birdsnap_credential_cache_hits_total {cache.hits}")
+        lines.append(f"birdsnap_credential_cache_misses_total {cache.misses}")
+        lines.append(f"birdsnap_credential_cache_entries {len(cache)}")
+
+        feed_cache = db_util.feed_cache
+        lines.append(f"birdsnap_feed_cache_hits_total {feed_cache.hits}")
+        lines.append(f"birdsnap_feed_cache_misses_total {feed_cache.misses}")
+        lines.append(f"birdsnap_feed_cache_entries {len(feed_cache)}")
+        lines.append(f"birdsnap_feed_cache_generation {feed_cache.generation}")
+
+        lines.append(f"birdsnap_password_hash_pending {db_util.hash_pending}")
+        lines.append(f"birdsnap_password_hash_capacity {db_util.hash_workers + db_util.hash_queue_depth}")
+
+        return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+    app.include_router(router)
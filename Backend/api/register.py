@@ -8,11 +8,15 @@ from sqlalchemy.ext.asyncio import (
 
 from api.auth.check_auth import CreateAuthCheckEndpoint
 from api.auth.failed import CreateAuthFailed
+from api.auth.token import CreateTokenEndpoint
+from api.device.get_all import CreateGetAllDevicesEndpoint
 from api.device.register import CreateRegisterDeviceEndpoint
 from api.device.test_image_get import CreateGetTestImageEndpoint
 from api.device.test_image_upload import CreateUploadTestImageEndpoint
+from api.like.batch import CreateLikeBatchEndpoint
 from api.like.like import CreateLikeEndpoint
 from api.like.unlike import CreateUnlikeEndpoint
+from api.snap.export import CreateExportEndpoint
 from api.snap.get import CreateGetEndpoint
 from api.snap.get_all import CreateGetAllEndpoint
 from api.snap.image import CreateImageEndpoint
@@ -28,19 +32,24 @@ def register(
     app: FastAPI,
     config:Config,
     sessionmaker: async_sessionmaker[AsyncSession],
+    read_sessionmaker: async_sessionmaker[AsyncSession],
     db_util: DBUtil,
     storage: Storage,
     classifier:Classifier,
 ):
     CreateAuthFailed(app)
     CreateAuthCheckEndpoint(app, sessionmaker, db_util)
-    CreateGetEndpoint(app, sessionmaker, db_util)
-    CreateGetAllEndpoint(app, sessionmaker, db_util)
+    CreateTokenEndpoint(app, sessionmaker, db_util)
+    CreateGetEndpoint(app, sessionmaker, read_sessionmaker, db_util)
+    CreateGetAllEndpoint(app, config, sessionmaker, read_sessionmaker, db_util)
+    CreateExportEndpoint(app, sessionmaker, read_sessionmaker, db_util)
     CreateUploadEndpoint(app, sessionmaker, db_util, storage, classifier)
-    CreateImageEndpoint(app, sessionmaker, db_util, storage)
+    CreateImageEndpoint(app, config, sessionmaker, read_sessionmaker, db_util, storage)
     CreateCreateUserEndpoint(app, sessionmaker, db_util)
     CreateRegisterDeviceEndpoint(app, sessionmaker, db_util)
+    CreateGetAllDevicesEndpoint(app, config, sessionmaker, db_util)
     CreateGetTestImageEndpoint(app, sessionmaker, db_util, storage)
     CreateUploadTestImageEndpoint(app, sessionmaker, db_util, storage)
     CreateLikeEndpoint(app, sessionmaker, db_util)
     CreateUnlikeEndpoint(app, sessionmaker, db_util)
+    CreateLikeBatchEndpoint(app, config, sessionmaker, db_util)
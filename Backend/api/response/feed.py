@@ -0,0 +1,37 @@
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import Row
+
+
+# image id, storage path and visibility to a signed url
+ImageURL = Callable[[int, str, bool], str]
+
+
+def feed_item(row: Row, image_url: Optional[ImageURL] = None) -> Dict[str, Any]:
+    # row of database.query.feed_item_query, the keys follow response.BirdSnap
+    return {
+        "id": row.id,
+        "deviceInfo": {
+            "id": row.device_id,
+            "name": row.device_name,
+            "latitude": row.latitude if row.is_info_public else None,
+            "longitude": row.longitude if row.is_info_public else None,
+        },
+        "userInfo": {
+            "id": row.user_id,
+            "name": row.user_name,
+        },
+        "likeInfo": {
+            # queries for the shared feed leave it out, it is filled in per viewer
+            "isLiked": getattr(row, "is_liked", False),
+            "likes": row.like_count,
+            "users": None,
+        },
+        "is_public": row.is_public,
+        "snap_time": row.snap_time,
+        "images": [
+            {"id": image_id, "url": image_url(image_id, path, row.is_public) if image_url is not None else None}
+            for image_id, path in zip(row.image_ids or (), row.image_paths or ())
+        ],
+        "bird_species": row.bird_species,
+    }
@@ -0,0 +1,214 @@
+import os
+import secrets
+import stat
+from typing import BinaryIO, List, Mapping, Optional, Tuple
+
+import anyio
+from fastapi import Response
+from starlette.datastructures import Headers
+from starlette.types import Receive, Scope, Send
+
+from api.response.conditional import etag_matches
+
+# more ranges than this are answered with the whole file
+MAX_RANGES = 16
+
+_ZERO_COPY = "http.response.zerocopysend"
+_PATH_SEND = "http.response.pathsend"
+
+
+class RangeNotSatisfiableError(Exception):
+    pass
+
+
+def parse_ranges(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    byte ranges of a Range header as sorted, merged (start, end) pairs, end exclusive
+
+    None when the header is missing, malformed or asks for too many ranges, the whole file is sent then
+    """
+    if header is None:
+        return None
+
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) + 1 if last else max(size, start + 1)
+                if start < 0 or end <= start:
+                    return None
+            else:
+                # suffix range, the last n bytes
+                length = int(last)
+                if length < 0:
+                    return None
+                start, end = max(size - length, 0), size
+        except ValueError:
+            return None
+
+        if start < size and end > start:
+            ranges.append((start, min(end, size)))
+
+    if not ranges:
+        raise RangeNotSatisfiableError()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+class RangeFileResponse(Response):
+    """
+    file response answering Range and HEAD requests
+
+    offset and length limit it to a window of the file, a blob packed into a bundle,
+    the body goes out with the zero copy send extension when the server offers it,
+    otherwise read with pread in a thread
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: "os.PathLike[str] | str",
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        offset: int = 0,
+        length: Optional[int] = None,
+    ) -> None:
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.status_code = 200
+        self.media_type = media_type or "application/octet-stream"
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = Headers(scope=scope)
+        extensions = scope.get("extensions") or {}
+        send_body = scope["method"].upper() != "HEAD"
+
+        file = await anyio.to_thread.run_sync(open, self.path, "rb", 0)
+        try:
+            file_stat = os.fstat(file.fileno())
+            if not stat.S_ISREG(file_stat.st_mode):
+                raise RuntimeError(f"File at path {self.path} is not a file.")
+            size = self.length if self.length is not None else file_stat.st_size - self.offset
+            if self.offset + size > file_stat.st_size:
+                raise RuntimeError(f"File at path {self.path} is shorter than the window.")
+
+            self.headers["accept-ranges"] = "bytes"
+            ranges = None
+            if self._if_range_matches(request_headers.get("if-range")):
+                try:
+                    ranges = parse_ranges(request_headers.get("range"), size)
+                except RangeNotSatisfiableError:
+                    await self._send_not_satisfiable(send, size)
+                    return
+
+            if ranges is None or ranges == [(0, size)]:
+                self.headers["content-length"] = str(size)
+                await self._start(send, 200)
+                if not send_body:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+                elif _ZERO_COPY not in extensions and _PATH_SEND in extensions and self.length is None and self.offset == 0:
+                    await send({"type": _PATH_SEND, "path": str(self.path)})
+                else:
+                    await self._send_segment(send, extensions, file, 0, size, more_body=False)
+
+            elif len(ranges) == 1:
+                start, end = ranges[0]
+                self.headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+                self.headers["content-length"] = str(end - start)
+                await self._start(send, 206)
+                if send_body:
+                    await self._send_segment(send, extensions, file, start, end - start, more_body=False)
+                else:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+            else:
+                boundary = secrets.token_hex(16)
+                part_headers = [
+                    (
+                        f"\r\n--{boundary}\r\n"
+                        f"Content-Type: {self.media_type}\r\n"
+                        f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n"
+                    ).encode("latin-1")
+                    for start, end in ranges
+                ]
+                closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+                length = sum(len(part) for part in part_headers) + sum(end - start for start, end in ranges) + len(closing)
+
+                self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+                self.headers["content-length"] = str(length)
+                await self._start(send, 206)
+                if send_body:
+                    for part, (start, end) in zip(part_headers, ranges):
+                        await send({"type": "http.response.body", "body": part, "more_body": True})
+                        await self._send_segment(send, extensions, file, start, end - start, more_body=True)
+                    await send({"type": "http.response.body", "body": closing, "more_body": False})
+                else:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            file.close()
+
+    def _if_range_matches(self, if_range: Optional[str]) -> bool:
+        # ranges of another version of the file must not be mixed, If-Range needs a strong match
+        if if_range is None:
+            return True
+        etag = self.headers.get("etag")
+        if if_range.strip().startswith(("\"", "W/")):
+            return etag is not None and not if_range.strip().startswith("W/") and etag_matches(if_range, etag)
+        return if_range.strip() == self.headers.get("last-modified")
+
+    async def _start(self, send: Send, status_code: int) -> None:
+        self.status_code = status_code
+        await send({"type": "http.response.start", "status": status_code, "headers": self.raw_headers})
+
+    async def _send_not_satisfiable(self, send: Send, size: int) -> None:
+        self.headers["content-range"] = f"bytes */{size}"
+        self.headers["content-length"] = "0"
+        await self._start(send, 416)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_segment(
+        self, send: Send, extensions: Mapping, file: BinaryIO, offset: int, count: int, more_body: bool
+    ) -> None:
+        # positions so far are relative to the window
+        offset += self.offset
+        if _ZERO_COPY in extensions:
+            # the server hands the file to sendfile, no copy through python
+            await send({
+                "type": _ZERO_COPY,
+                "file": file,
+                "offset": offset,
+                "count": count,
+                "more_body": more_body,
+            })
+            return
+
+        end = offset + count
+        while True:
+            chunk = await anyio.to_thread.run_sync(os.pread, file.fileno(), min(self.chunk_size, end - offset), offset)
+            offset += len(chunk)
+            last = offset >= end or not chunk
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body or not last})
+            if last:
+                return
@@ -0,0 +1,85 @@
+import datetime
+import hashlib
+from pathlib import Path, PurePath, PurePosixPath
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.responses import RedirectResponse
+
+from api.response.conditional import http_date
+from api.response.feed import ImageURL
+from api.response.file import RangeFileResponse
+from database.token import ImageURLSigner
+from storage.bundle import bundle_location
+from storage.storage import Storage
+
+_MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+}
+
+
+def image_media_type(path: PurePath) -> Optional[str]:
+    # suffix includes the dot
+    return _MEDIA_TYPES.get(path.suffix.lower())
+
+
+def image_etag(kind: str, image_id: int, storage_path: str) -> str:
+    # stored files are never rewritten, id and path identify the content
+    digest = hashlib.blake2b(f"{kind}:{image_id}:{storage_path}".encode("utf-8"), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def snap_image_cache_control(is_public: bool, max_age: int) -> str:
+    # private snaps must not end up in shared caches
+    return f"{'public' if is_public else 'private'}, max-age={max_age}, immutable"
+
+
+def image_headers(etag: str, last_modified: Optional[datetime.datetime], cache_control: str) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+def stored_image_response(storage: Storage, storage_path: str, headers: Dict[str, str]) -> Response:
+    """
+    sends a stored file, or redirects to it for storage backends serving clients themselves
+    """
+    url = storage.presigned_url(storage_path, headers["Cache-Control"])
+    if url is not None:
+        # the url expires, clients must come back here instead of remembering it
+        redirect_headers = {"Cache-Control": "no-store"}
+        if "Vary" in headers:
+            redirect_headers["Vary"] = headers["Vary"]
+        return RedirectResponse(url, status_code=307, headers=redirect_headers)
+
+    location = bundle_location(storage_path)
+    if location is not None:
+        # served straight from the bundle, no copy
+        return RangeFileResponse(
+            path=storage.get_bundled(location),
+            media_type=image_media_type(PurePosixPath(storage_path)),
+            headers=headers,
+            offset=location.offset,
+            length=location.size,
+        )
+
+    path = storage.get_birdsnapimage(storage_path)
+    return RangeFileResponse(path=path, media_type=image_media_type(path), headers=headers)
+
+
+def signed_image_url(request: Request, image_urls: ImageURLSigner) -> ImageURL:
+    # the route is looked up once per response, not per image
+    base = request.url_for("signed_snap_image")
+
+    def image_url(image_id: int, storage_path: str, is_public: bool) -> str:
+        return str(base.include_query_params(token=image_urls.sign(image_id, storage_path, is_public)))
+
+    return image_url
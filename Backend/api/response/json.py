@@ -0,0 +1,28 @@
+import uuid
+from typing import Any
+
+import orjson
+from fastapi.responses import Response
+
+
+def _default(value: Any) -> Any:
+    # asyncpg returns its own uuid subclass, orjson only handles uuid.UUID itself
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError
+
+
+def dumps(content: Any) -> bytes:
+    # utc datetimes end in "Z" like the ones serialized by pydantic
+    return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
+
+
+class UTCJSONResponse(Response):
+    """
+    json response rendered with orjson, for plain dicts and lists instead of pydantic models
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
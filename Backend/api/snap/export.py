@@ -0,0 +1,76 @@
+import datetime
+from typing import AsyncIterator, List, Optional
+
+from fastapi import APIRouter, Depends, FastAPI, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from api.dependency.area import Area, get_area
+from api.dependency.basic_auth import BasicAuthRoute, Principal, get_current_user
+from api.response.feed import feed_item
+from api.response.json import dumps
+from database.model import BirdSnap
+from database.query import SpeciesMatch, feed_filters, feed_item_query
+from database.util import DBUtil
+
+# rows per fetch from the server side cursor
+_BATCH_SIZE = 500
+
+
+def CreateExportEndpoint(
+    app: FastAPI,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    read_sessionmaker: async_sessionmaker[AsyncSession],
+    db_util: DBUtil,
+):
+    router = APIRouter(
+        route_class=BasicAuthRoute(sessionmaker, db_util)
+    )
+    @router.get(
+        path="/snap/export",
+        summary="export bird snaps",
+        description="streams all matching bird snaps as newline delimited json, oldest first, "
+                    "each line has the format of one /snap/get-all result",
+        tags=["snap"],
+        response_class=StreamingResponse,
+    )
+    async def export(
+        request: Request,
+
+        # basic auth
+        user: Principal = Depends(get_current_user),
+
+        # other params
+        username: Optional[str] = None,
+        since: Optional[datetime.datetime] = None,
+        until: Optional[datetime.datetime] = None,
+        species: Optional[List[str]] = Query(default=None),
+        species_match: SpeciesMatch = SpeciesMatch.ALL,
+        area: Optional[Area] = Depends(get_area),
+    ) -> StreamingResponse:
+        query = feed_item_query(user.id).where(*feed_filters(
+            viewer_id=user.id,
+            viewer_name=user.name,
+            username=username,
+            since=since,
+            until=until,
+            species=species,
+            species_match=species_match,
+            area=area,
+        )).order_by(BirdSnap.snap_time, BirdSnap.id)
+
+        async def lines() -> AsyncIterator[bytes]:
+            # the session lives as long as the response, rows are fetched in batches
+            async with read_sessionmaker() as session:
+                result = await session.stream(query.execution_options(yield_per=_BATCH_SIZE))
+                try:
+                    async for rows in result.partitions():
+                        if await request.is_disconnected():
+                            break
+                        yield b"".join(dumps(feed_item(row)) + b"\n" for row in rows)
+                finally:
+                    await result.close()
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    app.include_router(router)
@@ -13,8 +13,11 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.exc import NoResultFound
 
-from api.dependency.basic_auth import BasicAuthRoute, get_current_username
+from api.dependency.basic_auth import BasicAuthRoute, Principal, get_current_user
+from api.response.image import signed_image_url
+from database.loading import LoadProfile, load_options
 from database.model import BirdSnap, BirdSnapLike, BirdSnapStatus, Device, User
+from database.query import is_liked_by
 from database.util import DBUtil
 from schema import response
 
@@ -22,6 +25,7 @@ from schema import response
 def CreateGetEndpoint(
     app: FastAPI,
     sessionmaker: async_sessionmaker[AsyncSession],
+    read_sessionmaker: async_sessionmaker[AsyncSession],
     db_util: DBUtil,
 ):
     router = APIRouter(
@@ -35,44 +39,35 @@ def CreateGetEndpoint(
     )
     #@internationalize(translate_birdsnap)
     async def getAll(
+        request: Request,
+
         # basic auth
-        auth_username: str = Depends(get_current_username),
+        user: Principal = Depends(get_current_user),
 
         # other params
         id: int = 0,
     ) -> response.BirdSnap:
-        async with sessionmaker() as session:
-            try:
-                user = (await session.execute(select(User).where(User.name == auth_username))).scalar_one()
-            except Exception as e:
-                raise HTTPException(status_code=400, detail="unknown user") from e
-
-
+        async with read_sessionmaker() as session:
             try:
-                query = select(BirdSnap).where(
+                query = select(BirdSnap, is_liked_by(user.id)).where(
                     BirdSnap.id == id
                 ).where(
                     BirdSnap.status == BirdSnapStatus.AVAILABLE
                 )
                 
-                birdsnap = (await session.execute(
-                    query.options(
-                        joinedload(BirdSnap.device)
-                    ).options(
-                        joinedload(BirdSnap.users_liked)
-                    ).options(
-                        joinedload(BirdSnap.images)
-                    )
-                )).scalar_one()
+                birdsnap, is_liked = (await session.execute(
+                    query.options(*load_options(LoadProfile.SNAP_DETAIL))
+                )).one()
             
             except NoResultFound as e:
                 raise HTTPException(
                     status_code=400, detail="birdsnap not available"
                 ) from e
 
-            if (not birdsnap.is_public) and birdsnap.device.owner.id != user.id:
+            if (not birdsnap.is_public) and birdsnap.device.owner_id != user.id:
                 raise HTTPException(status_code=400, detail="birdsnap not available")
             
+            image_url = signed_image_url(request, db_util.image_urls)
             return response.BirdSnap(
                 id = birdsnap.id,
                 device_info=response.DeviceInfo(
@@ -86,14 +81,15 @@ def CreateGetEndpoint(
                     name=birdsnap.device.owner.name
                 ),
                 like_info=response.LikeInfo(
-                    is_liked=user.id in [user.id for user in birdsnap.users_liked],
-                    likes=len(birdsnap.users_liked),
+                    is_liked=is_liked,
+                    likes=birdsnap.like_count,
                     users=[response.UserInfo(id = user.id, name= user.name) for user in birdsnap.users_liked]
                 ),
                 is_public=birdsnap.is_public,
                 snap_time=birdsnap.snap_time,
                 images=[response.BirdSnapImage(
                     id=image.id,
+                    url=image_url(image.id, image.path, birdsnap.is_public),
                 ) for image in birdsnap.images],
                 bird_species=birdsnap.bird_species
             )
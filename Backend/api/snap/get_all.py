@@ -1,9 +1,10 @@
 import datetime
-from typing import Optional
-from urllib.parse import urljoin, urlparse
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
-from sqlalchemy import func, select
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request, Response
+from sqlalchemy import ColumnElement, Select, exists, func, select, tuple_
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -12,15 +13,118 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.orm import joinedload
 
-from api.dependency.basic_auth import BasicAuthRoute, get_current_username
+from api.dependency.area import Area, get_area
+from api.dependency.basic_auth import BasicAuthRoute, Principal, get_current_user
+from api.dependency.cursor import Cursor, CursorDirection, InvalidCursorError
+from api.response.conditional import etag_matches
+from api.response.feed import ImageURL, feed_item
+from api.response.image import signed_image_url
+from api.response.json import UTCJSONResponse
+from config.config import Config
 from database.model import BirdSnap, BirdSnapLike, BirdSnapStatus, Device, User
+from database.query import (
+    SpeciesMatch,
+    estimate_count,
+    feed_filters,
+    feed_item_query,
+    species_facets,
+)
 from database.util import DBUtil
 from schema import response
 
 
+@dataclass(frozen=True)
+class _FeedPage:
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+    total_count: Optional[int]
+    facets: Optional[List[Dict[str, Any]]]
+
+
+async def _load_page(
+    session: AsyncSession,
+    query: Select,
+    filters: List[ColumnElement[bool]],
+    position: Optional[Cursor],
+    offset: Optional[int],
+    limit: int,
+    total: response.TotalCount,
+    facets: bool,
+    image_url: ImageURL,
+) -> _FeedPage:
+    if total == response.TotalCount.EXACT:
+        total_count = (await session.execute(
+            select(func.count()).select_from(query.subquery())
+        )).scalar_one()
+    elif total == response.TotalCount.ESTIMATE:
+        total_count = await estimate_count(session, query)
+    else:
+        total_count = None
+
+    # counts over the whole filter, not only this page
+    species_counts = await species_facets(session, filters) if facets else None
+
+    # keyset on (snap_time, id)
+    key = tuple_(BirdSnap.snap_time, BirdSnap.id)
+    if position is None:
+        query = query.order_by(BirdSnap.snap_time, BirdSnap.id)
+        if offset is not None:
+            query = query.offset(offset)
+    elif position.direction == CursorDirection.NEXT:
+        query = query.where(
+            key > tuple_(position.snap_time, position.id)
+        ).order_by(BirdSnap.snap_time, BirdSnap.id)
+    else:
+        query = query.where(
+            key < tuple_(position.snap_time, position.id)
+        ).order_by(BirdSnap.snap_time.desc(), BirdSnap.id.desc())
+
+    # one extra row tells if there is another page
+    rows = (await session.execute(query.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if position is not None and position.direction == CursorDirection.PREV:
+        rows.reverse()
+        has_next = True
+        has_prev = has_more
+    else:
+        has_next = has_more
+        has_prev = position is not None or (offset is not None and offset > 0)
+
+    next_cursor = None
+    prev_cursor = None
+    if rows and has_next:
+        next_cursor = Cursor(
+            snap_time=rows[-1].snap_time,
+            id=rows[-1].id,
+            direction=CursorDirection.NEXT,
+        ).encode()
+    if rows and has_prev:
+        prev_cursor = Cursor(
+            snap_time=rows[0].snap_time,
+            id=rows[0].id,
+            direction=CursorDirection.PREV,
+        ).encode()
+
+    return _FeedPage(
+        items=[feed_item(row, image_url) for row in rows],
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+        total_count=total_count,
+        facets=[
+            {"species": name, "count": count}
+            for name, count in species_counts.items()
+        ] if species_counts is not None else None,
+    )
+
+
 def CreateGetAllEndpoint(
     app: FastAPI,
+    config: Config,
     sessionmaker: async_sessionmaker[AsyncSession],
+    read_sessionmaker: async_sessionmaker[AsyncSession],
     db_util: DBUtil,
 ):
     router = APIRouter(
@@ -28,8 +132,11 @@ def CreateGetAllEndpoint(
     )
     @router.get(
        path="/snap/get-all",
+        response_model=response.BirdSnapFeed,
+        response_class=UTCJSONResponse,
         summary="returns all available bird snaps",
-        description="returns all available bird snaps",
+        description="returns all available bird snaps, pages are linked with opaque cursors, "
+                    "a bounding box or radius limits the feed to devices with public locations",
         tags=["snap"],
     )
     #@internationalize(translate_paginated_result_birdsnap)
@@ -37,115 +144,129 @@ def CreateGetAllEndpoint(
         request: Request,
 
         # basic auth
-        auth_username: str = Depends(get_current_username),
+        user: Principal = Depends(get_current_user),
 
         # other params
-        username: Optional[int] = None,
+        username: Optional[str] = None,
         since: Optional[datetime.datetime] = None,
-        last:Optional[int] = None,
-        offset: Optional[int] = None,
+        last:Optional[int] = Query(default=None, deprecated=True),
+        offset: Optional[int] = Query(default=None, deprecated=True),
         limit: Optional[int] = None,
-    ) -> response.PaginatedResult[response.BirdSnap]:
-        async with sessionmaker() as session:
-            try:
-                user = (await session.execute(select(User).where(User.name == auth_username))).scalar_one()
-            except Exception as e:
-                raise HTTPException(status_code=400, detail="unknown user") from e
+        cursor: Optional[str] = None,
+        total: response.TotalCount = response.TotalCount.NONE,
+        species: Optional[List[str]] = Query(default=None),
+        species_match: SpeciesMatch = SpeciesMatch.ALL,
+        facets: bool = False,
+        area: Optional[Area] = Depends(get_area),
+    ) -> UTCJSONResponse:
 
+        # page size
+        if limit is None:
+            limit = last if last is not None else config.pagination.default_page_size
+        if limit < 1:
+            raise HTTPException(status_code=400, detail="limit must be positive")
+        limit = min(limit, config.pagination.max_page_size)
 
-            if username is None:
-                query = select(BirdSnap).join(BirdSnap.device).join(Device.owner).where(
-                    BirdSnap.is_public == True
-                )
-            elif username != user.name:
-                query = select(BirdSnap).join(BirdSnap.device).join(Device.owner).where(
-                    User.name == username
-                ).where(
-                    BirdSnap.is_public == True
-                )
-            else:
-                query = select(BirdSnap).join(BirdSnap.device).join(Device.owner).where(
-                    User.name == user.name
-                )
-            
-            # only get available
-            query = query.where(BirdSnap.status == BirdSnapStatus.AVAILABLE)
+        if cursor is not None and offset is not None:
+            raise HTTPException(status_code=400, detail="cursor and offset can not be combined")
+
+        try:
+            position = Cursor.decode(cursor) if cursor is not None else None
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail="invalid cursor") from e
+
+        filters = feed_filters(
+            viewer_id=user.id,
+            viewer_name=user.name,
+            username=username,
+            since=since,
+            species=species,
+            species_match=species_match,
+            area=area,
+        )
+
+        # the public feed is the same for everyone apart from likes
+        shared = username is None
+        feed_cache = db_util.feed_cache
+        cache_key = (
+            since,
+            limit,
+            position,
+            offset,
+            total,
+            tuple(sorted(set(species))) if species else None,
+            species_match if species else None,
+            facets,
+            area,
+            # the signed image urls are absolute
+            str(request.base_url),
+        )
 
-            if since is not None:
-                query = query.where(
-                    BirdSnap.snap_time > since
+        page = feed_cache.get(cache_key) if shared else None
+        if page is None:
+            generation = feed_cache.generation
+            async with read_sessionmaker() as session:
+                page = await _load_page(
+                    session,
+                    feed_item_query(None if shared else user.id).where(*filters),
+                    filters,
+                    position=position,
+                    offset=offset,
+                    limit=limit,
+                    total=total,
+                    facets=facets,
+                    image_url=signed_image_url(request, db_util.image_urls),
                 )
-            
-            if last is not None:
-                query = query.limit(last)
-            
-            query = query.order_by(BirdSnap.snap_time)
-            total_count = (await session.execute(
-                select(func.count()).select_from(query.subquery())
-            )).scalar_one()
-
-            if limit is not None:
-                query=select(query.subquery()).limit(limit)
-            
-                if offset is not None:
-                    query = query.offset(offset)
-            elif offset is not None:
-                raise HTTPException(status_code=400, detail="offset without limit not supported")
-            
-            birdsnaps = (
-                await session.execute(query.options(
-                    joinedload(BirdSnap.device)
-                ).options(
-                    joinedload(BirdSnap.users_liked)
-                ).options(
-                    joinedload(BirdSnap.images)
-                ))
-            ).unique().scalars().all()
-
-            baseurl = urljoin(str(request.url), urlparse(str(request.url)).path)
-            if limit is not None and len(birdsnaps) < total_count:
-                #TODO
-                next_url = baseurl
-                prev_url = baseurl
-            else:
-                next_url = None
-                prev_url = None
-            
-            return response.PaginatedResult[response.BirdSnap](
-                page=response.Page(
-                    next  = next_url,
-                    prev  = prev_url,
-                    index = offset//limit if (limit is not None and limit is not 0 and offset is not None) else 0,
-                    page_count=len(birdsnaps),
-                    total_count=total_count,
-                ),
-                results=[
-                    response.BirdSnap(
-                        id = birdsnap.id,
-                        device_info=response.DeviceInfo(
-                            id=birdsnap.device.id,
-                            name=birdsnap.device.name,
-                            longitude=birdsnap.device.longitude if birdsnap.device.is_info_public else None,
-                            latitude=birdsnap.device.latitude if birdsnap.device.is_info_public else None,
-                        ),
-                        user_info=response.UserInfo(
-                            id=birdsnap.device.owner.id,
-                            name=birdsnap.device.owner.name
-                        ),
-                        like_info=response.LikeInfo(
-                            is_liked=user.id in [user.id for user in birdsnap.users_liked],
-                            likes=len(birdsnap.users_liked),
-                            users=[response.UserInfo(id = user.id, name= user.name) for user in birdsnap.users_liked]
-                        ),
-                        is_public=birdsnap.is_public,
-                        snap_time=birdsnap.snap_time,
-                        images=[response.BirdSnapImage(
-                            id=image.id,
-                        ) for image in birdsnap.images],
-                        bird_species=birdsnap.bird_species
-                    ) for birdsnap in birdsnaps
-                ]
-            )
+            if shared:
+                feed_cache.put(cache_key, page, generation)
+
+        results = page.items
+        if shared and results:
+            # likes change too often to invalidate the shared pages, they are read for every request
+            async with read_sessionmaker() as session:
+                likes = {
+                    row.id: row for row in (await session.execute(
+                        select(
+                            BirdSnap.id,
+                            BirdSnap.like_count,
+                            exists().where(
+                                BirdSnapLike.birdsnap_id == BirdSnap.id
+                            ).where(
+                                BirdSnapLike.user_id == user.id
+                            ).label("is_liked"),
+                        ).where(BirdSnap.id.in_([item["id"] for item in results]))
+                    )).all()
+                }
+            results = [
+                {**item, "likeInfo": {
+                    **item["likeInfo"],
+                    "isLiked": item["id"] in likes and likes[item["id"]].is_liked,
+                    "likes": likes[item["id"]].like_count if item["id"] in likes else item["likeInfo"]["likes"],
+                }}
+                for item in results
+            ]
+
+        url = request.url.remove_query_params(["cursor", "offset", "last"])
+
+        # serialized without per row pydantic models, the keys follow response.BirdSnapFeed
+        feed = UTCJSONResponse({
+            "page": {
+                "next": str(url.include_query_params(cursor=page.next_cursor)) if page.next_cursor else None,
+                "prev": str(url.include_query_params(cursor=page.prev_cursor)) if page.prev_cursor else None,
+                "index": offset//limit if offset is not None else (0 if position is None else None),
+                "pageCount": len(results),
+                "totalCount": page.total_count,
+            },
+            "results": results,
+            "facets": page.facets,
+        }, headers={"Cache-Control": "private, no-cache"})
+
+        etag = f'"{hashlib.blake2b(feed.body, digest_size=16).hexdigest()}"'
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+        feed.headers["ETag"] = etag
+        return feed
 
     app.include_router(router)
 
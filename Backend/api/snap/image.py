@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import os
 from pathlib import Path
@@ -13,9 +14,10 @@ from fastapi import (
     File,
     Header,
     HTTPException,
+    Request,
+    Response,
     UploadFile,
 )
-from fastapi.responses import FileResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
@@ -26,48 +28,61 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.exc import NoResultFound
 
-from api.dependency.basic_auth import BasicAuthRoute, get_current_username
+from api.dependency.basic_auth import BasicAuthRoute, Principal, get_current_user
+from api.response.conditional import is_not_modified
+from api.response.file import RangeFileResponse
+from api.response.image import (
+    image_etag,
+    image_headers,
+    not_modified,
+    snap_image_cache_control,
+    stored_image_response,
+)
 from config.config import Config
+from database.loading import LoadProfile, load_options
 from database.model import BirdSnap, BirdSnapImage, BirdSnapStatus, Device, User
+from database.token import InvalidTokenError
 from database.util import DBUtil
 from schema.response import ResponseStatus, StatusResponse
+from storage.derivative import DerivativeSize, negotiate_format
 from storage.storage import BadFileTypeError, Storage
 
 
 def CreateImageEndpoint(
-    app: FastAPI, sessionmaker: async_sessionmaker[AsyncSession],  db_util: DBUtil, storage: Storage,
+    app: FastAPI,
+    config: Config,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    read_sessionmaker: async_sessionmaker[AsyncSession],
+    db_util: DBUtil,
+    storage: Storage,
 ):
     router = APIRouter(
         route_class=BasicAuthRoute(sessionmaker, db_util)
     )
-    @router.get(
+    @router.api_route(
         path="/snap/image",
+        methods=["GET", "HEAD"],
         summary="download birdsnap image",
-        description="download birdsnap image",
+        description="download birdsnap image, thumb and medium are downscaled copies "
+                    "in webp for clients accepting it and jpeg otherwise",
         tags=["snap"],
-        response_class=FileResponse
+        response_class=RangeFileResponse
     )
     async def image(
+        request: Request,
+
         # basic auth
-        auth_username: str = Depends(get_current_username),
+        user: Principal = Depends(get_current_user),
         
         # other params
         id: int = 0,
-    ) -> FileResponse:
-        async with sessionmaker() as session:
-
-            try:
-                user = (await session.execute(select(User).where(User.name == auth_username))).scalar_one()
-            except Exception as e:
-                raise HTTPException(status_code=400, detail="unknown user") from e
-            
-            
+        size: DerivativeSize = DerivativeSize.ORIGINAL,
+    ) -> Response:
+        async with read_sessionmaker() as session:
             try:
                 query = select(BirdSnapImage).where(BirdSnapImage.id == id)
                 image = (await session.execute(
-                    query.options(
-                        joinedload(BirdSnapImage.birdsnap)
-                    )
+                    query.options(*load_options(LoadProfile.IMAGE_ACCESS))
                 )).scalar_one()
             
             except NoResultFound as e:
@@ -75,7 +90,7 @@ def CreateImageEndpoint(
                     status_code=400, detail="image not available"
                 ) from e
             
-            if (not image.birdsnap.is_public) and image.birdsnap.device.owner.id != user.id:
+            if (not image.birdsnap.is_public) and image.birdsnap.device.owner_id != user.id:
                 raise HTTPException(
                     status_code=403, detail="access denied"
                 )
@@ -90,22 +105,96 @@ def CreateImageEndpoint(
                     status_code=400, detail="image not available"
                 )
 
-            try:
-                path = storage.get_birdsnapimage(image.path)
-                if path.suffix.lower() in ["jpg", "jpeg"]:
-                    media_type = "image/jpeg"
-                elif path.suffix.lower() in ["png"]:
-                    media_type = "image/png"
-                else:
-                    media_type = None
-                return FileResponse(path=path, media_type=media_type)
-            
-            except Exception as e:
-                raise HTTPException(
-                    status_code=500, detail="image not available"
-                ) from e          
-    
+            return await send_image(
+                request,
+                image.id,
+                image.path,
+                image.birdsnap.is_public,
+                image.birdsnap.snap_time,
+                size,
+            )
+
     app.include_router(router)
+
+    # no auth, the token proves the caller was allowed to see the image when it was issued
+    signed_router = APIRouter()
+    @signed_router.api_route(
+        path="/snap/image/signed",
+        methods=["GET", "HEAD"],
+        name="signed_snap_image",
+        summary="download birdsnap image with a signed url",
+        description="download birdsnap image with a url from /snap/get or /snap/get-all, "
+                    "no credentials needed until the url expires",
+        tags=["snap"],
+        response_class=RangeFileResponse
+    )
+    async def signed_image(
+        request: Request,
+        token: str,
+        size: DerivativeSize = DerivativeSize.ORIGINAL,
+    ) -> Response:
+        try:
+            claims = db_util.image_urls.verify(token)
+        except InvalidTokenError as e:
+            raise HTTPException(
+                status_code=403, detail="invalid or expired image url"
+            ) from e
+
+        image_path = claims.path
+        if not await asyncio.to_thread(storage.exists, image_path):
+            # moved by relayout-storage or pack-storage after the url was issued,
+            # asks the primary, a replica may not have seen the move yet
+            async with sessionmaker() as session:
+                image_path = (await session.execute(
+                    select(BirdSnapImage.path).where(BirdSnapImage.id == claims.image_id)
+                )).scalar_one_or_none()
+            if image_path is None:
+                raise HTTPException(
+                    status_code=400, detail="image not available"
+                )
+
+        return await send_image(request, claims.image_id, image_path, claims.is_public, None, size)
+
+    app.include_router(signed_router)
+
+    async def send_image(
+        request: Request,
+        image_id: int,
+        image_path: str,
+        is_public: bool,
+        last_modified: Optional[datetime.datetime],
+        size: DerivativeSize,
+    ) -> Response:
+        if size == DerivativeSize.ORIGINAL:
+            kind = "birdsnapimage"
+        else:
+            format = negotiate_format(request.headers.get("accept"))
+            kind = f"birdsnapimage:{size.value}.{format.value}"
+
+        headers = image_headers(
+            etag=image_etag(kind, image_id, image_path),
+            last_modified=last_modified,
+            cache_control=snap_image_cache_control(is_public, config.cache.image_max_age),
+        )
+        if size != DerivativeSize.ORIGINAL:
+            # the format depends on the accept header
+            headers["Vary"] = "Accept"
+
+        # before touching the file
+        if is_not_modified(request, headers["ETag"], last_modified):
+            return not_modified(headers)
+
+        try:
+            if size == DerivativeSize.ORIGINAL:
+                storage_path = image_path
+            else:
+                storage_path = await storage.get_derivative(image_path, size, format)
+            return stored_image_response(storage, storage_path, headers)
+
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail="image not available"
+            ) from e
             
 
             
@@ -26,11 +26,15 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.orm.exc import NoResultFound
 
 from api.dependency.basic_auth import BasicAuthRoute, get_current_username
+from api.dependency.body_limit import MULTIPART_OVERHEAD, BodyLimitRoute
 from bird_classifier.classifier import Classifier
+from database.loading import LoadProfile, load_options
 from database.model import BirdSnap, BirdSnapImage, BirdSnapStatus, Device
 from database.util import DBUtil
 from schema.response import ResponseStatus, StatusResponse
-from storage.storage import BadFileTypeError, Storage
+from storage.derivative import DerivativeFormat, DerivativeSize
+from storage.storage import BadFileTypeError, FileTooLargeError, Storage, UnknownImagePathError
+from storage.upload import store_upload
 
 
 def CreateUploadEndpoint(
@@ -41,7 +45,10 @@ def CreateUploadEndpoint(
     classifier:Classifier,
 ):
     router = APIRouter(
-        route_class=BasicAuthRoute(sessionmaker, db_util)
+        route_class=BodyLimitRoute(
+            BasicAuthRoute(sessionmaker, db_util),
+            storage.max_file_size + MULTIPART_OVERHEAD,
+        )
     )
     @router.post(
         path="/snap/upload",
@@ -61,72 +68,73 @@ def CreateUploadEndpoint(
             include_in_schema=False,
         ),
     ) -> StatusResponse:
-        async with sessionmaker() as session:
-
-            # Set snap time
-            if snap_time is None:
-                snap_time = datetime.datetime.now()
-
-            # save file
-            try:
-                storage_path = storage.save_birdsnapimage(
-                    device_id,
-                    image.file,
-                    snap_time,
-                )
-            except BadFileTypeError as e:
-                raise HTTPException(
-                    status_code=415, detail="only supports jpeg and png"
-                ) from e
+        # Set snap time
+        if snap_time is None:
+            snap_time = datetime.datetime.now()
 
+        # before saving, files of requests failing here would never be collected
+        async with sessionmaker() as session:
             try:
                 device = (
-                    await session.execute(select(Device).where(Device.id == device_id))
-                ).scalar_one()
+                    await session.execute(
+                        select(Device.id, Device.public_by_default).where(Device.id == device_id)
+                    )
+                ).one()
             except NoResultFound as e:
                 raise HTTPException(status_code=415, detail="unknown device") from e
 
-            # create db entry
-            birdsnap = BirdSnap(
-                is_public=device.public_by_default,
-                status=BirdSnapStatus.PROCESSING,
-                device_id=device.id,
-                snap_time=snap_time,
-            )
-            session.add(birdsnap)
-            await session.commit()
-            await session.refresh(birdsnap)
-
-            birdsnapimage = BirdSnapImage(birdsnap_id=birdsnap.id, path=storage_path)
-            session.add(birdsnapimage)
-            await session.commit()
-            await session.refresh(birdsnapimage)
-
-            background_tasks.add_task(process_birdsnap, birdsnapimage.id)
-
-            return StatusResponse(
-                status=ResponseStatus.OK,
-                details="birdsnap processing scheduled",
-            )
+        try:
+            async with store_upload(sessionmaker, storage, image) as (session, blob_path):
+                # create db entry
+                birdsnap = BirdSnap(
+                    is_public=device.public_by_default,
+                    status=BirdSnapStatus.PROCESSING,
+                    device_id=device.id,
+                    snap_time=snap_time,
+                )
+                session.add(birdsnap)
+                await session.flush()
+
+                birdsnapimage = BirdSnapImage(birdsnap_id=birdsnap.id, path=blob_path)
+                session.add(birdsnapimage)
+                await session.flush()
+                image_id = birdsnapimage.id
+        except BadFileTypeError as e:
+            raise HTTPException(
+                status_code=415, detail="only supports jpeg and png"
+            ) from e
+        except FileTooLargeError as e:
+            raise HTTPException(
+                status_code=413, detail=f"image larger than {storage.max_file_size} bytes"
+            ) from e
+
+        background_tasks.add_task(process_birdsnap, image_id)
+
+        return StatusResponse(
+            status=ResponseStatus.OK,
+            details="birdsnap processing scheduled",
+        )
     app.include_router(router)
 
     async def process_birdsnap(image_id: int):
         async with sessionmaker() as session:
             birdsnapimage = (
-                await session.execute(select(BirdSnapImage).where(BirdSnapImage.id == image_id))
+                await session.execute(
+                    select(BirdSnapImage).where(
+                        BirdSnapImage.id == image_id
+                    ).options(*load_options(LoadProfile.IMAGE_PROCESSING))
+                )
             ).scalar_one()
             birdsnap = birdsnapimage.birdsnap
 
             try:
-                storage_path = storage.get_birdsnapimage(birdsnapimage.path)
-            except Exception:
+                async with storage.open_birdsnapimage(birdsnapimage.path) as storage_path:
+                    bird_species = classifier(storage_path)
+            except UnknownImagePathError:
                 logging.error(f"unable to get storage path for image with id:{birdsnapimage.id}")
                 # cleanup
                 birdsnap.status = BirdSnapStatus.DELETED
                 return
-            
-            try:
-                bird_species = classifier(storage_path)
             except Exception as e:
                 # in case of an error
                 # set image as available
@@ -140,6 +148,14 @@ def CreateUploadEndpoint(
                 birdsnap.bird_species = bird_species
                 birdsnap.status = BirdSnapStatus.AVAILABLE
                 await session.commit()
+                db_util.feed_cache.invalidate()
+
+                # sizes the feed asks for, anything else is rendered on first request
+                for size in (DerivativeSize.THUMB, DerivativeSize.MEDIUM):
+                    try:
+                        await storage.get_derivative(birdsnapimage.path, size, DerivativeFormat.WEBP)
+                    except Exception as e:
+                        logging.error(f"unable to render {size.value} for image with id:{birdsnapimage.id}", exc_info=e)
                 return
             
             else:
@@ -54,9 +54,11 @@ def CreateCreateUserEndpoint(
         tags=["user"],
     )
     async def create(body: CreateUserRequestBody) -> StatusResponse:
+        password_hash = await db_util.hash(body.password)
+
         async with sessionmaker() as session:
             user = User(
-                password_hash=db_util.hash_func(body.password),
+                password_hash=password_hash,
                 name=body.name,
                 email=body.email,
             )
@@ -0,0 +1,81 @@
+"""
+p99 latency of /snap/get-all while other clients keep the password hashing pool busy
+
+runs against a live api, the user has to exist:
+
+    python bench/hash_load.py --url http://localhost:8000 --user alice --password secret
+
+the hash load logs in with a wrong password, those attempts are never cached and always
+reach bcrypt, 503s from a saturated pool are counted separately
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+import httpx
+
+
+async def feed_latencies(client: httpx.AsyncClient, auth: httpx.BasicAuth, duration: float, concurrency: int) -> List[float]:
+    latencies = []
+    deadline = time.monotonic() + duration
+
+    async def reader() -> None:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = await client.get("/snap/get-all", auth=auth)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    await asyncio.gather(*(reader() for _ in range(concurrency)))
+    return latencies
+
+
+async def hash_load(client: httpx.AsyncClient, user: str, stop: asyncio.Event, concurrency: int, counts: dict) -> None:
+    auth = httpx.BasicAuth(user, "wrong password")
+
+    async def attacker() -> None:
+        while not stop.is_set():
+            response = await client.get("/snap/get-all", auth=auth)
+            counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*(attacker() for _ in range(concurrency)))
+
+
+def report(name: str, latencies: List[float]) -> None:
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:>10}: {len(latencies)} requests, p50 {quantiles[49] * 1000:.1f} ms, "
+        f"p95 {quantiles[94] * 1000:.1f} ms, p99 {quantiles[98] * 1000:.1f} ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    auth = httpx.BasicAuth(args.user, args.password)
+    limits = httpx.Limits(max_connections=args.readers + args.hashers)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        # fills the credential cache of the reader
+        (await client.get("/snap/get-all", auth=auth)).raise_for_status()
+
+        report("idle", await feed_latencies(client, auth, args.duration, args.readers))
+
+        stop = asyncio.Event()
+        counts: dict = {}
+        load = asyncio.create_task(hash_load(client, args.user, stop, args.hashers, counts))
+        latencies = await feed_latencies(client, auth, args.duration, args.readers)
+        stop.set()
+        await load
+        report("hash load", latencies)
+        print(f"hash load responses: {dict(sorted(counts.items()))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--readers", type=int, default=8, help="concurrent feed clients")
+    parser.add_argument("--hashers", type=int, default=32, help="concurrent wrong password clients")
+    asyncio.run(main(parser.parse_args()))
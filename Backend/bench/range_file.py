@@ -0,0 +1,86 @@
+"""
+throughput of stored image responses, starlette's FileResponse against RangeFileResponse
+
+serves a random file through uvicorn on localhost and downloads it with concurrent clients:
+
+    python -m bench.range_file --size 8 --requests 40 --concurrency 8
+
+the zero copy path needs a server offering http.response.zerocopysend, uvicorn does not,
+so RangeFileResponse is measured with its pread fallback
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import FileResponse
+from starlette.routing import Route
+
+from api.response.file import RangeFileResponse
+
+
+async def throughput(url: str, requests: int, concurrency: int, headers: Optional[Dict[str, str]] = None) -> float:
+    received = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=60) as client:
+
+        async def download() -> None:
+            nonlocal received
+            async with semaphore:
+                response = await client.get(url, headers=headers)
+                response.raise_for_status()
+                received += len(response.content)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(download() for _ in range(requests)))
+        return received / (time.perf_counter() - started) / 1e6
+
+
+def serve(app: Starlette, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def main(args: argparse.Namespace) -> None:
+    with tempfile.NamedTemporaryFile(suffix=".jpeg") as file:
+        file.write(os.urandom(args.size << 20))
+        file.flush()
+
+        app = Starlette(routes=[
+            Route("/file", lambda request: FileResponse(file.name, media_type="image/jpeg")),
+            Route("/range", lambda request: RangeFileResponse(file.name, media_type="image/jpeg")),
+        ])
+        server = serve(app, args.port)
+        base = f"http://127.0.0.1:{args.port}"
+        try:
+            for run in range(args.repeat):
+                for name, url, headers in (
+                    ("FileResponse", f"{base}/file", None),
+                    ("RangeFileResponse", f"{base}/range", None),
+                    # a resumed download of the last MiB
+                    ("RangeFileResponse, tail range", f"{base}/range", {"Range": "bytes=-1048576"}),
+                ):
+                    rate = asyncio.run(throughput(url, args.requests, args.concurrency, headers))
+                    print(f"run {run + 1}, {name:>29}: {rate:.0f} MB/s")
+        finally:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=8, help="file size in MiB")
+    parser.add_argument("--requests", type=int, default=40, help="downloads per measurement")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--repeat", type=int, default=2, help="runs of every measurement")
+    parser.add_argument("--port", type=int, default=8765)
+    main(parser.parse_args())
@@ -0,0 +1,9 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class CacheConfig:
+    feed_cache_ttl: float = 30.0
+    feed_cache_size: int = 256
+    # seconds, stored images never change
+    image_max_age: int = 86400
@@ -1,7 +1,12 @@
 import os
 from dataclasses import dataclass
+from typing import Dict
 
+from config.cache import CacheConfig
 from config.database import DBConfig
+from config.gc import GCConfig
+from config.like import LikeConfig
+from config.pagination import PaginationConfig
 from config.roboflow import RoboflowConfig
 from config.security import SecurityConfig
 from config.storage import StorageConfig
@@ -14,6 +19,10 @@ class Config:
     roboflow: RoboflowConfig
     storage: StorageConfig
     security: SecurityConfig
+    pagination: PaginationConfig
+    like: LikeConfig
+    cache: CacheConfig
+    gc: GCConfig
     
 
 
@@ -26,14 +35,79 @@ def get_config() -> Config:
             host=os.environ["DBHOST"],
             port=int(os.environ["DBPORT"]),
             db=os.environ["DBNAME"],
+            pool_size=int(os.environ.get("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+            pool_recycle=int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+            pool_pre_ping=os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+            statement_cache_size=int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "100")),
+            replica_host=os.environ.get("DBREPLICAHOST"),
+            replica_port=int(os.environ["DBREPLICAPORT"]) if "DBREPLICAPORT" in os.environ else None,
         ),
         roboflow=RoboflowConfig(
             url=os.environ["ROBOFLOW_URL"],
             key=os.environ["ROBOFLOW_KEY"],
             treshold=float(os.environ.get("ROBOFLOW_TRESHOLD","0.15"))
         ),
-        storage=StorageConfig(path=os.environ["STORAGEPATH"]),
+        storage=StorageConfig(
+            path=os.environ["STORAGEPATH"],
+            max_file_size=int(os.environ.get("MAX_FILE_SIZE", str(10 * 1024 * 1024))),
+            date_dirs=os.environ.get("STORAGE_DATE_DIRS", "false").lower() in ("1", "true", "yes"),
+            hash_depth=int(os.environ.get("STORAGE_HASH_DEPTH", "2")),
+            image_workers=int(os.environ.get("IMAGE_WORKERS", "2")),
+            strip_metadata=os.environ.get("STRIP_IMAGE_METADATA", "false").lower() in ("1", "true", "yes"),
+            backend=os.environ.get("STORAGE_BACKEND", "filesystem").lower(),
+            s3_bucket=os.environ.get("S3_BUCKET"),
+            s3_prefix=os.environ.get("S3_PREFIX", ""),
+            s3_endpoint_url=os.environ.get("S3_ENDPOINT_URL"),
+            s3_region=os.environ.get("S3_REGION"),
+            s3_access_key=os.environ.get("S3_ACCESS_KEY"),
+            s3_secret_key=os.environ.get("S3_SECRET_KEY"),
+            presign_ttl=int(os.environ.get("S3_PRESIGN_TTL", "300")),
+            archive_after_days=float(os.environ.get("ARCHIVE_AFTER_DAYS", "90")),
+            bundle_size=int(os.environ.get("BUNDLE_SIZE", str(256 * 1024 * 1024))),
+        ),
         security=SecurityConfig(
             password_salt=os.environ["PASSWORDSALT"],
-        )
+            token_secret=os.environ["TOKENSECRET"],
+            credential_cache_ttl=float(os.environ.get("CREDENTIAL_CACHE_TTL", "300")),
+            credential_cache_size=int(os.environ.get("CREDENTIAL_CACHE_SIZE", "1024")),
+            hash_workers=int(os.environ.get("HASH_WORKERS", "2")),
+            hash_queue_depth=int(os.environ.get("HASH_QUEUE_DEPTH", "32")),
+            token_ttl=int(os.environ.get("TOKEN_TTL", "3600")),
+            token_epoch_ttl=float(os.environ.get("TOKEN_EPOCH_TTL", "60")),
+            image_url_ttl=int(os.environ.get("IMAGE_URL_TTL", "3600")),
+        ),
+        pagination=PaginationConfig(
+            default_page_size=int(os.environ.get("DEFAULT_PAGE_SIZE", "50")),
+            max_page_size=int(os.environ.get("MAX_PAGE_SIZE", "200")),
+        ),
+        like=LikeConfig(
+            max_batch_size=int(os.environ.get("MAX_LIKE_BATCH_SIZE", "500")),
+        ),
+        cache=CacheConfig(
+            feed_cache_ttl=float(os.environ.get("FEED_CACHE_TTL", "30")),
+            feed_cache_size=int(os.environ.get("FEED_CACHE_SIZE", "256")),
+            image_max_age=int(os.environ.get("IMAGE_MAX_AGE", "86400")),
+        ),
+        gc=GCConfig(
+            retention_days=_parse_retention(
+                os.environ.get("GC_RETENTION", "NO_BIRD_DETECTED=7,CLASSIFICATION_FAILED=30,DELETED=1")
+            ),
+            keep_test_images=int(os.environ.get("GC_KEEP_TEST_IMAGES", "1")),
+            grace=float(os.environ.get("GC_GRACE", "3600")),
+            batch_size=int(os.environ.get("GC_BATCH_SIZE", "500")),
+            rate=float(os.environ.get("GC_RATE", "1000")),
+        ),
     )
+
+
+def _parse_retention(value: str) -> Dict[str, float]:
+    # STATUS=days pairs separated by commas
+    retention = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        status, _, days = entry.partition("=")
+        retention[status.strip().upper()] = float(days)
+    return retention
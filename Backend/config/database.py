@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
@@ -8,3 +9,16 @@ class DBConfig:
     host: str
     port: int
     db: str
+
+    # connection pool, per engine
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    # 0 disables prepared statement caching, needed behind pgbouncer in transaction mode
+    statement_cache_size: int = 100
+
+    # optional read replica for read only endpoints
+    replica_host: Optional[str] = None
+    replica_port: Optional[int] = None
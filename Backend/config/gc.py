@@ -0,0 +1,19 @@
+from dataclasses import dataclass, field
+from typing import Dict
+
+
+@dataclass
+class GCConfig:
+    # days snaps are kept after they got the status, statuses not listed are never collected
+    retention_days: Dict[str, float] = field(default_factory=lambda: {
+        "NO_BIRD_DETECTED": 7.0,
+        "CLASSIFICATION_FAILED": 30.0,
+        "DELETED": 1.0,
+    })
+    # newest test images kept per device
+    keep_test_images: int = 1
+    # seconds, files written more recently are never removed
+    grace: float = 3600.0
+    batch_size: int = 500
+    # rows deleted per second
+    rate: float = 1000.0
@@ -0,0 +1,6 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class LikeConfig:
+    max_batch_size: int = 500
@@ -0,0 +1,7 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class PaginationConfig:
+    default_page_size: int = 50
+    max_page_size: int = 200
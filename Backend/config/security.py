@@ -1,7 +1,15 @@
 from dataclasses import dataclass
-from typing import Optional
 
 
 @dataclass
 class SecurityConfig:
     password_salt: str
+    token_secret: str
+    credential_cache_ttl: float = 300.0
+    credential_cache_size: int = 1024
+    hash_workers: int = 2
+    hash_queue_depth: int = 32
+    token_ttl: int = 3600
+    token_epoch_ttl: float = 60.0
+    # seconds signed image urls stay valid, at least half of it
+    image_url_ttl: int = 3600
@@ -1,6 +1,32 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
 class StorageConfig:
     path: str
+    # bytes
+    max_file_size: int = 10 * 1024 * 1024
+    # blob layout, see storage.layout.StorageLayout
+    date_dirs: bool = False
+    hash_depth: int = 2
+    # threads rendering derivatives and reencoding originals
+    image_workers: int = 2
+    # reencode uploads without exif, it may contain the owner's location
+    strip_metadata: bool = False
+    # "filesystem" keeps files below path, "s3" in an s3 compatible bucket
+    backend: str = "filesystem"
+    s3_bucket: Optional[str] = None
+    s3_prefix: str = ""
+    # for self hosted stand-ins like minio
+    s3_endpoint_url: Optional[str] = None
+    s3_region: Optional[str] = None
+    # boto3's default credential chain when unset
+    s3_access_key: Optional[str] = None
+    s3_secret_key: Optional[str] = None
+    # seconds presigned image urls stay valid
+    presign_ttl: int = 300
+    # blobs older than this are packed into per device bundles by pack-storage
+    archive_after_days: float = 90
+    # bytes per bundle, the last one of a device may be smaller
+    bundle_size: int = 256 * 1024 * 1024
@@ -0,0 +1,61 @@
+import logging
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database.geo import encode_geohash
+from database.model import BirdSnap, Device
+
+
+async def backfill_like_count(engine: AsyncEngine, batch_size: int = 1000) -> None:
+    async with engine.connect() as conn:
+        max_id = (await conn.execute(select(func.max(BirdSnap.id)))).scalar_one()
+
+    if max_id is None:
+        return
+
+    # one short transaction per id range
+    for lower in range(0, max_id, batch_size):
+        upper = lower + batch_size
+        async with engine.begin() as conn:
+            # likes committing between the count and the update would be lost, locking the rows
+            # first makes them wait and add to the backfilled count afterwards
+            await conn.execute(text(
+                "SELECT id FROM birdsnap WHERE id > :lower AND id <= :upper ORDER BY id FOR UPDATE"
+            ), {"lower": lower, "upper": upper})
+            await conn.execute(text(
+                "UPDATE birdsnap SET like_count = counts.likes "
+                "FROM ("
+                "  SELECT birdsnap.id, count(birdsnaplike.id) AS likes FROM birdsnap"
+                "  LEFT JOIN birdsnaplike ON birdsnaplike.birdsnap_id = birdsnap.id"
+                "  WHERE birdsnap.id > :lower AND birdsnap.id <= :upper"
+                "  GROUP BY birdsnap.id"
+                ") AS counts "
+                "WHERE birdsnap.id = counts.id AND birdsnap.like_count IS DISTINCT FROM counts.likes"
+            ), {"lower": lower, "upper": upper})
+        logging.info(f"like counts updated up to birdsnap id {min(upper, max_id)}")
+
+
+async def backfill_device_geohash(engine: AsyncEngine, batch_size: int = 1000) -> None:
+    while True:
+        async with engine.begin() as conn:
+            devices = (await conn.execute(
+                select(Device.id, Device.latitude, Device.longitude).where(
+                    Device.geohash == None
+                ).where(
+                    Device.latitude != None
+                ).where(
+                    Device.longitude != None
+                ).limit(batch_size)
+            )).all()
+
+            for device_id, latitude, longitude in devices:
+                await conn.execute(
+                    update(Device).where(
+                        Device.id == device_id
+                    ).values(geohash=encode_geohash(latitude, longitude))
+                )
+
+        logging.info(f"geohash set for {len(devices)} devices")
+        if len(devices) < batch_size:
+            return
@@ -0,0 +1,62 @@
+from collections import Counter
+from typing import Iterable, List
+
+from sqlalchemy import Integer, String, column, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.model import StorageBlob
+from storage.storage import StoredBlob
+
+
+async def reference_blob(session: AsyncSession, blob: StoredBlob, count: int = 1) -> str:
+    """
+    counts the new references to the blob, part of the transaction that stores the image rows
+
+    returns the path rows have to use, an existing blob with the same digest keeps its path
+    """
+    insert_blob = insert(StorageBlob).values(
+        digest=blob.digest,
+        path=blob.path,
+        size=blob.size,
+        ref_count=count,
+        creation_time=blob.created,
+    )
+    return (await session.execute(
+        insert_blob.on_conflict_do_update(
+            index_elements=[StorageBlob.digest],
+            set_={"ref_count": StorageBlob.ref_count + count},
+        ).returning(StorageBlob.path)
+    )).scalar_one()
+
+
+async def abandon_blob(session: AsyncSession, blob: StoredBlob) -> str:
+    """
+    records a saved blob without references, for uploads failing before their rows are stored
+
+    the collector removes it once its grace is over, returns the path of the blob row
+    """
+    return await reference_blob(session, blob, count=0)
+
+
+async def release_blobs(session: AsyncSession, paths: Iterable[str]) -> List[str]:
+    """
+    counts removed references, part of the transaction that deletes the image rows
+
+    blobs reaching zero are left for the collector, returns the paths without a blob (files saved before blobs)
+    """
+    counts = Counter(paths)
+    if not counts:
+        return []
+
+    released = values(
+        column("path", String), column("count", Integer), name="released"
+    ).data(list(counts.items()))
+    found = set((await session.execute(
+        update(StorageBlob).where(
+            StorageBlob.path == released.c.path
+        ).values(
+            ref_count=StorageBlob.ref_count - released.c.count
+        ).returning(StorageBlob.path)
+    )).scalars().all())
+    return [path for path in counts if path not in found]
@@ -0,0 +1,96 @@
+import hashlib
+import hmac
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set
+
+
+@dataclass(frozen=True)
+class CachedCredential:
+    user_id: int
+    username: str
+    expires_at: float
+
+
+class CredentialCache:
+    """
+    in-process cache of verified (username, password) pairs
+
+    entries are keyed on a keyed digest, the plain password is never stored
+    """
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._key = secrets.token_bytes(32)
+        self._entries: OrderedDict[bytes, CachedCredential] = OrderedDict()
+        self._digests_by_username: Dict[str, Set[bytes]] = {}
+
+    def _digest(self, username: str, password: str) -> bytes:
+        username_bytes = username.encode("utf-8")
+        message = len(username_bytes).to_bytes(4, "big") + username_bytes + password.encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def get(self, username: str, password: str) -> Optional[CachedCredential]:
+        if self.max_size <= 0:
+            self.misses += 1
+            return None
+
+        digest = self._digest(username, password)
+        entry = self._entries.get(digest)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry.expires_at <= time.monotonic():
+            self._remove(digest)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return entry
+
+    def put(self, username: str, password: str, user_id: int) -> None:
+        if self.max_size <= 0:
+            return
+
+        digest = self._digest(username, password)
+        self._entries[digest] = CachedCredential(
+            user_id=user_id,
+            username=username,
+            expires_at=time.monotonic() + self.ttl,
+        )
+        self._entries.move_to_end(digest)
+        self._digests_by_username.setdefault(username, set()).add(digest)
+
+        # lru eviction
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def invalidate(self, username: str) -> None:
+        for digest in self._digests_by_username.pop(username, set()):
+            self._entries.pop(digest, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._digests_by_username.clear()
+
+    def _remove(self, digest: bytes) -> None:
+        entry = self._entries.pop(digest, None)
+        if entry is None:
+            return
+        digests = self._digests_by_username.get(entry.username)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._digests_by_username[entry.username]
+
+    def __len__(self) -> int:
+        return len(self._entries)
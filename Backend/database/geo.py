@@ -0,0 +1,110 @@
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# stored precision, about 3.7cm x 1.9cm per cell
+GEOHASH_PRECISION = 12
+
+EARTH_RADIUS = 6_371_000.0
+
+
+@dataclass(frozen=True)
+class BoundingBox:
+    min_latitude: float
+    min_longitude: float
+    max_latitude: float
+    max_longitude: float
+
+
+@dataclass(frozen=True)
+class Circle:
+    latitude: float
+    longitude: float
+    # meters
+    radius: float
+
+    def bounding_box(self) -> BoundingBox:
+        delta_latitude = math.degrees(self.radius / EARTH_RADIUS)
+        min_latitude = max(self.latitude - delta_latitude, -90.0)
+        max_latitude = min(self.latitude + delta_latitude, 90.0)
+
+        # the box gets wider towards the poles, near them it spans every longitude
+        widest = max(abs(min_latitude), abs(max_latitude))
+        if widest >= 90.0:
+            return BoundingBox(min_latitude, -180.0, max_latitude, 180.0)
+        delta_longitude = math.degrees(self.radius / (EARTH_RADIUS * math.cos(math.radians(widest))))
+        return BoundingBox(
+            min_latitude,
+            max(self.longitude - delta_longitude, -180.0),
+            max_latitude,
+            min(self.longitude + delta_longitude, 180.0),
+        )
+
+
+def encode_geohash(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(geohash) < precision:
+        # bits alternate between longitude and latitude, starting with longitude
+        value, interval = (longitude, longitude_range) if even else (latitude, latitude_range)
+        middle = (interval[0] + interval[1]) / 2
+        if value >= middle:
+            bits = (bits << 1) | 1
+            interval[0] = middle
+        else:
+            bits = bits << 1
+            interval[1] = middle
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(geohash)
+
+
+def geohash_or_none(latitude: Optional[float], longitude: Optional[float]) -> Optional[str]:
+    if latitude is None or longitude is None:
+        return None
+    return encode_geohash(latitude, longitude)
+
+
+def _cell_size(precision: int) -> Tuple[float, float]:
+    # height and width in degrees of a cell
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_cells(box: BoundingBox, max_cells: int = 32) -> List[str]:
+    """
+    geohash prefixes whose cells together cover the box, as fine as max_cells allows
+    """
+    cells = [""]
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = _cell_size(precision)
+        rows = math.floor((box.max_latitude + 90.0) / height) - math.floor((box.min_latitude + 90.0) / height) + 1
+        columns = math.floor((box.max_longitude + 180.0) / width) - math.floor((box.min_longitude + 180.0) / width) + 1
+        if rows * columns > max_cells:
+            break
+
+        found = set()
+        # sample the centre of every cell the box touches
+        first_row = math.floor((box.min_latitude + 90.0) / height)
+        first_column = math.floor((box.min_longitude + 180.0) / width)
+        for row in range(first_row, first_row + rows):
+            for column in range(first_column, first_column + columns):
+                latitude = min(-90.0 + (row + 0.5) * height, 90.0)
+                longitude = min(-180.0 + (column + 0.5) * width, 180.0)
+                found.add(encode_geohash(latitude, longitude, precision))
+        cells = sorted(found)
+
+    return cells
@@ -0,0 +1,53 @@
+import enum
+from typing import Dict, Sequence
+
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from sqlalchemy.orm.interfaces import ORMOption
+
+from database.model import BirdSnap, BirdSnapImage, Device, User
+
+
+class LoadProfile(str, enum.Enum):
+    # snap rows of a feed page
+    FEED_ITEM = "feed_item"
+    # a single snap with everything the detail view shows
+    SNAP_DETAIL = "snap_detail"
+    # a snap with its device, enough to check visibility
+    SNAP_ACCESS = "snap_access"
+    # an image with its snap and device, enough to check visibility
+    IMAGE_ACCESS = "image_access"
+    # an image with its snap, used while classifying
+    IMAGE_PROCESSING = "image_processing"
+    # a user with the columns basic auth compares, nothing else
+    AUTH = "auth"
+
+
+# relationships are not loaded by default (see database/model.py),
+# every query picks the profile it needs
+_profiles: Dict[LoadProfile, Sequence[ORMOption]] = {
+    LoadProfile.FEED_ITEM: (
+        joinedload(BirdSnap.device).joinedload(Device.owner),
+        selectinload(BirdSnap.images),
+    ),
+    LoadProfile.SNAP_DETAIL: (
+        joinedload(BirdSnap.device).joinedload(Device.owner),
+        selectinload(BirdSnap.images),
+        selectinload(BirdSnap.users_liked),
+    ),
+    LoadProfile.SNAP_ACCESS: (
+        joinedload(BirdSnap.device),
+    ),
+    LoadProfile.IMAGE_ACCESS: (
+        joinedload(BirdSnapImage.birdsnap).joinedload(BirdSnap.device),
+    ),
+    LoadProfile.IMAGE_PROCESSING: (
+        joinedload(BirdSnapImage.birdsnap),
+    ),
+    LoadProfile.AUTH: (
+        load_only(User.id, User.name, User.password_hash),
+    ),
+}
+
+
+def load_options(profile: LoadProfile) -> Sequence[ORMOption]:
+    return _profiles[profile]
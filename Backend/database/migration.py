@@ -0,0 +1,216 @@
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Set
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    select,
+    text,
+)
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+# arbitrary key, only one migration run at a time
+_LOCK_ID = 7_151_942
+
+_metadata = MetaData()
+
+schema_migration = Table(
+    "schema_migration",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+class PendingMigrationsError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    statements: Sequence[str]
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction
+    concurrently: bool = False
+    # skipped if this index already exists and is valid
+    index: Optional[str] = None
+
+
+def _create_index_concurrently(version: int, name: str, definition: str, unique: bool = False) -> Migration:
+    return Migration(
+        version=version,
+        description=f"index {name}",
+        statements=[
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY {name} ON {definition}",
+        ],
+        concurrently=True,
+        index=name,
+    )
+
+
+# append only, a fresh database created by create_all is stamped with all of them
+MIGRATIONS: List[Migration] = [
+    Migration(
+        version=1,
+        description="user token epoch",
+        statements=[
+            'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS token_epoch INTEGER NOT NULL DEFAULT 0',
+        ],
+    ),
+    Migration(
+        version=2,
+        description="birdsnap like counter",
+        statements=[
+            "ALTER TABLE birdsnap ADD COLUMN IF NOT EXISTS like_count INTEGER NOT NULL DEFAULT 0",
+        ],
+    ),
+    Migration(
+        version=3,
+        description="remove duplicate likes",
+        statements=[
+            "DELETE FROM birdsnaplike a USING birdsnaplike b "
+            "WHERE a.birdsnap_id = b.birdsnap_id AND a.user_id = b.user_id AND a.id > b.id",
+        ],
+    ),
+    _create_index_concurrently(
+        4,
+        "uq_birdsnaplike_birdsnap_id_user_id",
+        "birdsnaplike (birdsnap_id, user_id)",
+        unique=True,
+    ),
+    _create_index_concurrently(5, "ix_birdsnap_device_id", "birdsnap (device_id)"),
+    _create_index_concurrently(
+        6,
+        "ix_birdsnap_status_is_public_snap_time",
+        "birdsnap (status, is_public, snap_time, id)",
+    ),
+    _create_index_concurrently(7, "ix_birdsnap_bird_species", "birdsnap USING gin (bird_species)"),
+    _create_index_concurrently(8, "ix_birdsnapimage_birdsnap_id", "birdsnapimage (birdsnap_id)"),
+    _create_index_concurrently(
+        9,
+        "ix_testimage_device_id_creation_time",
+        "testimage (device_id, creation_time)",
+    ),
+    _create_index_concurrently(10, "ix_device_owner_id", "device (owner_id)"),
+    Migration(
+        version=11,
+        description="device geohash",
+        statements=[
+            'ALTER TABLE device ADD COLUMN IF NOT EXISTS geohash VARCHAR(12) COLLATE "C"',
+        ],
+    ),
+    _create_index_concurrently(12, "ix_device_geohash", "device (geohash)"),
+    Migration(
+        version=13,
+        description="content addressed storage blobs",
+        statements=[
+            "CREATE TABLE IF NOT EXISTS storageblob ("
+            " digest VARCHAR(64) NOT NULL,"
+            " path VARCHAR NOT NULL,"
+            " size BIGINT NOT NULL,"
+            " ref_count INTEGER DEFAULT '0' NOT NULL,"
+            " creation_time TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,"
+            " PRIMARY KEY (digest),"
+            " UNIQUE (path)"
+            ")",
+        ],
+    ),
+    Migration(
+        version=14,
+        description="birdsnap status time",
+        statements=[
+            # existing snaps count their retention from the upgrade on
+            "ALTER TABLE birdsnap ADD COLUMN IF NOT EXISTS status_time TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()",
+        ],
+    ),
+]
+
+
+async def create_migration_table(conn: AsyncConnection) -> None:
+    await conn.run_sync(_metadata.create_all)
+
+
+async def stamp(conn: AsyncConnection) -> None:
+    applied = await _applied_versions(conn)
+    for migration in MIGRATIONS:
+        if migration.version not in applied:
+            await _record(conn, migration)
+
+
+async def lock_migrations(conn: AsyncConnection) -> None:
+    # held until the transaction ends, waits for a running migrate
+    await conn.execute(text(f"SELECT pg_advisory_xact_lock({_LOCK_ID})"))
+
+
+async def pending_migrations(engine: AsyncEngine) -> List[Migration]:
+    async with engine.begin() as conn:
+        await create_migration_table(conn)
+        applied = await _applied_versions(conn)
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+async def migrate(engine: AsyncEngine) -> None:
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        await lock_conn.execute(text(f"SELECT pg_advisory_lock({_LOCK_ID})"))
+        try:
+            for migration in await pending_migrations(engine):
+                logging.info(f"applying migration {migration.version}: {migration.description}")
+                await _apply(engine, migration)
+        finally:
+            await lock_conn.execute(text(f"SELECT pg_advisory_unlock({_LOCK_ID})"))
+
+
+async def _apply(engine: AsyncEngine, migration: Migration) -> None:
+    if migration.concurrently:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            is_valid = await _index_state(conn, migration.index) if migration.index is not None else None
+
+            if is_valid is False:
+                # left behind by a failed concurrent build
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY {migration.index}"))
+
+            if not is_valid:
+                for statement in migration.statements:
+                    await conn.execute(text(statement))
+
+        async with engine.begin() as conn:
+            await _record(conn, migration)
+    else:
+        async with engine.begin() as conn:
+            for statement in migration.statements:
+                await conn.execute(text(statement))
+            await _record(conn, migration)
+
+
+async def _record(conn: AsyncConnection, migration: Migration) -> None:
+    await conn.execute(insert(schema_migration).values(
+        version=migration.version,
+        description=migration.description,
+    ))
+
+
+async def _index_state(conn: AsyncConnection, name: str) -> Optional[bool]:
+    # None if the index does not exist
+    return (await conn.execute(
+        text(
+            "SELECT pg_index.indisvalid FROM pg_index "
+            "JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+            "WHERE pg_class.relname = :name AND pg_class.relnamespace = current_schema()::regnamespace"
+        ),
+        {"name": name},
+    )).scalar_one_or_none()
+
+
+async def _applied_versions(conn: AsyncConnection) -> Set[int]:
+    return set((await conn.execute(select(schema_migration.c.version))).scalars().all())
@@ -4,17 +4,21 @@ import uuid
 from typing import List, Optional
 
 from sqlalchemy import (
-    ARRAY,
     UUID,
+    BigInteger,
     Boolean,
     DateTime,
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
+    UniqueConstraint,
+    event,
     func,
 )
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
@@ -24,6 +28,9 @@ class Base(DeclarativeBase):
 
 class BirdSnapLike(Base):
     __tablename__ = "birdsnaplike"
+    __table_args__ = (
+        UniqueConstraint("birdsnap_id", "user_id", name="uq_birdsnaplike_birdsnap_id_user_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     birdsnap_id: Mapped[int] = mapped_column(ForeignKey("birdsnap.id"), index=True)
@@ -41,6 +48,7 @@ class User(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     password_hash: Mapped[str] = mapped_column(String)
+    token_epoch: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     name: Mapped[str] = mapped_column(String, unique=True, index=True)
     email: Mapped[str] = mapped_column(String, unique=True)
     creation_time: Mapped[datetime.datetime] = mapped_column(
@@ -50,12 +58,12 @@ class User(Base):
     devices: Mapped[List["Device"]] = relationship(
         back_populates="owner",
         cascade="all, delete-orphan",
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
     likes: Mapped[List["BirdSnap"]] = relationship(
         back_populates="users_liked",
         secondary=BirdSnapLike.__table__,
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
 
     def __repr__(self) -> str:
@@ -71,40 +79,61 @@ class Device(Base):
     id: Mapped[uuid.UUID] = mapped_column(UUID, primary_key=True)
     type: Mapped[DeviceType] = mapped_column(Enum(DeviceType))
     name: Mapped[str] = mapped_column(String)
-    owner_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    owner_id: Mapped[int] = mapped_column(ForeignKey("user.id"), index=True)
     owner: Mapped["User"] = relationship(
         back_populates="devices",
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
 
     is_info_public: Mapped[bool] = mapped_column(Boolean, default=True)
     longitude:Mapped[Optional[float]] = mapped_column(Float)
     latitude:Mapped[Optional[float]] = mapped_column(Float)
+    # derived from latitude and longitude, "C" collation keeps prefix ranges byte ordered
+    geohash:Mapped[Optional[str]] = mapped_column(String(12, collation="C"), index=True)
     
     public_by_default: Mapped[bool] = mapped_column(Boolean, default=True)
     birdsnaps: Mapped[List["BirdSnap"]] = relationship(
         back_populates="device",
         cascade="all, delete-orphan",
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
     testimages: Mapped[List["TestImage"]] = relationship(
         back_populates="device",
         cascade="all, delete-orphan",
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
 
     def __repr__(self) -> str:
         return f"Device(id={self.id}, name={self.name}, owner_id={self.owner_id}, public_by_default={self.public_by_default})"
 
 
+class StorageBlob(Base):
+    __tablename__ = "storageblob"
+
+    # sha256 of the file content
+    digest: Mapped[str] = mapped_column(String(64), primary_key=True)
+    path: Mapped[str] = mapped_column(String, unique=True)
+    size: Mapped[int] = mapped_column(BigInteger)
+    # number of BirdSnapImage and TestImage rows using the file
+    ref_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    creation_time: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=func.now(),
+        server_default=func.now(),
+    )
+
+    def __repr__(self) -> str:
+        return f"StorageBlob(digest={self.digest}, path={self.path}, ref_count={self.ref_count})"
+
+
 class BirdSnapImage(Base):
     __tablename__ = "birdsnapimage"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    birdsnap_id: Mapped[int] = mapped_column(ForeignKey("birdsnap.id"))
+    birdsnap_id: Mapped[int] = mapped_column(ForeignKey("birdsnap.id"), index=True)
     birdsnap: Mapped["BirdSnap"] = relationship(
         back_populates="images",
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
     path: Mapped[str] = mapped_column(String)
 
@@ -113,6 +142,9 @@ class BirdSnapImage(Base):
 
 class TestImage(Base):
     __tablename__ = "testimage"
+    __table_args__ = (
+        Index("ix_testimage_device_id_creation_time", "device_id", "creation_time"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     creation_time: Mapped[datetime.datetime] = mapped_column(
@@ -122,7 +154,7 @@ class TestImage(Base):
     device_id: Mapped[int] = mapped_column(ForeignKey("device.id"))
     device: Mapped["Device"] = relationship(
         back_populates="testimages",
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
     path: Mapped[str] = mapped_column(String)
 
@@ -139,17 +171,28 @@ class BirdSnapStatus(str, enum.Enum):
 
 class BirdSnap(Base):
     __tablename__ = "birdsnap"
+    __table_args__ = (
+        # feed order is (snap_time, id) on available snaps
+        Index("ix_birdsnap_status_is_public_snap_time", "status", "is_public", "snap_time", "id"),
+        Index("ix_birdsnap_bird_species", "bird_species", postgresql_using="gin"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     status: Mapped[BirdSnapStatus] = mapped_column(
         Enum(BirdSnapStatus),
         server_default=BirdSnapStatus.PROCESSING,
     )
+    # last change of status, the collector counts retention from here
+    status_time: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=func.now(),
+        server_default=func.now(),
+    )
     is_public: Mapped[bool] = mapped_column(Boolean)
-    device_id: Mapped[int] = mapped_column(ForeignKey("device.id"))
+    device_id: Mapped[int] = mapped_column(ForeignKey("device.id"), index=True)
     device: Mapped["Device"] = relationship(
         back_populates="birdsnaps",
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
     snap_time: Mapped[datetime.datetime] = mapped_column(
         DateTime(timezone=True),
@@ -158,16 +201,18 @@ class BirdSnap(Base):
     images: Mapped[List["BirdSnapImage"]] = relationship(
         back_populates="birdsnap",
         cascade="all, delete-orphan",
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
     users_liked: Mapped[List["User"]] = relationship(
         back_populates="likes",
         secondary=BirdSnapLike.__table__,
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
     bird_species: Mapped[Optional[List[str]]] = mapped_column(
         ARRAY(String), nullable=True
     )
+    # kept in sync by /like/like and /like/unlike
+    like_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
     @hybrid_property
     def device_owner(self) -> User:
@@ -175,3 +220,10 @@ class BirdSnap(Base):
 
     def __repr__(self) -> str:
         return f"Device(id={self.id}, is_public={self.is_public}, device_id={self.device_id}, snap_time={self.snap_time}, bird_species={self.bird_species})"
+
+
+@event.listens_for(BirdSnap.status, "set")
+def _status_changed(target: BirdSnap, value: BirdSnapStatus, oldvalue, initiator) -> None:
+    # bulk updates bypass this, they have to set status_time themselves
+    if value != oldvalue:
+        target.status_time = datetime.datetime.now(datetime.timezone.utc)
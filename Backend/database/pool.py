@@ -0,0 +1,60 @@
+import bisect
+import time
+from typing import List, Sequence
+
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+
+# seconds
+CHECKOUT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics:
+    """
+    checkout latency histogram and timeouts of one connection pool
+    """
+
+    def __init__(self, buckets: Sequence[float] = CHECKOUT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        # last slot counts checkouts slower than every bucket
+        self.bucket_counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.checkout_count = 0
+        self.checkout_seconds = 0.0
+        self.timeouts = 0
+
+    def observe_checkout(self, seconds: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.checkout_count += 1
+        self.checkout_seconds += seconds
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    queue pool that records how long callers wait for a connection
+    """
+
+    metrics: PoolMetrics
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def capacity(self) -> int:
+        # a negative overflow means unlimited, then only the fixed size is meaningful
+        return self.size() + max(self._max_overflow, 0)
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.observe_checkout(time.perf_counter() - start)
+
+    def recreate(self) -> "TimedAsyncAdaptedQueuePool":
+        # keep the counters when the engine replaces the pool
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
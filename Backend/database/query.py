@@ -0,0 +1,177 @@
+import datetime
+import enum
+from typing import Dict, List, Optional, Union
+
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    String,
+    and_,
+    cast,
+    exists,
+    func,
+    or_,
+    select,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import Label
+
+from database.geo import EARTH_RADIUS, BoundingBox, Circle, covering_cells
+from database.model import BirdSnap, BirdSnapImage, BirdSnapLike, BirdSnapStatus, Device, User
+
+
+class SpeciesMatch(str, enum.Enum):
+    # snap shows every given species
+    ALL = "all"
+    # snap shows at least one of the given species
+    ANY = "any"
+
+
+def distance_to(latitude: float, longitude: float) -> ColumnElement[float]:
+    # haversine distance in meters between the device and the point
+    half_chord = func.power(func.sin(func.radians(Device.latitude - latitude) / 2), 2) + (
+        func.cos(func.radians(latitude))
+        * func.cos(func.radians(Device.latitude))
+        * func.power(func.sin(func.radians(Device.longitude - longitude) / 2), 2)
+    )
+    return 2 * EARTH_RADIUS * func.asin(func.sqrt(func.least(half_chord, 1.0)))
+
+
+def device_area_filters(area: Union[BoundingBox, Circle]) -> List[ColumnElement[bool]]:
+    box = area.bounding_box() if isinstance(area, Circle) else area
+
+    # hidden locations never match a location query
+    filters: List[ColumnElement[bool]] = [Device.is_info_public == True]
+
+    # coarse: geohash prefix ranges, served by the btree index on geohash
+    filters.append(or_(*(
+        and_(Device.geohash >= cell, Device.geohash < cell + "~")
+        for cell in covering_cells(box)
+    )))
+
+    # exact
+    filters.append(Device.latitude.between(box.min_latitude, box.max_latitude))
+    filters.append(Device.longitude.between(box.min_longitude, box.max_longitude))
+    if isinstance(area, Circle):
+        filters.append(distance_to(area.latitude, area.longitude) <= area.radius)
+
+    return filters
+
+
+def feed_filters(
+    viewer_id: int,
+    viewer_name: str,
+    username: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    species: Optional[List[str]] = None,
+    species_match: SpeciesMatch = SpeciesMatch.ALL,
+    area: Optional[Union[BoundingBox, Circle]] = None,
+    until: Optional[datetime.datetime] = None,
+) -> List[ColumnElement[bool]]:
+    # only columns of birdsnap, the feed index covers status, is_public and snap_time
+    filters: List[ColumnElement[bool]] = [BirdSnap.status == BirdSnapStatus.AVAILABLE]
+
+    if username is None:
+        filters.append(BirdSnap.is_public == True)
+    elif username != viewer_name:
+        filters.append(BirdSnap.is_public == True)
+        filters.append(BirdSnap.device_id.in_(
+            select(Device.id).join(Device.owner).where(User.name == username)
+        ))
+    else:
+        filters.append(BirdSnap.device_id.in_(
+            select(Device.id).where(Device.owner_id == viewer_id)
+        ))
+
+    if since is not None:
+        filters.append(BirdSnap.snap_time > since)
+
+    if until is not None:
+        filters.append(BirdSnap.snap_time <= until)
+
+    if species:
+        # array operators are served by the gin index on bird_species
+        species_array = cast(species, ARRAY(String))
+        if species_match == SpeciesMatch.ALL:
+            filters.append(BirdSnap.bird_species.contains(species_array))
+        else:
+            filters.append(BirdSnap.bird_species.overlap(species_array))
+
+    if area is not None:
+        filters.append(BirdSnap.device_id.in_(
+            select(Device.id).where(*device_area_filters(area))
+        ))
+
+    return filters
+
+
+def is_liked_by(user_id: int) -> Label[bool]:
+    # correlated against the birdsnap row of the surrounding query
+    return exists().where(
+        BirdSnapLike.birdsnap_id == BirdSnap.id
+    ).where(
+        BirdSnapLike.user_id == user_id
+    ).label("is_liked")
+
+
+def feed_item_query(viewer_id: Optional[int]) -> Select:
+    # plain columns for the feed, no orm entities, is_liked only with a viewer
+    image_ids = select(
+        func.array_agg(aggregate_order_by(BirdSnapImage.id, BirdSnapImage.id))
+    ).where(
+        BirdSnapImage.birdsnap_id == BirdSnap.id
+    ).scalar_subquery()
+    image_paths = select(
+        func.array_agg(aggregate_order_by(BirdSnapImage.path, BirdSnapImage.id))
+    ).where(
+        BirdSnapImage.birdsnap_id == BirdSnap.id
+    ).scalar_subquery()
+
+    columns = [
+        BirdSnap.id,
+        BirdSnap.snap_time,
+        BirdSnap.is_public,
+        BirdSnap.bird_species,
+        BirdSnap.like_count,
+        Device.id.label("device_id"),
+        Device.name.label("device_name"),
+        Device.is_info_public,
+        Device.latitude,
+        Device.longitude,
+        User.id.label("user_id"),
+        User.name.label("user_name"),
+        image_ids.label("image_ids"),
+        image_paths.label("image_paths"),
+    ]
+    if viewer_id is not None:
+        columns.append(is_liked_by(viewer_id))
+
+    return select(*columns).join(BirdSnap.device).join(Device.owner)
+
+
+async def estimate_count(session: AsyncSession, query: Select) -> int:
+    # planner row estimate, no scan of the matching rows
+    statement = query.compile(
+        dialect=session.bind.dialect,
+        compile_kwargs={"literal_binds": True},
+    )
+    plan = (await session.execute(
+        text(f"EXPLAIN (FORMAT JSON) {statement}")
+    )).scalar_one()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def species_facets(session: AsyncSession, filters: List[ColumnElement[bool]]) -> Dict[str, int]:
+    species = select(
+        func.unnest(BirdSnap.bird_species).label("species")
+    ).where(*filters).subquery()
+
+    rows = (await session.execute(
+        select(species.c.species, func.count()).group_by(
+            species.c.species
+        ).order_by(func.count().desc(), species.c.species)
+    )).all()
+
+    return {name: count for name, count in rows}
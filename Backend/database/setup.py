@@ -1,23 +1,91 @@
 import asyncio
 import urllib
-from typing import Tuple
+from typing import Any, Dict, Tuple
 
+from sqlalchemy import inspect
 from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
                                     async_sessionmaker, create_async_engine)
 
 from config.config import Config
-from database.model import Base
+from database.migration import (
+    PendingMigrationsError,
+    create_migration_table,
+    lock_migrations,
+    pending_migrations,
+    stamp,
+)
+from database.model import Base, BirdSnap
+from database.pool import TimedAsyncAdaptedQueuePool
+
+
+def _create_engine(config: Config, host: str, port: int, **kwargs: Any) -> AsyncEngine:
+    url = f"postgresql+asyncpg://{config.db.user}:{urllib.parse.quote_plus(config.db.password)}@{host}:{port}/{config.db.db}"
+    connect_args: Dict[str, Any] = {
+        # sqlalchemy's cache and the one of asyncpg itself
+        "prepared_statement_cache_size": config.db.statement_cache_size,
+        "statement_cache_size": config.db.statement_cache_size,
+    }
+    return create_async_engine(
+        url,
+        poolclass=TimedAsyncAdaptedQueuePool,
+        pool_size=config.db.pool_size,
+        max_overflow=config.db.max_overflow,
+        pool_timeout=config.db.pool_timeout,
+        pool_recycle=config.db.pool_recycle,
+        pool_pre_ping=config.db.pool_pre_ping,
+        connect_args=connect_args,
+        **kwargs,
+    )
 
 
 def create_engine_sessionmaker(
     config: Config,
 ) -> Tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
-    url = f"postgresql+asyncpg://{config.db.user}:{urllib.parse.quote_plus(config.db.password)}@{config.db.host}:{config.db.port}/{config.db.db}"
-    engine = create_async_engine(url)
+    engine = _create_engine(config, config.db.host, config.db.port)
     sessionmaker = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
     return engine, sessionmaker
 
 
+def create_read_engine_sessionmaker(
+    config: Config,
+    engine: AsyncEngine,
+    sessionmaker: async_sessionmaker[AsyncSession],
+) -> Tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
+    # without a replica reads go to the primary
+    if config.db.replica_host is None:
+        return engine, sessionmaker
+
+    read_engine = _create_engine(
+        config,
+        config.db.replica_host,
+        config.db.replica_port if config.db.replica_port is not None else config.db.port,
+        execution_options={"postgresql_readonly": True},
+    )
+    read_sessionmaker = async_sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+    return read_engine, read_sessionmaker
+
+
 async def create_schema(engine: AsyncEngine) -> None:
+    """
+    builds a new database from the models, an existing one is left to "python manage.py migrate"
+
+    raises PendingMigrationsError while migrations are pending, the models would query columns that do not exist yet
+    """
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        # workers starting together must not all create the schema
+        await lock_migrations(conn)
+        is_new = not await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).has_table(BirdSnap.__tablename__)
+        )
+        await create_migration_table(conn)
+
+        if is_new:
+            # create_all already builds the latest schema
+            await conn.run_sync(Base.metadata.create_all)
+            await stamp(conn)
+
+    pending = await pending_migrations(engine)
+    if pending:
+        raise PendingMigrationsError(
+            f"{len(pending)} database migrations pending, run 'python manage.py migrate'"
+        )
@@ -0,0 +1,189 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+class InvalidTokenError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class TokenClaims:
+    user_id: int
+    username: str
+    epoch: int
+    expires_at: int
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class TokenService:
+    """
+    issues and verifies short-lived hmac signed bearer tokens
+
+    a token is only valid as long as its epoch matches the token epoch of the user,
+    the epochs are cached for epoch_ttl seconds so revocations reach other workers after at most that time,
+    at most max_epochs users are kept, the least recently used are dropped first
+    """
+
+    version = "v1"
+
+    def __init__(self, secret: bytes, ttl: int, epoch_ttl: float, max_epochs: int) -> None:
+        self.ttl = ttl
+        self.epoch_ttl = epoch_ttl
+        self.max_epochs = max_epochs
+        self._secret = secret
+        self._epochs: OrderedDict[int, Tuple[int, float]] = OrderedDict()
+
+    def _sign(self, payload: str) -> str:
+        message = f"{self.version}.{payload}".encode("ascii")
+        return _b64encode(hmac.new(self._secret, message, hashlib.sha256).digest())
+
+    def issue(self, user_id: int, username: str, epoch: int) -> Tuple[str, int]:
+        expires_at = int(time.time()) + self.ttl
+        payload = _b64encode(json.dumps(
+            {"u": user_id, "n": username, "e": epoch, "x": expires_at},
+            separators=(",", ":"),
+        ).encode("utf-8"))
+        return f"{self.version}.{payload}.{self._sign(payload)}", expires_at
+
+    def verify(self, token: str) -> TokenClaims:
+        # hmac can not compare non-ascii strings, no valid token contains any
+        if not token.isascii():
+            raise InvalidTokenError()
+
+        try:
+            version, payload, signature = token.split(".")
+        except ValueError as e:
+            raise InvalidTokenError() from e
+
+        if version != self.version:
+            raise InvalidTokenError()
+
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise InvalidTokenError()
+
+        try:
+            data = json.loads(_b64decode(payload))
+            claims = TokenClaims(
+                user_id=int(data["u"]),
+                username=str(data["n"]),
+                epoch=int(data["e"]),
+                expires_at=int(data["x"]),
+            )
+        except Exception as e:
+            raise InvalidTokenError() from e
+
+        if claims.expires_at <= time.time():
+            raise InvalidTokenError()
+
+        return claims
+
+    def known_epoch(self, user_id: int) -> Optional[int]:
+        entry = self._epochs.get(user_id)
+        if entry is None:
+            return None
+
+        epoch, fetched_at = entry
+        if fetched_at + self.epoch_ttl <= time.monotonic():
+            del self._epochs[user_id]
+            return None
+
+        self._epochs.move_to_end(user_id)
+        return epoch
+
+    def remember_epoch(self, user_id: int, epoch: int) -> None:
+        if self.max_epochs <= 0:
+            return
+
+        self._epochs[user_id] = (epoch, time.monotonic())
+        self._epochs.move_to_end(user_id)
+
+        # lru eviction
+        while len(self._epochs) > self.max_epochs:
+            self._epochs.popitem(last=False)
+
+    def forget_epoch(self, user_id: int) -> None:
+        self._epochs.pop(user_id, None)
+
+
+@dataclass(frozen=True)
+class ImageClaims:
+    image_id: int
+    path: str
+    is_public: bool
+    expires_at: int
+
+
+class ImageURLSigner:
+    """
+    signs image urls so they can be served without authentication
+
+    the signed path is only a hint. if relayout-storage or pack-storage moved the image,
+    the endpoint looks its current path up by the image id.
+    expiries are rounded up to half the ttl. an image keeps its url for that long, so clients can cache it.
+    visibility changes reach urls already handed out only once they expire.
+    """
+
+    version = "i1"
+
+    def __init__(self, secret: bytes, ttl: int) -> None:
+        self.ttl = ttl
+        # separate key, an image signature can never pass as a bearer token
+        self._secret = hmac.new(secret, b"image-url", hashlib.sha256).digest()
+
+    def _sign(self, payload: str) -> str:
+        message = f"{self.version}.{payload}".encode("ascii")
+        return _b64encode(hmac.new(self._secret, message, hashlib.sha256).digest())
+
+    def sign(self, image_id: int, path: str, is_public: bool) -> str:
+        step = max(self.ttl // 2, 1)
+        expires_at = (int(time.time()) // step + 2) * step
+        payload = _b64encode(json.dumps(
+            {"i": image_id, "p": path, "v": int(is_public), "x": expires_at},
+            separators=(",", ":"),
+        ).encode("utf-8"))
+        return f"{self.version}.{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str) -> ImageClaims:
+        # hmac can not compare non-ascii strings, no valid token contains any
+        if not token.isascii():
+            raise InvalidTokenError()
+
+        try:
+            version, payload, signature = token.split(".")
+        except ValueError as e:
+            raise InvalidTokenError() from e
+
+        if version != self.version:
+            raise InvalidTokenError()
+
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise InvalidTokenError()
+
+        try:
+            data = json.loads(_b64decode(payload))
+            claims = ImageClaims(
+                image_id=int(data["i"]),
+                path=str(data["p"]),
+                is_public=bool(data["v"]),
+                expires_at=int(data["x"]),
+            )
+        except Exception as e:
+            raise InvalidTokenError() from e
+
+        if claims.expires_at <= time.time():
+            raise InvalidTokenError()
+
+        return claims
@@ -1,22 +1,99 @@
+import asyncio
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Union
 
 import bcrypt
+from sqlalchemy import event, inspect
 
 from config.config import Config
+from database.credential_cache import CredentialCache
+from database.feed_cache import FeedCache
+from database.model import User
+from database.token import ImageURLSigner, TokenService
+
+
+class HashingServiceBusyError(Exception):
+    pass
 
 
 class DBUtil:
     def __init__(
         self,
         hash_func: Callable[[Union[bytes, str]], str],
+        credential_cache: CredentialCache,
+        feed_cache: FeedCache,
+        tokens: TokenService,
+        image_urls: ImageURLSigner,
+        hash_workers: int,
+        hash_queue_depth: int,
     ) -> None:
         self.hash_func = hash_func
+        self.credential_cache = credential_cache
+        self.feed_cache = feed_cache
+        self.tokens = tokens
+        self.image_urls = image_urls
+        self.hash_workers = hash_workers
+        self.hash_queue_depth = hash_queue_depth
+        self.hash_pending = 0
+        self._hash_executor = ThreadPoolExecutor(
+            max_workers=hash_workers,
+            thread_name_prefix="password-hash",
+        )
+
+    async def hash(self, password: Union[bytes, str]) -> str:
+        # reject instead of queueing without bound
+        if self.hash_pending >= self.hash_workers + self.hash_queue_depth:
+            raise HashingServiceBusyError()
+
+        loop = asyncio.get_running_loop()
+        self.hash_pending += 1
+        future = self._hash_executor.submit(self.hash_func, password)
+        # a cancelled caller leaves a running job behind, its slot is only free once the job is
+        future.add_done_callback(lambda _: self._release_hash_slot(loop))
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def _release_hash_slot(self, loop: asyncio.AbstractEventLoop) -> None:
+        # called from the worker thread
+        try:
+            loop.call_soon_threadsafe(self._decrement_pending)
+        except RuntimeError:
+            # loop closed during shutdown
+            pass
+
+    def _decrement_pending(self) -> None:
+        self.hash_pending -= 1
+
+    def close(self) -> None:
+        self._hash_executor.shutdown(wait=False, cancel_futures=True)
 
 
 def create_db_util(config: Config) -> DBUtil:
+    credential_cache = CredentialCache(
+        ttl=config.security.credential_cache_ttl,
+        max_size=config.security.credential_cache_size,
+    )
+    # shared by all workers, tokens and image urls of one are accepted by the others
+    secret = config.security.token_secret.encode("utf-8")
+    tokens = TokenService(
+        secret=secret,
+        ttl=config.security.token_ttl,
+        epoch_ttl=config.security.token_epoch_ttl,
+        max_epochs=config.security.credential_cache_size,
+    )
+    _register_credential_cache_invalidation(credential_cache, tokens)
+
     return DBUtil(
         hash_func=_create_hash_function(config),
+        credential_cache=credential_cache,
+        feed_cache=FeedCache(
+            ttl=config.cache.feed_cache_ttl,
+            max_size=config.cache.feed_cache_size,
+        ),
+        tokens=tokens,
+        image_urls=ImageURLSigner(secret=secret, ttl=config.security.image_url_ttl),
+        hash_workers=config.security.hash_workers,
+        hash_queue_depth=config.security.hash_queue_depth,
     )
 
 
@@ -33,3 +110,17 @@ def _create_hash_function(config: Config) -> Callable[[Union[bytes, str]], str]:
             ).decode("ascii")
 
     return salt_and_hash_password
+
+
+def _register_credential_cache_invalidation(credential_cache: CredentialCache, tokens: TokenService) -> None:
+
+    def invalidate_user(mapper, connection, target: User) -> None:
+        # drop the current and any previous name of the user
+        history = inspect(target).attrs.name.history
+        for name in [target.name, *history.deleted]:
+            if name is not None:
+                credential_cache.invalidate(name)
+        tokens.forget_epoch(target.id)
+
+    event.listen(User, "after_update", invalidate_user)
+    event.listen(User, "after_delete", invalidate_user)
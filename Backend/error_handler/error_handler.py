@@ -8,6 +8,7 @@ from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
                                     async_sessionmaker, create_async_engine)
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
+from database.util import HashingServiceBusyError
 from schema.response import ResponseStatus, StatusResponse
 
 
@@ -31,3 +32,15 @@ def CreateRequestValidationExceptionHandler(app: FastAPI) -> None:
             ).model_dump(),
             status_code=400,
         )
+
+
+def CreateHashingServiceBusyExceptionHandler(app: FastAPI) -> None:
+    @app.exception_handler(HashingServiceBusyError)
+    async def hashing_service_busy_exception_handler(request, exc):
+        return JSONResponse(
+            StatusResponse(
+                status=ResponseStatus.FAILURE, details="server busy, try again later"
+            ).model_dump(),
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
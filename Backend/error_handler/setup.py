@@ -1,8 +1,12 @@
 from fastapi import FastAPI
 
-from error_handler.error_handler import CreateHTTPExceptionHandler
+from error_handler.error_handler import (
+    CreateHashingServiceBusyExceptionHandler,
+    CreateHTTPExceptionHandler,
+)
 
 
 def create_error_handler(app: FastAPI):
     CreateHTTPExceptionHandler(app)
     CreateHTTPExceptionHandler(app)
+    CreateHashingServiceBusyExceptionHandler(app)
@@ -10,12 +10,20 @@ from sqlalchemy.ext.asyncio import (
 )
 
 from database.setup import create_schema
+from database.util import DBUtil
+from storage.storage import Storage
 
 
-def create_lifespan(engine: AsyncEngine):
+def create_lifespan(engine: AsyncEngine, read_engine: AsyncEngine, db_util: DBUtil, storage: Storage):
     @asynccontextmanager
     async def lifespan(app: FastAPI):
+        # refuses to start on a database that still needs migrations
         await create_schema(engine)
         yield
+        db_util.close()
+        storage.close()
+        if read_engine is not engine:
+            await read_engine.dispose()
+        await engine.dispose()
 
     return lifespan
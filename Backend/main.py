@@ -2,10 +2,11 @@ import logging
 
 from fastapi import FastAPI
 
+from api.metrics.metrics import CreateMetricsEndpoint
 from api.register import register as register_api
 from bird_classifier.setup import create_classifier
 from config.config import Config, get_config
-from database.setup import create_engine_sessionmaker
+from database.setup import create_engine_sessionmaker, create_read_engine_sessionmaker
 from database.util import create_db_util
 from error_handler.setup import create_error_handler
 from lifespan import create_lifespan
@@ -19,6 +20,7 @@ def setup(config:Config) -> FastAPI:
 
     # setup db
     engine, sessionmaker = create_engine_sessionmaker(config)
+    read_engine, read_sessionmaker = create_read_engine_sessionmaker(config, engine, sessionmaker)
     db_util = create_db_util(config)
 
     # storage
@@ -28,13 +30,19 @@ def setup(config:Config) -> FastAPI:
     classifier = create_classifier(config)
 
     # lifespan
-    lifespan = create_lifespan(engine)
+    lifespan = create_lifespan(engine, read_engine, db_util, storage)
 
     # setup fastapi
     app = FastAPI(lifespan=lifespan)
     create_error_handler(app)
 
-    register_api(app, config, sessionmaker, db_util, storage, classifier)
+    register_api(app, config, sessionmaker, read_sessionmaker, db_util, storage, classifier)
+
+    # metrics
+    engines = {"primary": engine}
+    if read_engine is not engine:
+        engines["replica"] = read_engine
+    CreateMetricsEndpoint(app, engines, db_util)
     
     return app
 
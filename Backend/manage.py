@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import datetime
+import logging
+
+from config.config import Config, get_config
+from database.backfill import backfill_device_geohash, backfill_like_count
+from database.migration import migrate, pending_migrations
+from database.setup import create_engine_sessionmaker
+from storage.archive import pack_blobs
+from storage.gc import collect_garbage, retention_from_config
+from storage.migration import migrate_to_blobs, relayout_blobs
+from storage.setup import create_storage
+
+
+async def run_backfill_like_count(config: Config, args: argparse.Namespace) -> None:
+    engine, _ = create_engine_sessionmaker(config)
+    try:
+        await backfill_like_count(engine, batch_size=args.batch_size)
+    finally:
+        await engine.dispose()
+
+
+async def run_backfill_device_geohash(config: Config, args: argparse.Namespace) -> None:
+    engine, _ = create_engine_sessionmaker(config)
+    try:
+        await backfill_device_geohash(engine, batch_size=args.batch_size)
+    finally:
+        await engine.dispose()
+
+
+async def run_migrate_storage(config: Config, args: argparse.Namespace) -> None:
+    engine, _ = create_engine_sessionmaker(config)
+    try:
+        await migrate_to_blobs(
+            engine,
+            create_storage(config),
+            batch_size=args.batch_size,
+            grace=args.grace if args.grace is not None else _move_grace(config),
+        )
+    finally:
+        await engine.dispose()
+
+
+def _move_grace(config: Config) -> float:
+    # presigned urls point at the old key until they expire
+    if config.storage.backend == "s3":
+        return max(float(config.storage.presign_ttl), 5.0)
+    return 5.0
+
+
+async def run_relayout_storage(config: Config, args: argparse.Namespace) -> None:
+    engine, _ = create_engine_sessionmaker(config)
+    try:
+        await relayout_blobs(
+            engine,
+            create_storage(config),
+            batch_size=args.batch_size,
+            workers=args.workers,
+            grace=args.grace if args.grace is not None else _move_grace(config),
+        )
+    finally:
+        await engine.dispose()
+
+
+async def run_gc_storage(config: Config, args: argparse.Namespace) -> None:
+    retention = retention_from_config(config.gc.retention_days)
+    engine, _ = create_engine_sessionmaker(config)
+    try:
+        report = await collect_garbage(
+            engine,
+            create_storage(config),
+            retention=retention,
+            keep_test_images=args.keep_test_images if args.keep_test_images is not None else config.gc.keep_test_images,
+            grace=config.gc.grace,
+            batch_size=args.batch_size if args.batch_size is not None else config.gc.batch_size,
+            rate=args.rate if args.rate is not None else config.gc.rate,
+        )
+        print(f"{report.reclaimed_bytes} bytes reclaimed")
+    finally:
+        await engine.dispose()
+
+
+async def run_pack_storage(config: Config, args: argparse.Namespace) -> None:
+    older_than_days = args.older_than_days if args.older_than_days is not None else config.storage.archive_after_days
+    engine, _ = create_engine_sessionmaker(config)
+    try:
+        report = await pack_blobs(
+            engine,
+            create_storage(config),
+            older_than=datetime.timedelta(days=older_than_days),
+            bundle_size=args.bundle_size if args.bundle_size is not None else config.storage.bundle_size,
+            batch_size=args.batch_size,
+            grace=args.grace,
+        )
+        print(f"{report.blobs} blobs packed into {report.bundles} bundles")
+    finally:
+        await engine.dispose()
+
+
+async def run_migrate(config: Config, args: argparse.Namespace) -> None:
+    engine, _ = create_engine_sessionmaker(config)
+    try:
+        if args.list:
+            for migration in await pending_migrations(engine):
+                print(f"{migration.version}: {migration.description}")
+        else:
+            await migrate(engine)
+    finally:
+        await engine.dispose()
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="birdsnap maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migration = commands.add_parser(
+        "migrate",
+        help="apply pending database migrations, indexes are built concurrently",
+    )
+    migration.add_argument("--list", action="store_true", help="only list pending migrations")
+    migration.set_defaults(func=run_migrate)
+
+    backfill = commands.add_parser(
+        "backfill-like-count",
+        help="recompute birdsnap.like_count from the likes table",
+    )
+    backfill.add_argument("--batch-size", type=int, default=1000)
+    backfill.set_defaults(func=run_backfill_like_count)
+
+    geohash = commands.add_parser(
+        "backfill-device-geohash",
+        help="set device.geohash for devices registered before it existed",
+    )
+    geohash.add_argument("--batch-size", type=int, default=1000)
+    geohash.set_defaults(func=run_backfill_device_geohash)
+
+    storage = commands.add_parser(
+        "migrate-storage",
+        help="move images saved under device directories to content addressed blobs",
+    )
+    storage.add_argument("--batch-size", type=int, default=500)
+    storage.add_argument(
+        "--grace",
+        type=float,
+        default=None,
+        help="seconds old files stay readable after the rows point at the blobs, "
+             "defaults to S3_PRESIGN_TTL on s3 so presigned urls stay valid, 5 otherwise",
+    )
+    storage.set_defaults(func=run_migrate_storage)
+
+    relayout = commands.add_parser(
+        "relayout-storage",
+        help="move blobs to the layout set by STORAGE_DATE_DIRS and STORAGE_HASH_DEPTH",
+    )
+    relayout.add_argument("--batch-size", type=int, default=500)
+    relayout.add_argument("--workers", type=int, default=4, help="blobs moved concurrently")
+    relayout.add_argument(
+        "--grace",
+        type=float,
+        default=None,
+        help="seconds old names stay readable after the rows point at the new ones, "
+             "defaults to S3_PRESIGN_TTL on s3 so presigned urls stay valid, 5 otherwise",
+    )
+    relayout.set_defaults(func=run_relayout_storage)
+
+    gc = commands.add_parser(
+        "gc-storage",
+        help="delete snaps past the retention of their status (GC_RETENTION), "
+             "superseded test images and unreferenced files",
+    )
+    gc.add_argument("--batch-size", type=int, default=None, help="defaults to GC_BATCH_SIZE")
+    gc.add_argument("--rate", type=float, default=None, help="rows deleted per second, defaults to GC_RATE")
+    gc.add_argument(
+        "--keep-test-images",
+        type=int,
+        default=None,
+        help="newest test images kept per device, defaults to GC_KEEP_TEST_IMAGES",
+    )
+    gc.set_defaults(func=run_gc_storage)
+
+    pack = commands.add_parser(
+        "pack-storage",
+        help="pack old images into per device bundles, fewer files to back up",
+    )
+    pack.add_argument(
+        "--older-than-days",
+        type=float,
+        default=None,
+        help="defaults to ARCHIVE_AFTER_DAYS",
+    )
+    pack.add_argument("--bundle-size", type=int, default=None, help="bytes, defaults to BUNDLE_SIZE")
+    pack.add_argument("--batch-size", type=int, default=500)
+    pack.add_argument(
+        "--grace",
+        type=float,
+        default=5.0,
+        help="seconds loose files stay readable after the rows point into the bundle",
+    )
+    pack.set_defaults(func=run_pack_storage)
+
+    return parser
+
+
+def main() -> None:
+    args = create_parser().parse_args()
+    config = get_config()
+    logging.basicConfig(level=config.logging_level)
+    asyncio.run(args.func(config, args))
+
+
+if __name__ == "__main__":
+    main()
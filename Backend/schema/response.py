@@ -16,12 +16,24 @@ class StatusResponse(BaseModel):
     details: Optional[str]
 
 
+class Token(BaseModel):
+    access_token:str
+    token_type:str
+    expires_at:int
+
+
+class TotalCount(str, enum.Enum):
+    NONE = "none"
+    ESTIMATE = "estimate"
+    EXACT = "exact"
+
+
 class Page(BaseModel):
     next:Optional[str]
     prev:Optional[str]
-    index:int
+    index:Optional[int]
     page_count:int = Field(..., serialization_alias="pageCount")
-    total_count:int = Field(..., serialization_alias="totalCount")
+    total_count:Optional[int] = Field(..., serialization_alias="totalCount")
 
 ResultT = TypeVar('ResultT')
 class PaginatedResult(BaseModel, Generic[ResultT]):
@@ -38,13 +50,39 @@ class UserInfo(BaseModel):
     id:int
     name:str
 
+class Device(BaseModel):
+    device_info:DeviceInfo = Field(..., serialization_alias="deviceInfo")
+    user_info:UserInfo = Field(..., serialization_alias="userInfo")
+    # meters, only for radius queries
+    distance:Optional[float] = None
+
 class LikeInfo(BaseModel):
     is_liked:bool = Field(..., serialization_alias="isLiked") 
     likes:int
     users:Optional[List[UserInfo]] = Field(..., serialization_alias="users") 
 
+class LikeStatus(str, enum.Enum):
+    LIKED = "liked"
+    ALREADY_LIKED = "already_liked"
+    UNLIKED = "unliked"
+    NOT_LIKED = "not_liked"
+    UNAVAILABLE = "unavailable"
+
+class LikeResult(BaseModel):
+    birdsnap_id:int = Field(..., serialization_alias="birdsnapId")
+    status:LikeStatus
+
+class LikeBatchResult(BaseModel):
+    results:List[LikeResult]
+
 class BirdSnapImage(BaseModel):
     id:int
+    # signed, works without authentication until it expires
+    url:Optional[str] = None
+
+class SpeciesCount(BaseModel):
+    species:str
+    count:int
 
 class BirdSnap(BaseModel):
     id:int
@@ -54,4 +92,7 @@ class BirdSnap(BaseModel):
     is_public:bool
     snap_time:datetime.datetime
     images:List[BirdSnapImage]
-    bird_species:Optional[List[str]]
\ No newline at end of file
+    bird_species:Optional[List[str]]
+
+class BirdSnapFeed(PaginatedResult[BirdSnap]):
+    facets:Optional[List[SpeciesCount]] = None
@@ -0,0 +1,148 @@
+import asyncio
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import List
+
+from sqlalchemy import Row, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from database.model import BirdSnap, BirdSnapImage, BirdSnapStatus, StorageBlob, TestImage
+from storage.bundle import BUNDLE_DIR, bundle_name, member_path
+from storage.layout import BLOB_DIR
+from storage.migration import PendingRemovals
+from storage.storage import Storage, StorageException
+
+
+@dataclass
+class PackReport:
+    bundles: int = 0
+    blobs: int = 0
+    bytes: int = 0
+
+
+async def _pack_bundle(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    storage: Storage,
+    device_id: object,
+    blobs: List[Row],
+    removals: PendingRemovals,
+    report: PackReport,
+) -> None:
+    name = bundle_name(device_id, datetime.datetime.now(datetime.timezone.utc))
+    entries = await asyncio.to_thread(storage.write_bundle, name, [(blob.digest, blob.path) for blob in blobs])
+    if not entries:
+        return
+
+    packed = []
+    async with sessionmaker() as session:
+        for entry in entries:
+            new_path = member_path(name, entry)
+            # locks the blob row first, uploads of the same content wait and get the packed path
+            updated = (await session.execute(
+                update(StorageBlob).where(
+                    StorageBlob.digest == entry.digest
+                ).where(
+                    StorageBlob.path == entry.path
+                ).values(path=new_path).returning(StorageBlob.digest)
+            )).scalar_one_or_none()
+            # moved or collected meanwhile, its bytes stay unused in the bundle
+            if updated is None:
+                continue
+
+            await session.execute(
+                update(BirdSnapImage).where(BirdSnapImage.path == entry.path).values(path=new_path)
+            )
+            await session.execute(
+                update(TestImage).where(TestImage.path == entry.path).values(path=new_path)
+            )
+            packed.append(entry)
+        await session.commit()
+
+    # requests that just read the old path can still open it, signed urls look the packed path up
+    removals.add([entry.path for entry in packed])
+    await removals.remove_due()
+
+    report.bundles += 1
+    report.blobs += len(packed)
+    report.bytes += sum(entry.size for entry in packed)
+    logging.info(f"{report.blobs} blobs packed into {report.bundles} bundles, {report.bytes} bytes")
+
+
+async def pack_blobs(
+    engine: AsyncEngine,
+    storage: Storage,
+    older_than: datetime.timedelta,
+    bundle_size: int = 256 * 1024 * 1024,
+    batch_size: int = 500,
+    grace: float = 5.0,
+) -> PackReport:
+    """
+    packs loose blobs of available snaps older than older_than into per device bundles
+
+    resumable, packed blobs are skipped, every bundle is committed on its own and
+    the loose files are removed grace seconds after the rows point into the bundle
+    """
+    if storage.backend.local_path(BUNDLE_DIR) is None:
+        raise StorageException("bundles need the filesystem storage backend")
+
+    sessionmaker = async_sessionmaker(bind=engine, autoflush=False)
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - older_than
+    removals = PendingRemovals(storage, grace)
+    report = PackReport()
+
+    # a blob shared by several snaps goes to the device of the first one
+    candidates = select(
+        StorageBlob.digest, StorageBlob.path, StorageBlob.size, BirdSnap.device_id
+    ).distinct(StorageBlob.digest).join(
+        BirdSnapImage, BirdSnapImage.path == StorageBlob.path
+    ).join(
+        BirdSnap, BirdSnap.id == BirdSnapImage.birdsnap_id
+    ).where(
+        StorageBlob.path.startswith(BLOB_DIR + "/")
+    ).where(
+        StorageBlob.creation_time < cutoff
+    ).where(
+        StorageBlob.ref_count > 0
+    ).where(
+        BirdSnap.status == BirdSnapStatus.AVAILABLE
+    ).order_by(StorageBlob.digest, BirdSnap.id).subquery()
+
+    async with sessionmaker() as session:
+        devices = (await session.execute(
+            select(candidates.c.device_id).distinct().order_by(candidates.c.device_id)
+        )).scalars().all()
+
+    for device_id in devices:
+        last_digest = ""
+        bundle = []
+        bundle_bytes = 0
+
+        while True:
+            async with sessionmaker() as session:
+                blobs = (await session.execute(
+                    select(candidates).where(
+                        candidates.c.device_id == device_id
+                    ).where(
+                        candidates.c.digest > last_digest
+                    ).order_by(candidates.c.digest).limit(batch_size)
+                )).all()
+            if not blobs:
+                break
+            last_digest = blobs[-1].digest
+
+            for blob in blobs:
+                bundle.append(blob)
+                bundle_bytes += blob.size
+                if bundle_bytes >= bundle_size:
+                    await _pack_bundle(sessionmaker, storage, device_id, bundle, removals, report)
+                    bundle = []
+                    bundle_bytes = 0
+
+        # the rest of the device, smaller than bundle_size
+        if bundle:
+            await _pack_bundle(sessionmaker, storage, device_id, bundle, removals, report)
+
+    await removals.drain()
+    logging.info(f"packing done: {report.blobs} blobs in {report.bundles} bundles, {report.bytes} bytes")
+    return report
@@ -0,0 +1,241 @@
+import datetime
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Optional, Tuple
+
+_CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+}
+
+
+class StorageBackendError(Exception):
+    pass
+
+
+class StorageBackend(ABC):
+    """
+    where stored files live, keys are relative posix paths like the ones in the database
+
+    every method blocks, callers run them in a thread
+    """
+
+    @abstractmethod
+    def put(self, source: Path, key: str) -> None:
+        """
+        moves a complete local file to key, replacing what is there
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def copy(self, key: str, new_key: str) -> None:
+        """
+        makes the content of key also available as new_key, an existing new_key is kept
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        removes key, a missing key is no error
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def fetch(self, key: str, target: BinaryIO) -> None:
+        """
+        writes the content of key to target, FileNotFoundError if it is missing
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def modified(self, key: str) -> datetime.datetime:
+        raise NotImplementedError()
+
+    def local_path(self, key: str) -> Optional[Path]:
+        # backends keeping files on this machine let the api send them directly
+        return None
+
+    def presigned_url(self, key: str, cache_control: str) -> Optional[str]:
+        # backends able to serve clients themselves return a short lived url
+        return None
+
+
+class FileSystemBackend(StorageBackend):
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def put(self, source: Path, key: str) -> None:
+        target = self.path / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, target)
+
+    def exists(self, key: str) -> bool:
+        return (self.path / key).exists()
+
+    def copy(self, key: str, new_key: str) -> None:
+        target = self.path / new_key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(self.path / key, target)
+        except FileExistsError:
+            # same content already stored
+            pass
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path / key)
+        except FileNotFoundError:
+            pass
+
+    def fetch(self, key: str, target: BinaryIO) -> None:
+        with open(self.path / key, "rb") as file:
+            while chunk := file.read(64 * 1024):
+                target.write(chunk)
+
+    def modified(self, key: str) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp((self.path / key).stat().st_mtime, datetime.timezone.utc)
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self.path / key
+
+
+class S3Backend(StorageBackend):
+    """
+    s3 compatible object storage, clients download images through presigned urls
+
+    needs boto3, only imported when this backend is configured
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        presign_ttl: int = 300,
+        presign_cache_size: int = 4096,
+    ) -> None:
+        try:
+            import boto3
+            from botocore.config import Config as BotoConfig
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise StorageBackendError("the s3 storage backend needs boto3, install it with 'pip install boto3'") from e
+
+        self._client_error = ClientError
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.presign_ttl = presign_ttl
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            # self hosted stand-ins rarely resolve bucket subdomains
+            config=BotoConfig(s3={"addressing_style": "path" if endpoint_url else "auto"}),
+        )
+
+        # handing out the same url for a while lets clients cache the image behind it
+        self._presign_cache_size = presign_cache_size
+        self._presigned: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._presign_lock = threading.Lock()
+
+    def put(self, source: Path, key: str) -> None:
+        extra_args = {}
+        content_type = _CONTENT_TYPES.get(PurePosixPath(key).suffix.lower())
+        if content_type is not None:
+            extra_args["ContentType"] = content_type
+        self.client.upload_file(str(source), self.bucket, self._object_key(key), ExtraArgs=extra_args)
+        os.remove(source)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self._client_error as e:
+            if self._is_missing(e):
+                return False
+            raise
+        return True
+
+    def copy(self, key: str, new_key: str) -> None:
+        if self.exists(new_key):
+            return
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=self._object_key(new_key),
+                CopySource={"Bucket": self.bucket, "Key": self._object_key(key)},
+            )
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def delete(self, key: str) -> None:
+        # s3 does not complain about missing keys
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def fetch(self, key: str, target: BinaryIO) -> None:
+        try:
+            self.client.download_fileobj(self.bucket, self._object_key(key), target)
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def modified(self, key: str) -> datetime.datetime:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))["LastModified"]
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def presigned_url(self, key: str, cache_control: str) -> Optional[str]:
+        now = time.monotonic()
+        cache_key = (key, cache_control)
+        with self._presign_lock:
+            cached = self._presigned.get(cache_key)
+            if cached is not None and cached[1] > now:
+                self._presigned.move_to_end(cache_key)
+                return cached[0]
+
+        # signing is local, no request to the storage
+        url = self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self._object_key(key),
+                "ResponseCacheControl": cache_control,
+            },
+            ExpiresIn=self.presign_ttl,
+        )
+
+        with self._presign_lock:
+            # reused for half its lifetime, so a url handed out is valid for at least the other half
+            self._presigned[cache_key] = (url, now + self.presign_ttl / 2)
+            self._presigned.move_to_end(cache_key)
+            while len(self._presigned) > self._presign_cache_size:
+                self._presigned.popitem(last=False)
+        return url
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    @staticmethod
+    def _is_missing(error: Exception) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
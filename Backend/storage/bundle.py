@@ -0,0 +1,92 @@
+import datetime
+import json
+import mmap
+import secrets
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, List, Optional
+
+# below the storage root
+BUNDLE_DIR = "bundle"
+
+_PACK_SUFFIX = ".pack"
+_INDEX_SUFFIX = ".idx"
+
+
+@dataclass(frozen=True)
+class BundleLocation:
+    # storage path of the pack file
+    bundle: str
+    offset: int
+    size: int
+
+
+@dataclass(frozen=True)
+class BundleEntry:
+    digest: str
+    offset: int
+    size: int
+    # path of the blob before it was packed
+    path: str
+
+
+def bundle_name(device_id: object, created: datetime.datetime) -> str:
+    # bundle/<device>/<utc time>-<random>, unique without asking the database
+    created = created.astimezone(datetime.timezone.utc)
+    return f"{BUNDLE_DIR}/{device_id}/{created.strftime('%Y%m%dT%H%M%S')}-{secrets.token_hex(4)}"
+
+
+def pack_path(name: str) -> str:
+    return name + _PACK_SUFFIX
+
+
+def index_path(name: str) -> str:
+    return name + _INDEX_SUFFIX
+
+
+def member_path(name: str, entry: BundleEntry) -> str:
+    """
+    storage path of a packed blob, locates it without the database
+
+    <bundle name>/<offset>-<size>/<digest>.<type>, the digest and type stay the last part
+    so derivatives and media types work as for loose blobs
+    """
+    filetype = entry.path.rsplit(".", 1)[-1]
+    return f"{name}/{entry.offset}-{entry.size}/{entry.digest}.{filetype}"
+
+
+def bundle_location(storage_path: str) -> Optional[BundleLocation]:
+    # None for loose files
+    parts = storage_path.split("/")
+    if len(parts) != 5 or parts[0] != BUNDLE_DIR:
+        return None
+    try:
+        offset, size = (int(value) for value in parts[3].split("-"))
+    except ValueError:
+        return None
+    return BundleLocation(bundle=pack_path("/".join(parts[:3])), offset=offset, size=size)
+
+
+def write_index(file: BinaryIO, entries: List[BundleEntry]) -> None:
+    # one json object per line, enough to rebuild the database side from the bundle alone
+    for entry in entries:
+        file.write(json.dumps({
+            "digest": entry.digest,
+            "offset": entry.offset,
+            "size": entry.size,
+            "path": entry.path,
+        }, separators=(",", ":")).encode("utf-8") + b"\n")
+
+
+def copy_member(pack: Path, location: BundleLocation, target: BinaryIO) -> None:
+    """
+    writes one packed blob to target through a read only mapping of the bundle, blocking
+    """
+    with open(pack, "rb") as file:
+        if location.offset + location.size > file.seek(0, 2):
+            raise FileNotFoundError(str(pack))
+        if location.size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            with memoryview(mapping) as view:
+                target.write(view[location.offset : location.offset + location.size])
@@ -0,0 +1,93 @@
+import enum
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from PIL import Image, ImageOps
+
+
+class DerivativeSize(str, enum.Enum):
+    ORIGINAL = "original"
+    THUMB = "thumb"
+    MEDIUM = "medium"
+
+
+class DerivativeFormat(str, enum.Enum):
+    WEBP = "webp"
+    JPEG = "jpeg"
+
+
+# longest edge in pixels, smaller images are only reencoded
+_MAX_EDGE = {
+    DerivativeSize.THUMB: 320,
+    DerivativeSize.MEDIUM: 1280,
+}
+
+_QUALITY = {
+    DerivativeFormat.WEBP: 80,
+    DerivativeFormat.JPEG: 82,
+}
+
+# quality of originals reencoded at ingest
+_ORIGINAL_JPEG_QUALITY = 90
+
+
+def negotiate_format(accept: Optional[str]) -> DerivativeFormat:
+    """
+    webp for clients that list it in their accept header, jpeg for everyone else
+    """
+    if accept is None:
+        return DerivativeFormat.JPEG
+    for entry in accept.split(","):
+        media_type, _, params = entry.strip().partition(";")
+        if media_type.strip().lower() != "image/webp":
+            continue
+        # an explicit q=0 refuses the type
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q" and value.strip() in ("0", "0.0", "0.00", "0.000"):
+                return DerivativeFormat.JPEG
+        return DerivativeFormat.WEBP
+    return DerivativeFormat.JPEG
+
+
+def render_derivative(source: Path, target: BinaryIO, size: DerivativeSize, format: DerivativeFormat) -> None:
+    """
+    writes a downscaled copy without metadata, blocking
+    """
+    edge = _MAX_EDGE[size]
+    with Image.open(source) as image:
+        # lets jpeg decode at a fraction of the full resolution
+        image.draft("RGB", (edge, edge))
+        icc_profile = image.info.get("icc_profile")
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+
+    if format == DerivativeFormat.JPEG:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(
+            target, "JPEG", quality=_QUALITY[format], optimize=True, progressive=True, icc_profile=icc_profile
+        )
+    else:
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        image.save(target, "WEBP", quality=_QUALITY[format], method=4, icc_profile=icc_profile)
+
+
+def strip_metadata(source: Path, target: BinaryIO) -> None:
+    """
+    reencodes an original without exif and other metadata, blocking
+
+    the exif orientation is applied to the pixels first, so the image still displays upright
+    """
+    with Image.open(source) as image:
+        format = image.format
+        icc_profile = image.info.get("icc_profile")
+        image = ImageOps.exif_transpose(image)
+
+    if format == "JPEG":
+        image.save(
+            target, "JPEG", quality=_ORIGINAL_JPEG_QUALITY, optimize=True, progressive=True, icc_profile=icc_profile
+        )
+    else:
+        image.save(target, "PNG", optimize=True, icc_profile=icc_profile)
@@ -0,0 +1,232 @@
+import asyncio
+import datetime
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Mapping
+
+from sqlalchemy import delete, func, select, union
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from database.blob import release_blobs
+from database.model import BirdSnap, BirdSnapImage, BirdSnapLike, BirdSnapStatus, StorageBlob, TestImage
+from storage.bundle import bundle_location
+from storage.storage import Storage
+
+# snaps with these are in use, collecting them is refused
+_PROTECTED = (BirdSnapStatus.PROCESSING, BirdSnapStatus.AVAILABLE)
+
+
+@dataclass
+class GCReport:
+    birdsnaps: int = 0
+    test_images: int = 0
+    blobs: int = 0
+    # files saved before blobs existed, their size is not recorded
+    legacy_files: int = 0
+    temp_files: int = 0
+    # of blobs and temporary files
+    reclaimed_bytes: int = 0
+
+
+def retention_from_config(retention_days: Mapping[str, float]) -> Dict[BirdSnapStatus, datetime.timedelta]:
+    retention = {}
+    for name, days in retention_days.items():
+        try:
+            status = BirdSnapStatus(name)
+        except ValueError as e:
+            raise ValueError(f"unknown birdsnap status {name} in GC_RETENTION") from e
+        if status in _PROTECTED:
+            raise ValueError(f"{name} snaps are never collected")
+        retention[status] = datetime.timedelta(days=days)
+    return retention
+
+
+async def _throttle(started: float, rows: int, rate: float) -> None:
+    # spreads deletes out so vacuum and replicas keep up
+    if rate > 0:
+        await asyncio.sleep(max(rows / rate - (time.monotonic() - started), 0.0))
+
+
+async def _unreferenced(session: AsyncSession, paths: List[str]) -> List[str]:
+    # files saved before blobs have no reference count, look for rows still using them
+    if not paths:
+        return []
+    used = set((await session.execute(
+        union(
+            select(BirdSnapImage.path).where(BirdSnapImage.path.in_(paths)),
+            select(TestImage.path).where(TestImage.path.in_(paths)),
+        )
+    )).scalars().all())
+    return [path for path in paths if path not in used]
+
+
+async def _remove_legacy(storage: Storage, paths: List[str], report: GCReport) -> None:
+    for path in paths:
+        await asyncio.to_thread(storage.remove, path)
+        await asyncio.to_thread(storage.remove_derivatives, path)
+    report.legacy_files += len(paths)
+
+
+async def _collect_birdsnaps(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    storage: Storage,
+    status: BirdSnapStatus,
+    retention: datetime.timedelta,
+    batch_size: int,
+    rate: float,
+    report: GCReport,
+) -> None:
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - retention
+
+    while True:
+        started = time.monotonic()
+        async with sessionmaker() as session:
+            # rows locked elsewhere, e.g. by a running classification, wait for the next run
+            ids = (await session.execute(
+                select(BirdSnap.id).where(
+                    BirdSnap.status == status
+                ).where(
+                    BirdSnap.status_time < cutoff
+                ).order_by(BirdSnap.id).limit(batch_size).with_for_update(skip_locked=True)
+            )).scalars().all()
+            if not ids:
+                return
+
+            paths = (await session.execute(
+                delete(BirdSnapImage).where(BirdSnapImage.birdsnap_id.in_(ids)).returning(BirdSnapImage.path)
+            )).scalars().all()
+            await session.execute(delete(BirdSnapLike).where(BirdSnapLike.birdsnap_id.in_(ids)))
+            await session.execute(delete(BirdSnap).where(BirdSnap.id.in_(ids)))
+            legacy = await _unreferenced(session, await release_blobs(session, paths))
+            await session.commit()
+
+        await _remove_legacy(storage, legacy, report)
+        report.birdsnaps += len(ids)
+        logging.info(f"{report.birdsnaps} birdsnaps collected, last status {status.value}")
+        await _throttle(started, len(ids), rate)
+
+
+async def _collect_test_images(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    storage: Storage,
+    keep: int,
+    batch_size: int,
+    rate: float,
+    report: GCReport,
+) -> None:
+    # only the newest test image of a device is ever served
+    ranked = select(
+        TestImage.id,
+        func.row_number().over(
+            partition_by=TestImage.device_id,
+            order_by=(TestImage.creation_time.desc(), TestImage.id.desc()),
+        ).label("rank"),
+    ).subquery()
+
+    while True:
+        started = time.monotonic()
+        async with sessionmaker() as session:
+            ids = (await session.execute(
+                select(ranked.c.id).where(ranked.c.rank > keep).order_by(ranked.c.id).limit(batch_size)
+            )).scalars().all()
+            if not ids:
+                return
+
+            paths = (await session.execute(
+                delete(TestImage).where(TestImage.id.in_(ids)).returning(TestImage.path)
+            )).scalars().all()
+            legacy = await _unreferenced(session, await release_blobs(session, paths))
+            await session.commit()
+
+        await _remove_legacy(storage, legacy, report)
+        report.test_images += len(paths)
+        logging.info(f"{report.test_images} test images collected")
+        await _throttle(started, len(ids), rate)
+
+
+async def _sweep_blobs(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    storage: Storage,
+    grace: float,
+    batch_size: int,
+    rate: float,
+    report: GCReport,
+) -> None:
+    last_digest = ""
+
+    while True:
+        started = time.monotonic()
+        async with sessionmaker() as session:
+            # uploads reference the blob before they put its file, one of the same content
+            # waits on the lock until the row and file are gone and stores both again
+            blobs = (await session.execute(
+                select(StorageBlob.digest, StorageBlob.path, StorageBlob.size).where(
+                    StorageBlob.ref_count <= 0
+                ).where(
+                    StorageBlob.digest > last_digest
+                ).order_by(StorageBlob.digest).limit(batch_size).with_for_update(skip_locked=True)
+            )).all()
+            if not blobs:
+                return
+            last_digest = blobs[-1].digest
+
+            cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=grace)
+            removed = []
+            for blob in blobs:
+                try:
+                    modified = await asyncio.to_thread(storage.backend.modified, blob.path)
+                except FileNotFoundError:
+                    modified = None
+                # left by an upload that failed only just now
+                if modified is not None and modified > cutoff:
+                    continue
+                await asyncio.to_thread(storage.remove, blob.path)
+                await asyncio.to_thread(storage.remove_derivatives, blob.path)
+                removed.append(blob)
+
+            if removed:
+                await session.execute(
+                    delete(StorageBlob).where(StorageBlob.digest.in_([blob.digest for blob in removed]))
+                )
+            await session.commit()
+
+        report.blobs += len(removed)
+        # packed blobs keep their bytes in the bundle
+        report.reclaimed_bytes += sum(blob.size for blob in removed if bundle_location(blob.path) is None)
+        logging.info(f"{report.blobs} blobs removed, {report.reclaimed_bytes} bytes reclaimed")
+        await _throttle(started, len(removed), rate)
+
+
+async def collect_garbage(
+    engine: AsyncEngine,
+    storage: Storage,
+    retention: Mapping[BirdSnapStatus, datetime.timedelta],
+    keep_test_images: int = 1,
+    grace: float = 3600.0,
+    batch_size: int = 500,
+    rate: float = 1000.0,
+) -> GCReport:
+    """
+    deletes snaps past their retention, superseded test images and the files nothing refers to anymore
+
+    every batch is its own short transaction, rerunning after an interruption picks up where it stopped
+    """
+    sessionmaker = async_sessionmaker(bind=engine, autoflush=False)
+    report = GCReport()
+
+    for status, status_retention in retention.items():
+        await _collect_birdsnaps(sessionmaker, storage, status, status_retention, batch_size, rate, report)
+    await _collect_test_images(sessionmaker, storage, keep_test_images, batch_size, rate, report)
+    await _sweep_blobs(sessionmaker, storage, grace, batch_size, rate, report)
+
+    temp_files, temp_bytes = await asyncio.to_thread(storage.clean_temp, grace)
+    report.temp_files += temp_files
+    report.reclaimed_bytes += temp_bytes
+
+    logging.info(
+        f"garbage collection done: {report.birdsnaps} birdsnaps, {report.test_images} test images, "
+        f"{report.blobs} blobs, {report.legacy_files} legacy files, {report.temp_files} temporary files, "
+        f"{report.reclaimed_bytes} bytes reclaimed"
+    )
+    return report
@@ -0,0 +1,35 @@
+import datetime
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+
+# below the storage root
+BLOB_DIR = "sha256"
+DERIVED_DIR = "derived"
+
+
+@dataclass(frozen=True)
+class StorageLayout:
+    """
+    where a blob lives below the storage root
+
+    sha256/[YYYY/MM/DD/][aa/bb/...]<digest>.<type>, the date is the day the blob was first stored (utc)
+    derived/<aa>/<digest>.<size>.<format> for downscaled copies
+    """
+
+    date_dirs: bool = False
+    # levels of two character digest prefix directories
+    hash_depth: int = 2
+
+    def blob_path(self, digest: str, filetype: str, created: datetime.datetime) -> str:
+        parts = [BLOB_DIR]
+        if self.date_dirs:
+            created = created.astimezone(datetime.timezone.utc)
+            parts.append(created.strftime("%Y/%m/%d"))
+        parts.extend(digest[2 * level : 2 * level + 2] for level in range(self.hash_depth))
+        parts.append(f"{digest}.{filetype}")
+        return "/".join(parts)
+
+    def derivative_path(self, storage_path: str, size: str, format: str) -> str:
+        # keyed by the original's name, for blobs its digest, so moving the original keeps them valid
+        name = PurePosixPath(storage_path).stem
+        return f"{DERIVED_DIR}/{name[:2]}/{name}.{size}.{format}"
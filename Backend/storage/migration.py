@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from pathlib import PurePosixPath
+from typing import Deque, List, Tuple
+
+from sqlalchemy import select, union, update
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from database.blob import reference_blob
+from database.model import BirdSnapImage, StorageBlob, TestImage
+from storage.bundle import BUNDLE_DIR, bundle_location
+from storage.layout import BLOB_DIR
+from storage.storage import Storage
+
+
+class PendingRemovals:
+    """
+    old names of moved blobs, removed grace seconds after the rows point at the new ones
+
+    removing them later instead of sleeping keeps a long grace from holding up every batch,
+    names still pending when the process dies are left behind
+    """
+
+    def __init__(self, storage: Storage, grace: float) -> None:
+        self.storage = storage
+        self.grace = grace
+        self._pending: Deque[Tuple[float, List[str]]] = deque()
+
+    def add(self, paths: List[str]) -> None:
+        if paths:
+            self._pending.append((time.monotonic() + self.grace, paths))
+
+    async def remove_due(self) -> None:
+        while self._pending and self._pending[0][0] <= time.monotonic():
+            _, paths = self._pending.popleft()
+            for path in paths:
+                await asyncio.to_thread(self.storage.remove, path)
+
+    async def drain(self) -> None:
+        if self._pending:
+            await asyncio.sleep(max(self._pending[-1][0] - time.monotonic(), 0.0))
+        await self.remove_due()
+
+
+async def migrate_to_blobs(
+    engine: AsyncEngine,
+    storage: Storage,
+    batch_size: int = 500,
+    grace: float = 5.0,
+) -> None:
+    """
+    moves files saved under <device_id>/<time>.<type> to content addressed blobs
+
+    resumable, rows already pointing at a blob are skipped, old files are removed grace
+    seconds after the rows point at the blob so requests that just read a path can still open it
+    """
+    sessionmaker = async_sessionmaker(bind=engine, autoflush=False)
+    removals = PendingRemovals(storage, grace)
+    blob_prefix = BLOB_DIR + "/"
+    bundle_prefix = BUNDLE_DIR + "/"
+    last_path = ""
+    migrated = 0
+
+    while True:
+        async with sessionmaker() as session:
+            paths = union(
+                select(BirdSnapImage.path).where(
+                    ~BirdSnapImage.path.startswith(blob_prefix)
+                ).where(~BirdSnapImage.path.startswith(bundle_prefix)),
+                select(TestImage.path).where(
+                    ~TestImage.path.startswith(blob_prefix)
+                ).where(~TestImage.path.startswith(bundle_prefix)),
+            ).subquery()
+            batch = (await session.execute(
+                select(paths.c.path).where(
+                    paths.c.path > last_path
+                ).order_by(paths.c.path).limit(batch_size)
+            )).scalars().all()
+
+        if not batch:
+            break
+
+        for path in batch:
+            last_path = path
+            try:
+                blob = await asyncio.to_thread(storage.adopt_file, path)
+            except FileNotFoundError:
+                logging.warning(f"file {path} is missing, rows keep pointing at it")
+                continue
+
+            async with sessionmaker() as session:
+                # counted first to learn the path of an already stored blob
+                blob_path = await reference_blob(session, blob, count=0)
+                images = (await session.execute(
+                    update(BirdSnapImage).where(
+                        BirdSnapImage.path == path
+                    ).values(path=blob_path).returning(BirdSnapImage.id)
+                )).scalars().all()
+                testimages = (await session.execute(
+                    update(TestImage).where(
+                        TestImage.path == path
+                    ).values(path=blob_path).returning(TestImage.id)
+                )).scalars().all()
+                await reference_blob(session, blob, count=len(images) + len(testimages))
+                await session.commit()
+
+            # only now nothing points at the old name anymore,
+            # a copy of content already stored under another blob path is not used at all
+            removals.add([path] if blob_path == blob.path else [path, blob.path])
+            migrated += 1
+
+        await removals.remove_due()
+        logging.info(f"{migrated} files moved to blobs, last path {last_path}")
+
+    await removals.drain()
+
+
+async def relayout_blobs(
+    engine: AsyncEngine,
+    storage: Storage,
+    batch_size: int = 500,
+    workers: int = 4,
+    grace: float = 5.0,
+) -> None:
+    """
+    moves blobs to the paths of the configured layout
+
+    resumable, blobs already in place are skipped, old names are removed grace seconds
+    after the rows point at the new ones so requests that just read a path and presigned
+    urls already handed out can still open it, signed api urls look the new path up
+    """
+    sessionmaker = async_sessionmaker(bind=engine, autoflush=False)
+    semaphore = asyncio.Semaphore(workers)
+    removals = PendingRemovals(storage, grace)
+    last_digest = ""
+    moved = 0
+
+    async def move(digest: str, path: str, new_path: str) -> bool:
+        async with semaphore:
+            try:
+                await asyncio.to_thread(storage.copy, path, new_path)
+            except FileNotFoundError:
+                logging.warning(f"blob {path} is missing, left in place")
+                return False
+
+            async with sessionmaker() as session:
+                # locks the blob row, uploads of the same content wait for the new path
+                updated = (await session.execute(
+                    update(StorageBlob).where(
+                        StorageBlob.digest == digest
+                    ).where(
+                        StorageBlob.path == path
+                    ).values(path=new_path).returning(StorageBlob.digest)
+                )).scalar_one_or_none()
+                if updated is None:
+                    # moved or collected meanwhile, the copy is removed unless the row uses it,
+                    # without a row an upload of the same content may be putting it right now
+                    current = (await session.execute(
+                        select(StorageBlob.path).where(StorageBlob.digest == digest).with_for_update()
+                    )).scalar_one_or_none()
+                    if current is not None and current != new_path:
+                        await asyncio.to_thread(storage.remove, new_path)
+                    await session.rollback()
+                    return False
+
+                await session.execute(
+                    update(BirdSnapImage).where(BirdSnapImage.path == path).values(path=new_path)
+                )
+                await session.execute(
+                    update(TestImage).where(TestImage.path == path).values(path=new_path)
+                )
+                await session.commit()
+            return True
+
+    while True:
+        async with sessionmaker() as session:
+            blobs = (await session.execute(
+                select(StorageBlob.digest, StorageBlob.path, StorageBlob.creation_time).where(
+                    StorageBlob.digest > last_digest
+                ).order_by(StorageBlob.digest).limit(batch_size)
+            )).all()
+
+        if not blobs:
+            break
+        last_digest = blobs[-1].digest
+
+        moves = []
+        for digest, path, creation_time in blobs:
+            # packed blobs stay where they are
+            if bundle_location(path) is not None:
+                continue
+            filetype = PurePosixPath(path).suffix.lstrip(".")
+            new_path = storage.layout.blob_path(digest, filetype, creation_time)
+            if new_path != path:
+                moves.append((digest, path, new_path))
+
+        done = await asyncio.gather(*(move(*entry) for entry in moves))
+        old_paths = [path for (_, path, _), ok in zip(moves, done) if ok]
+
+        removals.add(old_paths)
+        moved += len(old_paths)
+        await removals.remove_due()
+
+        logging.info(f"{moved} blobs moved, last digest {last_digest}")
+
+    await removals.drain()
@@ -1,16 +1,49 @@
 import asyncio
 import urllib
-from typing import Tuple
+from typing import Optional, Tuple
 
 from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
                                     async_sessionmaker, create_async_engine)
 
 from config.config import Config
 from database.model import Base
-from storage.storage import Storage
+from storage.backend import S3Backend, StorageBackend
+from storage.layout import StorageLayout
+from storage.storage import Storage, StorageException
+
+
+def create_storage_backend(config: Config) -> Optional[StorageBackend]:
+    if config.storage.backend == "filesystem":
+        # the default, files below the storage path
+        return None
+
+    if config.storage.backend == "s3":
+        if config.storage.s3_bucket is None:
+            raise StorageException("S3_BUCKET is required for the s3 storage backend")
+        return S3Backend(
+            bucket=config.storage.s3_bucket,
+            prefix=config.storage.s3_prefix,
+            endpoint_url=config.storage.s3_endpoint_url,
+            region=config.storage.s3_region,
+            access_key=config.storage.s3_access_key,
+            secret_key=config.storage.s3_secret_key,
+            presign_ttl=config.storage.presign_ttl,
+        )
+
+    raise StorageException(f"unknown storage backend {config.storage.backend}")
 
 
 def create_storage(config: Config) -> Storage:
-    storage = Storage(config.storage.path)
+    storage = Storage(
+        config.storage.path,
+        max_file_size=config.storage.max_file_size,
+        layout=StorageLayout(
+            date_dirs=config.storage.date_dirs,
+            hash_depth=config.storage.hash_depth,
+        ),
+        strip_metadata=config.storage.strip_metadata,
+        image_workers=config.storage.image_workers,
+        backend=create_storage_backend(config),
+    )
     storage.setup()
     return storage
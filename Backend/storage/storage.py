@@ -1,13 +1,39 @@
+import asyncio
 import datetime
+import hashlib
+import logging
 import os
 import tempfile
+import time
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from io import BufferedReader
 from pathlib import Path
-from typing import BinaryIO, Union
+from typing import AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Protocol, Tuple, Union
 from uuid import UUID
 
 import magic
 
+from storage.backend import FileSystemBackend, StorageBackend
+from storage.bundle import (
+    BundleEntry,
+    BundleLocation,
+    bundle_location,
+    copy_member,
+    index_path,
+    pack_path,
+    write_index,
+)
+from storage.derivative import DerivativeFormat, DerivativeSize, render_derivative, strip_metadata
+from storage.layout import StorageLayout
+
+# bytes per read and write while saving an upload
+_CHUNK_SIZE = 64 * 1024
+
+# below the storage root
+_TEMP_DIR = "tmp"
+
 
 class BadFileTypeError(Exception):
     pass
@@ -17,65 +43,403 @@ class UnknownImagePathError(Exception):
     pass
 
 
+class FileTooLargeError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredBlob:
+    # relative to the storage root
+    path: str
+    digest: str
+    size: int
+    created: datetime.datetime
+
+
+class StagedBlob:
+    """
+    an upload in a temporary file, not stored under a blob path yet
+    """
+
+    def __init__(self, storage: "Storage", blob: StoredBlob, temp_path: Path) -> None:
+        self.storage = storage
+        self.blob = blob
+        self.temp_path = temp_path
+
+    async def put(self, storage_path: str) -> None:
+        """
+        moves the file to storage_path, replacing the same content stored there
+        """
+        # a packed blob keeps its bytes in the bundle
+        if bundle_location(storage_path) is None:
+            await asyncio.to_thread(self.storage.backend.put, self.temp_path, storage_path)
+
+
+class AsyncReadable(Protocol):
+    async def read(self, size: int = -1) -> bytes:
+        ...
+
+
+def _finish(file: BinaryIO) -> None:
+    # mkstemp creates the file as 0600
+    os.fchmod(file.fileno(), 0o644)
+    file.flush()
+    os.fsync(file.fileno())
+
+
+def _hash_file(path: Path) -> Tuple[str, int, bytes]:
+    # digest, size and first chunk
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as file:
+        head = file.read(_CHUNK_SIZE)
+        chunk = head
+        while chunk:
+            size += len(chunk)
+            digest.update(chunk)
+            chunk = file.read(_CHUNK_SIZE)
+    return digest.hexdigest(), size, head
+
+
+def _remove_if_exists(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
 class StorageException(Exception):
     def __init__(self, *args: object) -> None:
         super().__init__(*args)
 
 
 class Storage:
-    def __init__(self, path: str) -> None:
+    def __init__(
+        self,
+        path: str,
+        max_file_size: int,
+        layout: StorageLayout = StorageLayout(),
+        strip_metadata: bool = False,
+        image_workers: int = 2,
+        backend: Optional[StorageBackend] = None,
+    ) -> None:
+        # local working directory, also where files live without another backend
         self.path = Path(path)
+        self.max_file_size = max_file_size
+        self.layout = layout
+        self.strip_metadata = strip_metadata
+        self.backend = backend if backend is not None else FileSystemBackend(self.path)
         if self.path.is_file():
             raise StorageException("path is a file")
 
+        # decoding and encoding images is cpu bound, pillow releases the gil while doing it
+        self._image_executor = ThreadPoolExecutor(
+            max_workers=image_workers,
+            thread_name_prefix="image",
+        )
+        # derivatives being rendered, concurrent requests for one wait for the same render
+        self._rendering: Dict[str, asyncio.Future] = {}
+
     def setup(self) -> None:
         if not self.path.exists():
             os.mkdir(self.path)
 
-    def save_birdsnapimage(
-        self,
-        device_id: UUID,
-        file: Union[bytes, tempfile.SpooledTemporaryFile, BinaryIO],
-        snap_time: datetime.datetime,
-    ) -> str:
-
-        # create dir
-        file_path = self.path / str(device_id)
-        if not os.path.exists(file_path):
-            os.mkdir(file_path)
-
-        # check filetype
-        if isinstance(file, tempfile.SpooledTemporaryFile) or isinstance(
-            file, BinaryIO
-        ):
-            buff = file.read(2024)
-            file.seek(0)
-        elif isinstance(file, bytes):
-            buff = file
-
-        filetype = magic.from_buffer(buff)
+    @asynccontextmanager
+    async def stage_birdsnapimage(self, file: AsyncReadable) -> AsyncIterator[StagedBlob]:
+        """
+        writes an upload to a temporary file while hashing it, StagedBlob.put stores it
+
+        the temporary file is removed when the block ends
+        """
+        # check filetype on the first chunk
+        chunk = await file.read(_CHUNK_SIZE)
+        filetype = magic.from_buffer(chunk[:2048])
         filetype = filetype.split(" ")[0].lower()
 
         if filetype not in ["jpeg", "jpg", "png"]:
             raise BadFileTypeError()
 
-        # compelte path
-        file_path = file_path / (
-            snap_time.strftime("%Y_%m_%d_%H_%M_%S") + "." + filetype
+        fd, temp_name = await asyncio.to_thread(self._temp_file, "upload-")
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, "wb") as temp_file:
+                while chunk:
+                    size += len(chunk)
+                    # exact limit of the file, the api refuses oversized request bodies before parsing them
+                    if size > self.max_file_size:
+                        raise FileTooLargeError()
+                    digest.update(chunk)
+                    await asyncio.to_thread(temp_file.write, chunk)
+                    chunk = await file.read(_CHUNK_SIZE)
+                await asyncio.to_thread(_finish, temp_file)
+            hexdigest = digest.hexdigest()
+
+            if self.strip_metadata:
+                # the stored content changes, so does its digest
+                await self._run_image_task(self._strip_metadata, Path(temp_name))
+                hexdigest, size, _ = await asyncio.to_thread(_hash_file, Path(temp_name))
+
+            created = datetime.datetime.now(datetime.timezone.utc)
+            yield StagedBlob(
+                self,
+                StoredBlob(
+                    path=self.layout.blob_path(hexdigest, filetype, created),
+                    digest=hexdigest,
+                    size=size,
+                    created=created,
+                ),
+                Path(temp_name),
+            )
+        finally:
+            # also on cancellation, so no awaiting here, gone already once it was put
+            _remove_if_exists(temp_name)
+
+    def adopt_file(self, storage_path: str) -> StoredBlob:
+        """
+        copies a file saved under its old name to its blob path, blocking
+        """
+        with self._local_copy(storage_path) as source:
+            digest, size, head = _hash_file(source)
+
+        filetype = magic.from_buffer(head[:2048]).split(" ")[0].lower()
+        # the upload time is only known from the file
+        created = self.backend.modified(storage_path)
+        blob = StoredBlob(
+            path=self.layout.blob_path(digest, filetype, created),
+            digest=digest,
+            size=size,
+            created=created,
         )
+        self.copy(storage_path, blob.path)
+        return blob
+
+    def copy(self, storage_path: str, new_storage_path: str) -> None:
+        """
+        makes a file also available under a second name, blocking
+        """
+        self.backend.copy(storage_path, new_storage_path)
+
+    def remove(self, storage_path: str) -> None:
+        # packed blobs stay in their bundle, only the rows pointing at them go
+        if bundle_location(storage_path) is not None:
+            return
+        self.backend.delete(storage_path)
+
+    def remove_derivatives(self, storage_path: str) -> None:
+        for size in DerivativeSize:
+            if size == DerivativeSize.ORIGINAL:
+                continue
+            for format in DerivativeFormat:
+                self.backend.delete(self.layout.derivative_path(storage_path, size.value, format.value))
+
+    def clean_temp(self, older_than: float) -> Tuple[int, int]:
+        """
+        removes temporary files of uploads and renders that never finished, returns count and bytes, blocking
+        """
+        temp_dir = self.path / _TEMP_DIR
+        if not temp_dir.exists():
+            return 0, 0
+
+        cutoff = time.time() - older_than
+        count = 0
+        size = 0
+        for entry in os.scandir(temp_dir):
+            try:
+                entry_stat = entry.stat()
+                if not entry.is_file() or entry_stat.st_mtime > cutoff:
+                    continue
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            count += 1
+            size += entry_stat.st_size
+        return count, size
 
-        # write
-        if isinstance(file, tempfile.SpooledTemporaryFile) or isinstance(
-            file, BinaryIO
-        ):
-            file_path.write_bytes(file.read())
-        else:
-            file_path.write_bytes(file)
+    def write_bundle(self, name: str, blobs: List[Tuple[str, str]]) -> List[BundleEntry]:
+        """
+        packs (digest, storage path) blobs into one bundle and its index, blocking
 
-        return str(file_path.relative_to(self.path))
+        blobs that are missing or no longer match their digest are left out, the rows pointing at them stay
+        """
+        entries = []
+        pack_fd, pack_temp = self._temp_file("bundle-")
+        index_fd, index_temp = self._temp_file("bundle-index-")
+        try:
+            with os.fdopen(pack_fd, "wb") as pack, os.fdopen(index_fd, "wb") as index:
+                offset = 0
+                for digest, storage_path in blobs:
+                    hasher = hashlib.sha256()
+                    try:
+                        with self._local_copy(storage_path) as source, open(source, "rb") as file:
+                            while chunk := file.read(_CHUNK_SIZE):
+                                hasher.update(chunk)
+                                pack.write(chunk)
+                    except UnknownImagePathError:
+                        logging.warning(f"blob {storage_path} is missing, not packed")
+                        pack.seek(offset)
+                        pack.truncate()
+                        continue
+                    if hasher.hexdigest() != digest:
+                        logging.error(f"blob {storage_path} does not match its digest, not packed")
+                        pack.seek(offset)
+                        pack.truncate()
+                        continue
+                    size = pack.tell() - offset
+                    entries.append(BundleEntry(digest=digest, offset=offset, size=size, path=storage_path))
+                    offset += size
+                _finish(pack)
+                write_index(index, entries)
+                _finish(index)
+
+            if not entries:
+                _remove_if_exists(pack_temp)
+                _remove_if_exists(index_temp)
+                return entries
+
+            # the index first, a pack is never without one
+            self.backend.put(Path(index_temp), index_path(name))
+            self.backend.put(Path(pack_temp), pack_path(name))
+        except BaseException:
+            _remove_if_exists(pack_temp)
+            _remove_if_exists(index_temp)
+            raise
+        return entries
 
     def get_birdsnapimage(self, storage_path: str) -> Path:
-        path = self.path / storage_path
-        if not path.exists():
+        """
+        local path to send, UnknownImagePathError for backends without one
+        """
+        path = self.backend.local_path(storage_path)
+        if path is None or not path.exists():
             raise UnknownImagePathError()
         return path
+
+    def exists(self, storage_path: str) -> bool:
+        # packed blobs are there as long as their bundle is, blocking
+        location = bundle_location(storage_path)
+        return self.backend.exists(location.bundle if location is not None else storage_path)
+
+    def presigned_url(self, storage_path: str, cache_control: str) -> Optional[str]:
+        # None when the api has to send the file itself
+        if bundle_location(storage_path) is not None:
+            return None
+        return self.backend.presigned_url(storage_path, cache_control)
+
+    def get_bundled(self, location: BundleLocation) -> Path:
+        """
+        local path of the bundle holding a packed blob
+        """
+        return self.get_birdsnapimage(location.bundle)
+
+    @asynccontextmanager
+    async def open_birdsnapimage(self, storage_path: str) -> AsyncIterator[Path]:
+        """
+        local path of an image for as long as the context is open, downloaded if needed
+        """
+        path = self._loose_local_path(storage_path)
+        if path is not None:
+            if not await asyncio.to_thread(path.exists):
+                raise UnknownImagePathError()
+            yield path
+            return
+
+        temp_path = await asyncio.to_thread(self._download, storage_path)
+        try:
+            yield temp_path
+        finally:
+            _remove_if_exists(str(temp_path))
+
+    async def get_derivative(self, storage_path: str, size: DerivativeSize, format: DerivativeFormat) -> str:
+        """
+        storage path of a downscaled copy of an image, rendered on first use
+        """
+        derivative_path = self.layout.derivative_path(storage_path, size.value, format.value)
+        if await asyncio.to_thread(self.backend.exists, derivative_path):
+            return derivative_path
+
+        rendering = self._rendering.get(derivative_path)
+        if rendering is None:
+            rendering = asyncio.ensure_future(
+                self._run_image_task(self._render_derivative, storage_path, derivative_path, size, format)
+            )
+            self._rendering[derivative_path] = rendering
+            rendering.add_done_callback(lambda _: self._rendering.pop(derivative_path, None))
+
+        # a cancelled request must not cancel the render others wait for
+        await asyncio.shield(rendering)
+        return derivative_path
+
+    def close(self) -> None:
+        self._image_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run_image_task(self, func, *args) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._image_executor, func, *args)
+
+    def _temp_file(self, prefix: str) -> Tuple[int, str]:
+        temp_dir = self.path / _TEMP_DIR
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        return tempfile.mkstemp(dir=temp_dir, prefix=prefix, suffix=".part")
+
+    def _loose_local_path(self, storage_path: str) -> Optional[Path]:
+        if bundle_location(storage_path) is not None:
+            return None
+        return self.backend.local_path(storage_path)
+
+    def _download(self, storage_path: str) -> Path:
+        # packed blobs are copied out of their bundle
+        location = bundle_location(storage_path)
+        fd, temp_name = self._temp_file("download-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                if location is not None:
+                    copy_member(self.get_bundled(location), location, file)
+                else:
+                    self.backend.fetch(storage_path, file)
+        except FileNotFoundError as e:
+            _remove_if_exists(temp_name)
+            raise UnknownImagePathError() from e
+        except BaseException:
+            _remove_if_exists(temp_name)
+            raise
+        return Path(temp_name)
+
+    @contextmanager
+    def _local_copy(self, storage_path: str) -> Iterator[Path]:
+        # blocking counterpart of open_birdsnapimage
+        path = self._loose_local_path(storage_path)
+        if path is not None:
+            if not path.exists():
+                raise UnknownImagePathError()
+            yield path
+            return
+
+        temp_path = self._download(storage_path)
+        try:
+            yield temp_path
+        finally:
+            _remove_if_exists(str(temp_path))
+
+    def _strip_metadata(self, temp_path: Path) -> None:
+        fd, stripped = tempfile.mkstemp(dir=temp_path.parent, prefix="strip-", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                strip_metadata(temp_path, file)
+                _finish(file)
+            os.replace(stripped, temp_path)
+        except BaseException:
+            _remove_if_exists(stripped)
+            raise
+
+    def _render_derivative(
+        self, storage_path: str, derivative_path: str, size: DerivativeSize, format: DerivativeFormat
+    ) -> None:
+        fd, temp_name = self._temp_file("derivative-")
+        try:
+            with os.fdopen(fd, "wb") as file, self._local_copy(storage_path) as source:
+                render_derivative(source, file, size, format)
+                _finish(file)
+            self.backend.put(Path(temp_name), derivative_path)
+        except BaseException:
+            _remove_if_exists(temp_name)
+            raise
@@ -0,0 +1,48 @@
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.blob import abandon_blob, reference_blob
+from storage.storage import AsyncReadable, Storage, StoredBlob
+
+
+@asynccontextmanager
+async def store_upload(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    storage: Storage,
+    file: AsyncReadable,
+) -> AsyncIterator[Tuple[AsyncSession, str]]:
+    """
+    saves an uploaded image and counts a reference to its blob, yields the session and the path for the image rows
+
+    the session is committed when the block ends, if the block fails the blob is
+    recorded without references and the collector removes it after its grace
+    """
+    async with storage.stage_birdsnapimage(file) as staged:
+        async with sessionmaker() as session:
+            stored = False
+            try:
+                # the blob row stays locked until the commit, the collector can not
+                # remove the file between the put and the reference
+                blob_path = await reference_blob(session, staged.blob)
+                # same content stored earlier keeps its path
+                await staged.put(blob_path)
+                stored = True
+                yield session, blob_path
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                if stored:
+                    await _abandon(sessionmaker, staged.blob)
+                raise
+
+
+async def _abandon(sessionmaker: async_sessionmaker[AsyncSession], blob: StoredBlob) -> None:
+    try:
+        async with sessionmaker() as session:
+            await abandon_blob(session, blob)
+            await session.commit()
+    except Exception as e:
+        logging.error(f"unable to record unused blob {blob.path}", exc_info=e)
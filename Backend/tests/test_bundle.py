@@ -0,0 +1,99 @@
+"""
+packed blobs are read back through their bundle, the rows follow them there
+"""
+import datetime
+import hashlib
+import io
+import json
+import os
+
+import pytest
+from sqlalchemy import text
+
+from storage.archive import pack_blobs
+from storage.bundle import BundleEntry, BundleLocation, bundle_location, copy_member, member_path, pack_path
+from storage.derivative import DerivativeFormat, DerivativeSize
+from storage.storage import Storage
+from tests.conftest import BOB, Upload, png, seed_feed
+
+pytestmark = pytest.mark.anyio
+
+
+def test_copy_member(tmp_path):
+    pack = tmp_path / "test.pack"
+    pack.write_bytes(b"firstsecond")
+
+    for location, content in (
+        (BundleLocation(bundle="test.pack", offset=0, size=5), b"first"),
+        (BundleLocation(bundle="test.pack", offset=5, size=6), b"second"),
+        (BundleLocation(bundle="test.pack", offset=11, size=0), b""),
+    ):
+        target = io.BytesIO()
+        copy_member(pack, location, target)
+        assert target.getvalue() == content
+
+    # a truncated bundle
+    with pytest.raises(FileNotFoundError):
+        copy_member(pack, BundleLocation(bundle="test.pack", offset=5, size=7), io.BytesIO())
+
+
+def test_member_path_locates_the_blob():
+    name = "bundle/11111111-1111-1111-1111-111111111111/20200101T000000-abcd1234"
+    entry = BundleEntry(digest="ab" * 32, offset=1024, size=300, path=f"sha256/ab/ab/{'ab' * 32}.png")
+
+    path = member_path(name, entry)
+
+    assert path.endswith(f"/{'ab' * 32}.png")
+    assert bundle_location(path) == BundleLocation(bundle=pack_path(name), offset=1024, size=300)
+    assert bundle_location(entry.path) is None
+
+
+async def test_write_bundle_leaves_out_bad_blobs(storage):
+    blobs = []
+    for seed in range(3):
+        async with storage.stage_birdsnapimage(Upload(png(seed))) as staged:
+            await staged.put(staged.blob.path)
+        blobs.append((staged.blob.digest, staged.blob.path))
+    # one gone, one changed on disk
+    os.remove(storage.path / blobs[1][1])
+    (storage.path / blobs[2][1]).write_bytes(b"changed")
+
+    entries = storage.write_bundle("bundle/device/test", blobs)
+
+    assert [entry.digest for entry in entries] == [blobs[0][0]]
+    index = [json.loads(line) for line in (storage.path / "bundle/device/test.idx").read_text().splitlines()]
+    assert index == [{"digest": blobs[0][0], "offset": 0, "size": len(png(0)), "path": blobs[0][1]}]
+    assert (storage.path / "bundle/device/test.pack").read_bytes() == png(0)
+
+
+async def test_pack_blobs(client, db):
+    await seed_feed(client, db, snaps=3)
+    storage = Storage(os.environ["STORAGEPATH"], max_file_size=1024 * 1024)
+    try:
+        async with db.connect() as conn:
+            loose = (await conn.execute(text("SELECT path FROM birdsnapimage ORDER BY id"))).scalars().all()
+
+        report = await pack_blobs(db, storage, older_than=datetime.timedelta(0), grace=0)
+        assert (report.bundles, report.blobs) == (1, 3)
+
+        async with db.connect() as conn:
+            packed = (await conn.execute(text("SELECT path FROM birdsnapimage ORDER BY id"))).scalars().all()
+            assert set((await conn.execute(text("SELECT path FROM storageblob"))).scalars().all()) == set(packed)
+        for seed, (old_path, path) in enumerate(zip(loose, packed)):
+            assert bundle_location(path) is not None
+            assert not (storage.path / old_path).exists()
+            assert hashlib.sha256(png(seed)).hexdigest() in path
+
+            response = await client.get(f"/snap/image?id={seed + 1}", headers=BOB)
+            assert response.status_code == 200, response.text
+            assert response.content == png(seed)
+
+        # derivatives render from the bundle
+        derivative_path = await storage.get_derivative(packed[0], DerivativeSize.THUMB, DerivativeFormat.JPEG)
+        assert (storage.path / derivative_path).exists()
+
+        # resumable, nothing is packed twice
+        report = await pack_blobs(db, storage, older_than=datetime.timedelta(0), grace=0)
+        assert report.blobs == 0
+    finally:
+        storage.close()
@@ -0,0 +1,107 @@
+"""
+downscaled copies are rendered once, fit their size and follow the accept header
+"""
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from storage.derivative import DerivativeFormat, DerivativeSize, negotiate_format
+from tests.conftest import BOB, Upload, seed_feed
+
+pytestmark = pytest.mark.anyio
+
+
+def large_png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (2000, 1000), (0, 128, 255)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def stored_image(storage, content: bytes) -> str:
+    async with storage.stage_birdsnapimage(Upload(content)) as staged:
+        await staged.put(staged.blob.path)
+    return staged.blob.path
+
+
+@pytest.mark.parametrize("accept, format", [
+    (None, DerivativeFormat.JPEG),
+    ("image/jpeg,*/*", DerivativeFormat.JPEG),
+    ("image/avif,image/webp,*/*;q=0.8", DerivativeFormat.WEBP),
+    ("IMAGE/WEBP ; q=0.5", DerivativeFormat.WEBP),
+    ("image/webp;q=0,image/jpeg", DerivativeFormat.JPEG),
+])
+def test_negotiate_format(accept, format):
+    assert negotiate_format(accept) == format
+
+
+@pytest.mark.parametrize("size, edge", [(DerivativeSize.THUMB, 320), (DerivativeSize.MEDIUM, 1280)])
+@pytest.mark.parametrize("format", [DerivativeFormat.WEBP, DerivativeFormat.JPEG])
+async def test_derivative_fits_its_size(storage, size, edge, format):
+    path = await stored_image(storage, large_png())
+
+    derivative_path = await storage.get_derivative(path, size, format)
+
+    with Image.open(storage.path / derivative_path) as image:
+        assert image.format == format.name
+        # aspect ratio kept
+        assert image.size == (edge, edge // 2)
+
+
+async def test_small_images_are_not_upscaled(storage):
+    buffer = io.BytesIO()
+    Image.new("RGB", (100, 50)).save(buffer, format="PNG")
+    path = await stored_image(storage, buffer.getvalue())
+
+    derivative_path = await storage.get_derivative(path, DerivativeSize.MEDIUM, DerivativeFormat.JPEG)
+
+    with Image.open(storage.path / derivative_path) as image:
+        assert image.size == (100, 50)
+
+
+async def test_concurrent_requests_render_once(storage, monkeypatch):
+    path = await stored_image(storage, large_png())
+    renders = []
+    render = storage._render_derivative
+
+    def counting_render(*args) -> None:
+        renders.append(args)
+        render(*args)
+
+    monkeypatch.setattr(storage, "_render_derivative", counting_render)
+    paths = await asyncio.gather(*(
+        storage.get_derivative(path, DerivativeSize.THUMB, DerivativeFormat.WEBP) for _ in range(5)
+    ))
+    # rendered files are reused
+    await storage.get_derivative(path, DerivativeSize.THUMB, DerivativeFormat.WEBP)
+
+    assert len(set(paths)) == 1
+    assert len(renders) == 1
+
+
+async def test_image_endpoint_negotiates_the_format(client, db):
+    await seed_feed(client, db, snaps=1)
+
+    response = await client.get("/snap/image?id=1&size=thumb", headers={**BOB, "Accept": "image/webp,*/*"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["vary"] == "Accept"
+    webp_etag = response.headers["etag"]
+
+    response = await client.get("/snap/image?id=1&size=thumb", headers={**BOB, "Accept": "image/jpeg"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "image/jpeg"
+    # caches keep both formats apart
+    assert response.headers["etag"] != webp_etag
+
+    response = await client.get("/snap/image?id=1", headers={**BOB, "Accept": "image/webp"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "image/png"
+    assert "vary" not in response.headers
+
+
+async def test_image_endpoint_rejects_unknown_sizes(client, db):
+    await seed_feed(client, db, snaps=1)
+    response = await client.get("/snap/image?id=1&size=huge", headers=BOB)
+    assert response.status_code == 422
@@ -0,0 +1,110 @@
+"""
+the collector removes only what nothing refers to, and only once its grace is over
+"""
+import asyncio
+import datetime
+import os
+import time
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.model import BirdSnap, BirdSnapStatus
+from database.setup import create_schema
+from storage.gc import collect_garbage
+from storage.upload import store_upload
+from tests.conftest import DEVICE_ID, Upload, png
+
+pytestmark = pytest.mark.anyio
+
+
+async def upload_content(db, storage, seed: int) -> str:
+    async with store_upload(async_sessionmaker(bind=db), storage, Upload(png(seed))) as (_, blob_path):
+        return blob_path
+
+
+async def unreferenced_blob(db, storage, seed: int, age: float) -> str:
+    blob_path = await upload_content(db, storage, seed)
+    async with db.begin() as conn:
+        await conn.execute(text("UPDATE storageblob SET ref_count = 0 WHERE path = :path"), {"path": blob_path})
+    written = time.time() - age
+    os.utime(storage.path / blob_path, (written, written))
+    return blob_path
+
+
+async def blob_paths(db):
+    async with db.connect() as conn:
+        return set((await conn.execute(text("SELECT path FROM storageblob"))).scalars().all())
+
+
+async def test_sweep_keeps_blobs_within_grace(db, storage):
+    await create_schema(db)
+    fresh = await unreferenced_blob(db, storage, seed=1, age=0)
+    old = await unreferenced_blob(db, storage, seed=2, age=120)
+
+    report = await collect_garbage(db, storage, retention={}, grace=60, rate=0)
+
+    assert report.blobs == 1
+    assert await blob_paths(db) == {fresh}
+    assert (storage.path / fresh).exists()
+    assert not (storage.path / old).exists()
+
+
+async def test_upload_waits_for_a_sweep_of_the_same_content(db, storage):
+    await create_schema(db)
+    blob_path = await unreferenced_blob(db, storage, seed=1, age=120)
+
+    # the collector between locking the blob and committing its removal
+    async with db.connect() as conn:
+        transaction = await conn.begin()
+        await conn.execute(text("SELECT * FROM storageblob WHERE path = :path FOR UPDATE"), {"path": blob_path})
+        os.remove(storage.path / blob_path)
+
+        upload = asyncio.create_task(upload_content(db, storage, seed=1))
+        await asyncio.sleep(0.3)
+        # not put before the reference is counted, the removal can not take it along
+        assert not upload.done()
+        assert not (storage.path / blob_path).exists()
+
+        await conn.execute(text("DELETE FROM storageblob WHERE path = :path"), {"path": blob_path})
+        await transaction.commit()
+
+    assert await upload == blob_path
+    assert (storage.path / blob_path).read_bytes() == png(1)
+    async with db.connect() as conn:
+        assert (await conn.execute(text("SELECT ref_count FROM storageblob"))).scalar_one() == 1
+
+
+async def test_retention_counts_from_the_status_change(db, storage):
+    await create_schema(db)
+    async with db.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO \"user\" (name, email, password_hash) VALUES ('alice', 'a@example.com', 'x')"
+        ))
+        await conn.execute(text(
+            "INSERT INTO device (id, type, name, owner_id, is_info_public, public_by_default) "
+            "VALUES (:device, 'TEST_DEVICE', 'feeder', 1, true, true)"
+        ), {"device": DEVICE_ID})
+
+    # taken long ago, deleted only now
+    async with async_sessionmaker(bind=db)() as session:
+        birdsnap = BirdSnap(
+            status=BirdSnapStatus.AVAILABLE,
+            is_public=True,
+            device_id=DEVICE_ID,
+            snap_time=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc),
+        )
+        session.add(birdsnap)
+        await session.commit()
+        birdsnap.status = BirdSnapStatus.DELETED
+        await session.commit()
+
+    retention = {BirdSnapStatus.DELETED: datetime.timedelta(days=1)}
+    report = await collect_garbage(db, storage, retention=retention, rate=0)
+    assert report.birdsnaps == 0
+
+    async with db.begin() as conn:
+        await conn.execute(text("UPDATE birdsnap SET status_time = now() - interval '2 days'"))
+    report = await collect_garbage(db, storage, retention=retention, rate=0)
+    assert report.birdsnaps == 1
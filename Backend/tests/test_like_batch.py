@@ -0,0 +1,63 @@
+"""
+batch likes report one result per snap and keep the like counters exact
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from tests.conftest import ALICE, BOB, seed_feed
+
+pytestmark = pytest.mark.anyio
+
+
+async def like_counts(db):
+    async with db.connect() as conn:
+        return dict((await conn.execute(text("SELECT id, like_count FROM birdsnap"))).all())
+
+
+async def test_batch_results(client, db):
+    await seed_feed(client, db, snaps=3)
+    await client.post("/like/like?birdsnap_id=2", headers=BOB)
+
+    response = await client.post("/like/batch", headers=BOB, json={"like": [3, 2, 3, 99], "unlike": [1]})
+    assert response.status_code == 200, response.text
+    # sorted by id, duplicates reported once
+    assert response.json()["results"] == [
+        {"birdsnapId": 2, "status": "already_liked"},
+        {"birdsnapId": 3, "status": "liked"},
+        {"birdsnapId": 99, "status": "unavailable"},
+        {"birdsnapId": 1, "status": "not_liked"},
+    ]
+    assert await like_counts(db) == {1: 0, 2: 1, 3: 1}
+
+    response = await client.post("/like/batch", headers=BOB, json={"unlike": [3, 2]})
+    assert response.status_code == 200, response.text
+    assert [result["status"] for result in response.json()["results"]] == ["unliked", "unliked"]
+    assert await like_counts(db) == {1: 0, 2: 0, 3: 0}
+
+
+async def test_batch_rejects_like_and_unlike_of_one_snap(client, db):
+    await seed_feed(client, db, snaps=1)
+    response = await client.post("/like/batch", headers=BOB, json={"like": [1], "unlike": [1]})
+    assert response.status_code == 400
+
+
+async def test_concurrent_batches_in_opposite_order(client, db):
+    await seed_feed(client, db, snaps=10)
+    ids = list(range(1, 11))
+
+    for _ in range(5):
+        responses = await asyncio.gather(
+            client.post("/like/batch", headers=ALICE, json={"like": ids}),
+            client.post("/like/batch", headers=BOB, json={"like": ids[::-1]}),
+        )
+        assert [response.status_code for response in responses] == [200, 200]
+        assert set((await like_counts(db)).values()) == {2}
+
+        responses = await asyncio.gather(
+            client.post("/like/batch", headers=ALICE, json={"unlike": ids[::-1]}),
+            client.post("/like/batch", headers=BOB, json={"unlike": ids}),
+        )
+        assert [response.status_code for response in responses] == [200, 200]
+        assert set((await like_counts(db)).values()) == {0}
@@ -0,0 +1,167 @@
+"""
+the feed and image queries have to stay on their indexes once tables are large
+
+the indexes are dropped after seeding and rebuilt by the versioned migrations, like on a live database
+"""
+import uuid
+from typing import Any, Dict, Set
+
+import pytest
+from sqlalchemy import Select, desc, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database.migration import MIGRATIONS, migrate
+from database.model import BirdSnap, BirdSnapImage
+from database.model import TestImage as DeviceTestImage
+from database.query import SpeciesMatch, feed_filters, feed_item_query
+from database.setup import create_schema
+
+pytestmark = pytest.mark.anyio
+
+USERS = 100
+DEVICES = 200
+SNAPS = 60_000
+TEST_IMAGES = 20_000
+
+_FEED_INDEXES = (
+    "ix_birdsnap_device_id",
+    "ix_birdsnap_status_is_public_snap_time",
+    "ix_birdsnap_bird_species",
+    "ix_birdsnapimage_birdsnap_id",
+    "ix_testimage_device_id_creation_time",
+)
+
+
+def device_id(number: int) -> uuid.UUID:
+    return uuid.UUID(int=number)
+
+
+@pytest.fixture
+async def large_db(db: AsyncEngine) -> AsyncEngine:
+    await create_schema(db)
+
+    async with db.begin() as conn:
+        await conn.execute(text(
+            'INSERT INTO "user" (name, email, password_hash) '
+            "SELECT 'user' || g, 'user' || g || '@example.com', 'x' FROM generate_series(1, :users) g"
+        ), {"users": USERS})
+        await conn.execute(text(
+            "INSERT INTO device (id, type, name, owner_id, is_info_public, public_by_default, latitude, longitude) "
+            "SELECT lpad(to_hex(g), 32, '0')::uuid, 'TEST_DEVICE', 'device' || g, g % :users + 1, true, true, 49.0, 8.4 "
+            "FROM generate_series(1, :devices) g"
+        ), {"users": USERS, "devices": DEVICES})
+        # a tenth of the snaps is not available, a seventh private, one in a hundred shows a robin
+        await conn.execute(text(
+            "INSERT INTO birdsnap (status, is_public, device_id, snap_time, bird_species, like_count) "
+            "SELECT CASE g % 10 WHEN 0 THEN 'PROCESSING'::birdsnapstatus WHEN 1 THEN 'NO_BIRD_DETECTED'::birdsnapstatus "
+            "ELSE 'AVAILABLE'::birdsnapstatus END, "
+            "g % 7 <> 0, lpad(to_hex(g % :devices + 1), 32, '0')::uuid, "
+            "now() - g * interval '1 minute', "
+            "CASE WHEN g % 100 = 0 THEN ARRAY['robin'] ELSE ARRAY['sparrow'] END, 0 "
+            "FROM generate_series(1, :snaps) g"
+        ), {"devices": DEVICES, "snaps": SNAPS})
+        await conn.execute(text(
+            "INSERT INTO birdsnapimage (birdsnap_id, path) SELECT id, 'sha256/' || md5(id::text) || '.jpeg' FROM birdsnap"
+        ))
+        await conn.execute(text(
+            "INSERT INTO testimage (creation_time, device_id, path) "
+            "SELECT now() - g * interval '1 minute', lpad(to_hex(g % :devices + 1), 32, '0')::uuid, 'test' || g "
+            "FROM generate_series(1, :test_images) g"
+        ), {"devices": DEVICES, "test_images": TEST_IMAGES})
+
+        # as if the database predates the indexes
+        for name in _FEED_INDEXES:
+            await conn.execute(text(f"DROP INDEX {name}"))
+        await conn.execute(text(
+            "DELETE FROM schema_migration WHERE version = ANY(:versions)"
+        ), {"versions": [migration.version for migration in MIGRATIONS if migration.index in _FEED_INDEXES]})
+
+    await migrate(db)
+
+    async with db.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE"))
+    return db
+
+
+async def explain(db: AsyncEngine, query: Select) -> Dict[str, Any]:
+    async with db.connect() as conn:
+        statement = query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+        return (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {statement}"))).scalar_one()[0]["Plan"]
+
+
+def index_names(node: Dict[str, Any]) -> Set[str]:
+    names = {node["Index Name"]} if "Index Name" in node else set()
+    for child in node.get("Plans", []):
+        names |= index_names(child)
+    return names
+
+
+def seq_scans(node: Dict[str, Any]) -> Set[str]:
+    relations = {node["Relation Name"]} if node["Node Type"] == "Seq Scan" else set()
+    for child in node.get("Plans", []):
+        relations |= seq_scans(child)
+    return relations
+
+
+def feed_page(**filters: Any) -> Select:
+    return feed_item_query(None).where(
+        *feed_filters(viewer_id=1, viewer_name="user1", **filters)
+    ).order_by(BirdSnap.snap_time, BirdSnap.id).limit(21)
+
+
+async def test_migrations_build_valid_indexes(large_db):
+    async with large_db.connect() as conn:
+        valid = dict((await conn.execute(text(
+            "SELECT pg_class.relname, pg_index.indisvalid FROM pg_index "
+            "JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+            "WHERE pg_class.relname = ANY(:names)"
+        ), {"names": list(_FEED_INDEXES)})).all())
+    assert valid == {name: True for name in _FEED_INDEXES}
+
+
+async def test_feed_page(large_db):
+    plan = await explain(large_db, feed_page())
+    assert "ix_birdsnap_status_is_public_snap_time" in index_names(plan)
+    # images are aggregated per snap of the page
+    assert "ix_birdsnapimage_birdsnap_id" in index_names(plan)
+    assert "birdsnap" not in seq_scans(plan)
+
+
+async def test_feed_next_page(large_db):
+    query = feed_page().where(
+        tuple_(BirdSnap.snap_time, BirdSnap.id) > tuple_(text("now() - interval '10 days'"), 0)
+    )
+    plan = await explain(large_db, query)
+    assert "ix_birdsnap_status_is_public_snap_time" in index_names(plan)
+    assert "birdsnap" not in seq_scans(plan)
+
+
+async def test_species_filter(large_db):
+    filters = feed_filters(viewer_id=1, viewer_name="user1", species=["robin"], species_match=SpeciesMatch.ANY)
+    query = select(BirdSnap.id).where(*filters)
+    plan = await explain(large_db, query)
+    assert "ix_birdsnap_bird_species" in index_names(plan)
+    assert "birdsnap" not in seq_scans(plan)
+
+
+async def test_snaps_of_device(large_db):
+    plan = await explain(large_db, select(BirdSnap.id).where(BirdSnap.device_id == device_id(1)))
+    assert "ix_birdsnap_device_id" in index_names(plan)
+
+
+async def test_images_of_snaps(large_db):
+    # what selectinload(BirdSnap.images) sends for /snap/get
+    plan = await explain(large_db, select(BirdSnapImage).where(BirdSnapImage.birdsnap_id.in_([1, 2, 3])))
+    assert "ix_birdsnapimage_birdsnap_id" in index_names(plan)
+    assert "birdsnapimage" not in seq_scans(plan)
+
+
+async def test_latest_test_image(large_db):
+    # /device/get-test-image
+    query = select(DeviceTestImage).where(
+        DeviceTestImage.device_id == device_id(1)
+    ).order_by(desc(DeviceTestImage.creation_time)).limit(1)
+    plan = await explain(large_db, query)
+    assert "ix_testimage_device_id_creation_time" in index_names(plan)
+    assert "testimage" not in seq_scans(plan)
@@ -0,0 +1,82 @@
+"""
+the s3 backend against moto's in-process s3, skipped without boto3 and moto
+"""
+import io
+import urllib.parse
+from typing import Iterator
+
+import pytest
+import requests
+
+moto = pytest.importorskip("moto")
+pytest.importorskip("boto3")
+
+from storage.backend import S3Backend
+
+
+@pytest.fixture
+def backend() -> Iterator[S3Backend]:
+    with moto.mock_aws():
+        backend = S3Backend(
+            bucket="birdsnap",
+            prefix="images/",
+            region="us-east-1",
+            access_key="test",
+            secret_key="test",
+            presign_ttl=60,
+        )
+        backend.client.create_bucket(Bucket="birdsnap")
+        yield backend
+
+
+def test_put_exists_remove(backend, tmp_path):
+    source = tmp_path / "upload"
+    source.write_bytes(b"image")
+
+    backend.put(source, "sha256/ab/cd/abcd.png")
+    # handed over to the bucket
+    assert not source.exists()
+    assert backend.exists("sha256/ab/cd/abcd.png")
+    head = backend.client.head_object(Bucket="birdsnap", Key="images/sha256/ab/cd/abcd.png")
+    assert head["ContentType"] == "image/png"
+
+    target = io.BytesIO()
+    backend.fetch("sha256/ab/cd/abcd.png", target)
+    assert target.getvalue() == b"image"
+
+    backend.copy("sha256/ab/cd/abcd.png", "sha256/abcd.png")
+    assert backend.exists("sha256/abcd.png")
+
+    backend.delete("sha256/ab/cd/abcd.png")
+    assert not backend.exists("sha256/ab/cd/abcd.png")
+    # deleting twice is fine
+    backend.delete("sha256/ab/cd/abcd.png")
+
+
+def test_missing_keys(backend):
+    with pytest.raises(FileNotFoundError):
+        backend.fetch("sha256/missing.png", io.BytesIO())
+    with pytest.raises(FileNotFoundError):
+        backend.copy("sha256/missing.png", "sha256/other.png")
+    with pytest.raises(FileNotFoundError):
+        backend.modified("sha256/missing.png")
+
+
+def test_presigned_url(backend, tmp_path):
+    source = tmp_path / "upload"
+    source.write_bytes(b"image")
+    backend.put(source, "sha256/abcd.png")
+
+    url = backend.presigned_url("sha256/abcd.png", "public, max-age=60")
+    parsed = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qs(parsed.query)
+    assert parsed.path.endswith("/images/sha256/abcd.png")
+    assert query["response-cache-control"] == ["public, max-age=60"]
+    # served by the mocked bucket
+    response = requests.get(url)
+    assert response.status_code == 200
+    assert response.content == b"image"
+
+    # reused while valid, clients can cache the image behind it
+    assert backend.presigned_url("sha256/abcd.png", "public, max-age=60") == url
+    assert backend.presigned_url("sha256/abcd.png", "private, max-age=60") != url
@@ -0,0 +1,39 @@
+"""
+startup builds new databases and refuses to serve older ones until they are migrated
+"""
+import pytest
+from sqlalchemy import text
+
+from database.migration import PendingMigrationsError, migrate, pending_migrations
+from database.setup import create_schema
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_new_database_is_stamped(db):
+    await create_schema(db)
+    assert await pending_migrations(db) == []
+
+    # a second worker starting on the same database
+    await create_schema(db)
+
+
+async def test_pending_migrations_refuse_startup(db):
+    await create_schema(db)
+    # as if the database predates the like counter
+    async with db.begin() as conn:
+        await conn.execute(text("ALTER TABLE birdsnap DROP COLUMN like_count"))
+        await conn.execute(text("DELETE FROM schema_migration WHERE version = 2"))
+
+    with pytest.raises(PendingMigrationsError):
+        await create_schema(db)
+    async with db.connect() as conn:
+        # create_all did not paper over the missing column
+        assert not (await conn.execute(text(
+            "SELECT count(*) FROM information_schema.columns "
+            "WHERE table_name = 'birdsnap' AND column_name = 'like_count'"
+        ))).scalar_one()
+
+    await migrate(db)
+    await create_schema(db)
+    assert await pending_migrations(db) == []
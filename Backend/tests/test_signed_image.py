@@ -0,0 +1,47 @@
+"""
+signed image urls work without credentials, follow moved images and refuse tampering
+"""
+import os
+
+import pytest
+from sqlalchemy import text
+
+from tests.conftest import BOB, png, seed_feed
+
+pytestmark = pytest.mark.anyio
+
+
+async def signed_url(client) -> str:
+    response = await client.get("/snap/get?id=1", headers=BOB)
+    assert response.status_code == 200, response.text
+    return response.json()["images"][0]["url"]
+
+
+async def test_signed_url_needs_no_credentials(client, db):
+    await seed_feed(client, db, snaps=1)
+    url = await signed_url(client)
+
+    response = await client.get(url)
+    assert response.status_code == 200, response.text
+    assert response.content == png(0)
+
+    response = await client.get(url[:-2])
+    assert response.status_code == 403
+
+
+async def test_signed_url_follows_a_moved_image(client, db):
+    await seed_feed(client, db, snaps=1)
+    url = await signed_url(client)
+
+    # what relayout-storage does once the grace is over
+    async with db.begin() as conn:
+        old_path = (await conn.execute(text("SELECT path FROM birdsnapimage WHERE id = 1"))).scalar_one()
+        new_path = old_path.replace(".png", ".moved.png")
+        await conn.execute(text("UPDATE birdsnapimage SET path = :path"), {"path": new_path})
+        await conn.execute(text("UPDATE storageblob SET path = :path"), {"path": new_path})
+    root = os.environ["STORAGEPATH"]
+    os.rename(os.path.join(root, old_path), os.path.join(root, new_path))
+
+    response = await client.get(url)
+    assert response.status_code == 200, response.text
+    assert response.content == png(0)
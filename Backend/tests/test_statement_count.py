@@ -0,0 +1,80 @@
+"""
+statements per request, a relationship loading more than its profile asks for shows up here
+
+counted with warm credential and feed caches unless a test says otherwise
+"""
+import pytest
+
+from tests.conftest import ALICE, BOB, DEVICE_ID, png, seed_feed
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_get_all(client, db, statements):
+    await seed_feed(client, db, snaps=5)
+    await client.get("/snap/get-all", headers=BOB)
+
+    with statements.count():
+        response = await client.get("/snap/get-all?facets=true", headers=BOB)
+    assert response.status_code == 200
+    # page, species facets and the likes of the viewer
+    assert len(statements) == 3, str(statements)
+
+    with statements.count():
+        response = await client.get("/snap/get-all?facets=true", headers=BOB)
+    assert response.status_code == 200
+    # the page comes from the feed cache, only the likes are read
+    assert len(statements) == 1, str(statements)
+
+    with statements.count():
+        response = await client.get("/snap/get-all?username=alice", headers=ALICE)
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 5
+    # a feed of one user is not cached, is_liked is part of the page query
+    assert len(statements) == 1, str(statements)
+
+
+async def test_get(client, db, statements):
+    await seed_feed(client, db, snaps=3)
+    await client.post("/like/like?birdsnap_id=1", headers=BOB)
+    await client.get("/snap/get?id=1", headers=BOB)
+
+    with statements.count():
+        response = await client.get("/snap/get?id=1", headers=BOB)
+    assert response.status_code == 200
+    # snap with device and owner, then its images and likers
+    assert len(statements) == 3, str(statements)
+
+
+async def test_image(client, db, statements):
+    await seed_feed(client, db, snaps=3)
+    await client.get("/snap/image?id=1", headers=BOB)
+
+    with statements.count():
+        response = await client.get("/snap/image?id=1", headers=BOB)
+    assert response.status_code == 200
+    assert response.content == png(0)
+    # image joined with its snap and device
+    assert len(statements) == 1, str(statements)
+
+    token_url = (await client.get("/snap/get?id=1", headers=BOB)).json()["images"][0]["url"]
+    with statements.count():
+        response = await client.get(token_url)
+    assert response.status_code == 200
+    # signed urls of images that were not moved need no database
+    assert len(statements) == 0, str(statements)
+
+
+async def test_upload(client, db, statements):
+    await seed_feed(client, db, snaps=1)
+
+    with statements.count():
+        response = await client.post(
+            "/snap/upload",
+            headers={**ALICE, "device-id": DEVICE_ID},
+            files={"image": ("new.png", png(100), "image/png")},
+        )
+    assert response.status_code == 200, response.text
+    # device, snap, blob reference and image, then the classification in the background:
+    # image with its snap and the status update after the classifier failed
+    assert len(statements) == 6, str(statements)
@@ -0,0 +1,93 @@
+"""
+moving stored files keeps the old names readable for the grace period
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.setup import create_schema
+from storage.layout import BLOB_DIR, StorageLayout
+from storage.migration import migrate_to_blobs, relayout_blobs
+from storage.upload import store_upload
+from tests.conftest import DEVICE_ID, Upload, png
+
+pytestmark = pytest.mark.anyio
+
+LEGACY_PATH = f"{DEVICE_ID}/2020-01-01T00:00:00.png"
+
+
+async def insert_image(db, path: str) -> None:
+    async with db.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO \"user\" (name, email, password_hash) VALUES ('alice', 'a@example.com', 'x')"
+        ))
+        await conn.execute(text(
+            "INSERT INTO device (id, type, name, owner_id, is_info_public, public_by_default) "
+            "VALUES (:device, 'TEST_DEVICE', 'feeder', 1, true, true)"
+        ), {"device": DEVICE_ID})
+        await conn.execute(text(
+            "INSERT INTO birdsnap (status, is_public, device_id, snap_time) "
+            "VALUES ('AVAILABLE', true, :device, now())"
+        ), {"device": DEVICE_ID})
+        await conn.execute(text(
+            "INSERT INTO birdsnapimage (birdsnap_id, path) VALUES (1, :path)"
+        ), {"path": path})
+
+
+async def image_path(db) -> str:
+    async with db.connect() as conn:
+        return (await conn.execute(text("SELECT path FROM birdsnapimage WHERE id = 1"))).scalar_one()
+
+
+async def test_migrate_to_blobs_removes_old_files_after_grace(db, storage):
+    await create_schema(db)
+    await insert_image(db, LEGACY_PATH)
+    (storage.path / DEVICE_ID).mkdir()
+    (storage.path / LEGACY_PATH).write_bytes(png(1))
+
+    migration = asyncio.create_task(migrate_to_blobs(db, storage, grace=1.0))
+    while (path := await image_path(db)) == LEGACY_PATH:
+        await asyncio.sleep(0.05)
+
+    # the row points at the blob, readers that resolved the old name can still open it
+    assert path.startswith(BLOB_DIR + "/")
+    assert (storage.path / LEGACY_PATH).exists()
+
+    await migration
+    assert not (storage.path / LEGACY_PATH).exists()
+    assert (storage.path / path).read_bytes() == png(1)
+    async with db.connect() as conn:
+        assert (await conn.execute(text("SELECT ref_count FROM storageblob"))).scalar_one() == 1
+
+
+async def test_relayout_removes_its_copy_when_the_blob_moved_meanwhile(db, storage):
+    await create_schema(db)
+    async with store_upload(async_sessionmaker(bind=db), storage, Upload(png(1))) as (_, blob_path):
+        pass
+    other_path = f"{BLOB_DIR}/elsewhere.png"
+    (storage.path / other_path).write_bytes(png(1))
+
+    loop = asyncio.get_running_loop()
+    copied = []
+
+    async def move_elsewhere() -> None:
+        async with db.begin() as conn:
+            await conn.execute(text("UPDATE storageblob SET path = :path"), {"path": other_path})
+
+    def copy_then_race(path: str, new_path: str) -> None:
+        # another relayout moves the blob between the copy and the update
+        storage.backend.copy(path, new_path)
+        copied.append(new_path)
+        asyncio.run_coroutine_threadsafe(move_elsewhere(), loop).result()
+
+    storage.copy = copy_then_race
+    storage.layout = StorageLayout(hash_depth=1)
+    await relayout_blobs(db, storage, grace=0)
+
+    assert len(copied) == 1 and copied[0] != blob_path
+    assert not (storage.path / copied[0]).exists()
+    assert (storage.path / blob_path).exists()
+    async with db.connect() as conn:
+        assert (await conn.execute(text("SELECT path FROM storageblob"))).scalar_one() == other_path
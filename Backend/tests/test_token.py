@@ -0,0 +1,100 @@
+"""
+bearer tokens and signed image urls, checked without the api
+"""
+import base64
+import json
+import time
+
+import pytest
+
+from config.config import get_config
+from database.token import InvalidTokenError, TokenService
+from database.util import create_db_util
+
+
+def test_workers_share_the_token_secret():
+    # two workers started from the same environment
+    first, second = create_db_util(get_config()), create_db_util(get_config())
+    try:
+        token, _ = first.tokens.issue(1, "alice", 0)
+        assert second.tokens.verify(token).username == "alice"
+
+        url_token = first.image_urls.sign(7, "sha256/ab/cd.jpeg", True)
+        assert second.image_urls.verify(url_token).image_id == 7
+    finally:
+        first.close()
+        second.close()
+
+
+def test_token_secret_is_required(monkeypatch):
+    monkeypatch.delenv("TOKENSECRET")
+    with pytest.raises(KeyError):
+        get_config()
+
+
+def test_non_ascii_tokens_are_invalid():
+    util = create_db_util(get_config())
+    try:
+        token, _ = util.tokens.issue(1, "alice", 0)
+        url_token = util.image_urls.sign(7, "sha256/ab/cd.jpeg", True)
+        for verify, valid in ((util.tokens.verify, token), (util.image_urls.verify, url_token)):
+            with pytest.raises(InvalidTokenError):
+                verify(valid[:-1] + "\u00e9")
+            with pytest.raises(InvalidTokenError):
+                verify(valid.replace(".", ".\u00e9", 1))
+    finally:
+        util.close()
+
+
+def test_epoch_cache_is_bounded():
+    tokens = TokenService(secret=b"secret", ttl=60, epoch_ttl=60, max_epochs=2)
+    tokens.remember_epoch(1, 0)
+    tokens.remember_epoch(2, 0)
+    # the least recently used user is dropped
+    assert tokens.known_epoch(1) == 0
+    tokens.remember_epoch(3, 0)
+
+    assert tokens.known_epoch(1) == 0
+    assert tokens.known_epoch(2) is None
+    assert tokens.known_epoch(3) == 0
+
+
+def test_image_urls_expire(monkeypatch):
+    util = create_db_util(get_config())
+    try:
+        signed_at = int(time.time())
+        url_token = util.image_urls.sign(7, "sha256/ab/cd.jpeg", True)
+        claims = util.image_urls.verify(url_token)
+        # rounded to steps of half the ttl, valid for at least one step
+        assert signed_at + util.image_urls.ttl / 2 <= claims.expires_at <= signed_at + util.image_urls.ttl + 1
+
+        monkeypatch.setattr(time, "time", lambda: claims.expires_at)
+        with pytest.raises(InvalidTokenError):
+            util.image_urls.verify(url_token)
+    finally:
+        util.close()
+
+
+def test_tampered_image_urls_are_invalid():
+    util = create_db_util(get_config())
+    try:
+        url_token = util.image_urls.sign(7, "sha256/ab/cd.jpeg", False)
+        version, payload, signature = url_token.split(".")
+        data = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        data["v"] = 1
+        forged = base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).rstrip(b"=").decode("ascii")
+
+        for token in (
+            f"{version}.{forged}.{signature}",
+            f"{version}.{payload}.{signature[:-2]}",
+            f"i0.{payload}.{signature}",
+            f"{version}.{payload}",
+        ):
+            with pytest.raises(InvalidTokenError):
+                util.image_urls.verify(token)
+
+        # an image signature is no bearer token
+        with pytest.raises(InvalidTokenError):
+            util.tokens.verify(f"{util.tokens.version}.{payload}.{signature}")
+    finally:
+        util.close()
@@ -0,0 +1,41 @@
+"""
+uploads reference their blob in the transaction of their rows, failed ones leave it to the collector
+"""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.setup import create_schema
+from storage.upload import store_upload
+from tests.conftest import Upload, png
+
+pytestmark = pytest.mark.anyio
+
+
+async def blobs(db):
+    async with db.connect() as conn:
+        return (await conn.execute(text("SELECT path, ref_count FROM storageblob"))).all()
+
+
+async def test_stored_upload_is_referenced(db, storage):
+    await create_schema(db)
+    sessionmaker = async_sessionmaker(bind=db)
+
+    async with store_upload(sessionmaker, storage, Upload(png(1))) as (_, blob_path):
+        pass
+
+    assert await blobs(db) == [(blob_path, 1)]
+    assert (storage.path / blob_path).read_bytes() == png(1)
+
+
+async def test_failed_upload_is_left_to_the_collector(db, storage):
+    await create_schema(db)
+    sessionmaker = async_sessionmaker(bind=db)
+
+    with pytest.raises(RuntimeError):
+        async with store_upload(sessionmaker, storage, Upload(png(1))) as (_, blob_path):
+            raise RuntimeError("rows not stored")
+
+    # recorded without references, the collector removes it after its grace
+    assert await blobs(db) == [(blob_path, 0)]
+    assert (storage.path / blob_path).exists()